@@ -0,0 +1,199 @@
+"""
+query count, latency and peak memory budgets of the API endpoints over a large
+deterministic dataset (association.synthetic). not collected by the default
+test run, run it explicitly:
+
+    python manage.py test association.benchmarks
+
+BENCHMARK_SCALE scales the dataset, 1 (the default) is 20k members with three
+years of subscriptions and 200k financial records. BENCHMARK_REPORT is the path
+of the JSON report (benchmark-report.json by default), keep them to diff runs.
+"""
+import json
+import os
+import time
+import tracemalloc
+from datetime import datetime
+
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from clients.models import Client, WorkEntity
+from clients.registry import work_entities
+from financials.models import FinancialRecord, Loan, Subscription
+from financials.registry import rank_fees, transaction_types, bank_accounts
+from projects.models import Project
+from users.models import User
+from .synthetic import SyntheticDataset
+from .testing import clear_cache
+
+SCALE = float(os.environ.get("BENCHMARK_SCALE", "1"))
+REPORT = os.environ.get("BENCHMARK_REPORT", "benchmark-report.json")
+
+# name -> (path, params, max queries, max seconds at scale 1). detail paths are
+# formatted with the ids of BenchmarkTests.targets
+ENDPOINTS = {
+    # clients
+    "clients.list": ("/api/clients/clients/", {}, 2, 0.5),
+    "clients.list.search": ("/api/clients/clients/", {"search": "محمد"}, 2, 1.0),
+    "clients.list.dues_filter": ("/api/clients/clients/", {"min_unpaid_installments": "1", "sort_by": "dues",
+                                                           "order": "-"}, 2, 1.0),
+    "clients.list.cursor": ("/api/clients/clients/", {"cursor": "", "page_size": 50}, 1, 0.5),
+    "clients.select": ("/api/clients/clients/", {"serializer": "select", "no_pagination": "true"}, 1, 2.0),
+    "clients.retrieve": ("/api/clients/clients/{client}/", {}, 1, 0.3),
+    "clients.detailed": ("/api/clients/clients/{client}/detailed/", {}, 2, 0.3),
+    "clients.form_data": ("/api/clients/clients/{client}/form_data/", {}, 1, 0.3),
+    "clients.export.csv": ("/api/clients/clients/export/", {"fields": "membership_number,name,rank,seniority,"
+                                                                      "work_entity,is_active", "format": "csv"},
+                           1, 5.0),
+    "clients.export.xlsx": ("/api/clients/clients/export/", {"fields": "membership_number,name,rank,seniority,"
+                                                                       "work_entity,is_active"}, 1, 20.0),
+    "clients.export_subscriptions": ("/api/clients/clients/{client}/export_subscriptions/", {"year": "{year}"},
+                                     2, 0.5),
+    "clients.export_installments": ("/api/clients/clients/{client}/export_installments/", {}, 2, 0.5),
+    "clients.work_entities": ("/api/clients/workentities/", {}, 2, 0.3),
+    "clients.work_entities.retrieve": ("/api/clients/workentities/{work_entity}/", {}, 1, 0.3),
+    "clients.home_stats": ("/api/clients/get-home-stats/", {"fresh": 1}, 4, 3.0),
+    "clients.home_financial_stats": ("/api/clients/get-home-financial-stats/", {"fresh": 1}, 8, 8.0),
+    # financials
+    "financials.records.list": ("/api/financials/financial-records/", {"page_size": 100}, 2, 1.0),
+    "financials.records.list.filtered": ("/api/financials/financial-records/", {
+        "from": "{since}", "to": "{until}", "type": "إيراد", "payment_methods": "نقدي", "with_totals": 1,
+        "serializer": "flat",
+    }, 3, 1.5),
+    "financials.records.list.cursor": ("/api/financials/financial-records/", {"cursor": "", "page_size": 100},
+                                       1, 0.5),
+    "financials.records.retrieve": ("/api/financials/financial-records/{record}/", {}, 1, 0.3),
+    "financials.records.detailed": ("/api/financials/financial-records/{record}/detailed/", {}, 1, 0.3),
+    "financials.records.export.csv": ("/api/financials/financial-records/export/", {
+        "fields": "amount,transaction_type,date,payment_method,bank_account,created_by", "format": "csv",
+    }, 1, 20.0),
+    "financials.records.export.xlsx": ("/api/financials/financial-records/export/", {
+        "fields": "amount,transaction_type,date,payment_method,bank_account,created_by",
+    }, 1, 60.0),
+    "financials.stats": ("/api/financials/get-financials-stats/", {"from": "{since}", "to": "{until}"}, 2, 2.0),
+    "financials.month_subscriptions": ("/api/financials/get-month-subscriptions/", {
+        "month": "{month}", "year": "{year}"}, 3, 1.5),
+    "financials.month_subscriptions.unpaid": ("/api/financials/get-month-subscriptions/", {
+        "month": "{month}", "year": "{year}", "status": "unpaid"}, 3, 1.5),
+    "financials.month_installments": ("/api/financials/get-month-installments/", {
+        "month": "{month}", "year": "{year}"}, 2, 1.0),
+    "financials.year_subscriptions": ("/api/financials/get-year-subscriptions/", {
+        "year": "{year}", "client": "{client}"}, 2, 0.3),
+    "financials.subscriptions.list": ("/api/financials/subscriptions/", {}, 2, 2.0),
+    "financials.subscriptions.retrieve": ("/api/financials/subscriptions/{subscription}/", {}, 1, 0.3),
+    "financials.installments.client": ("/api/financials/installments/", {"client": "{client}"}, 1, 0.3),
+    "financials.loans.list": ("/api/financials/loans/", {}, 2, 1.0),
+    "financials.loans.retrieve": ("/api/financials/loans/{loan}/", {}, 1, 0.3),
+    "financials.loans.export_repayments": ("/api/financials/loans/{loan}/export_repayments/", {}, 3, 0.5),
+    "financials.repayments.loan": ("/api/financials/repayments/", {"loan_id": "{loan}"}, 1, 0.3),
+    "financials.bank_accounts": ("/api/financials/bank-accounts/", {}, 2, 0.3),
+    "financials.transaction_types": ("/api/financials/transaction-types/", {}, 2, 0.3),
+    "financials.rank_fees": ("/api/financials/rank-fees/", {}, 2, 0.3),
+    # projects
+    "projects.list": ("/api/projects/projects/", {}, 2, 1.0),
+    "projects.retrieve": ("/api/projects/projects/{project}/", {}, 1, 0.5),
+    "projects.transactions": ("/api/projects/project-transactions/", {"project": "{project}"}, 4, 1.0),
+    "projects.stats": ("/api/projects/get-projects-stats/", {}, 2, 1.0),
+    "projects.export_totals.csv": ("/api/projects/projects/export_totals/", {
+        "fields": "name,status,total_income,total_expense,net_income", "format": "csv"}, 1, 2.0),
+    "projects.export_totals.xlsx": ("/api/projects/projects/export_totals/", {
+        "fields": "name,status,total_income,total_expense,net_income"}, 1, 2.0),
+    "projects.export_monthly": ("/api/projects/projects/export_monthly/", {
+        "fields": "total_income,total_expense,net_income", "start": "{since_month}", "end": "{until_month}"},
+                                2, 3.0),
+}
+
+
+class BenchmarkTests(TestCase):
+    results = {}
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_superuser(username="benchmark", password="benchmark")
+
+        started = time.perf_counter()
+        dataset = SyntheticDataset(members=int(20000 * SCALE), years=3, records=int(200000 * SCALE),
+                                   projects=int(50 * SCALE) or 1, seed=2024, user=cls.user)
+        cls.counts = dataset.generate()
+        cls.seed_seconds = time.perf_counter() - started
+
+        until = dataset.until
+        cls.targets = {
+            "client": Client.objects.filter(installments__isnull=False).order_by("pk").values_list(
+                "pk", flat=True).first(),
+            "record": FinancialRecord.objects.order_by("pk").values_list("pk", flat=True).first(),
+            "subscription": Subscription.objects.order_by("pk").values_list("pk", flat=True).first(),
+            "work_entity": WorkEntity.objects.order_by("pk").values_list("pk", flat=True).first(),
+            "loan": Loan.objects.order_by("pk").values_list("pk", flat=True).first(),
+            "project": Project.objects.order_by("pk").values_list("pk", flat=True).first(),
+            "month": until.month, "year": until.year,
+            "since": dataset.since.isoformat(), "until": until.isoformat(),
+            "since_month": dataset.since.strftime("%Y-%m"), "until_month": until.strftime("%Y-%m"),
+        }
+
+    @classmethod
+    def tearDownClass(cls):
+        report = {
+            "created_at": datetime.now().isoformat(timespec="seconds"),
+            "scale": SCALE,
+            "database": connection.vendor,
+            "seed_seconds": round(cls.seed_seconds, 2) if hasattr(cls, "seed_seconds") else None,
+            "dataset": getattr(cls, "counts", {}),
+            "endpoints": cls.results,
+        }
+        with open(REPORT, "w", encoding="utf-8") as file:
+            json.dump(report, file, ensure_ascii=False, indent=2)
+        super().tearDownClass()
+
+    def setUp(self):
+        self.api = APIClient()
+        self.api.force_authenticate(self.user)
+        clear_cache()
+        for registry in (rank_fees, transaction_types, bank_accounts, work_entities):
+            registry.all()
+
+    def request(self, path, params):
+        response = self.api.get(path, params)
+        if response.streaming:
+            size = sum(len(chunk) for chunk in response.streaming_content)
+        else:
+            size = len(response.content)
+        return response, size
+
+    def measure(self, name, path, params):
+        path = path.format(**self.targets)
+        params = {key: str(value).format(**self.targets) for key, value in params.items()}
+
+        # the first, traced, request also warms up the caches of the process
+        tracemalloc.start()
+        self.request(path, params)
+        peak_memory = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+        with CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            response, size = self.request(path, params)
+            seconds = time.perf_counter() - started
+
+        result = {
+            "status": response.status_code,
+            "queries": len(queries),
+            "seconds": round(seconds, 4),
+            "peak_memory_kb": peak_memory // 1024,
+            "response_kb": size // 1024,
+            "sql_seconds": round(sum(float(query["time"]) for query in queries), 4),
+        }
+        self.results[name] = result
+        return result
+
+    def test_endpoint_budgets(self):
+        for name, (path, params, max_queries, max_seconds) in ENDPOINTS.items():
+            with self.subTest(endpoint=name):
+                result = self.measure(name, path, params)
+
+                self.assertEqual(result["status"], 200)
+                self.assertLessEqual(result["queries"], max_queries)
+                self.assertLessEqual(result["seconds"], max_seconds * max(SCALE, 1))
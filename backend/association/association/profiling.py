@@ -0,0 +1,132 @@
+import json
+import logging
+import re
+import time
+from collections import Counter
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+from .slow_queries import get_slow_query_log
+
+logger = logging.getLogger("association.profiling")
+
+_IN_LIST = re.compile(r"\(%s(?:, %s)*\)")
+_LITERAL = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_SPACE = re.compile(r"\s+")
+
+
+def fingerprint(sql):
+    """
+    the statement with its literals and IN lists collapsed, equal for the
+    queries of an N+1 loop that only differ in their parameters
+    """
+    sql = _IN_LIST.sub("(...)", _LITERAL.sub("%s", sql))
+    return _SPACE.sub(" ", sql).strip()
+
+
+class QueryProfile:
+    """
+    execute wrapper timing every statement run through it, install it on the
+    connections with `profile()`. cheap enough for every request: one counter
+    update and a regex per statement, only the slowest run of each fingerprint
+    is kept.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.slowest = None
+        self.slowest_seconds = 0.0
+        self.fingerprints = Counter()
+        self.durations = Counter()
+        # fingerprint -> (seconds, sql, params) of its slowest run
+        self.statements = {}
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.record(sql, None if many else params, time.perf_counter() - started)
+
+    def record(self, sql, params, seconds):
+        key = fingerprint(sql)
+        self.count += 1
+        self.seconds += seconds
+        self.fingerprints[key] += 1
+        self.durations[key] += seconds
+        if seconds >= self.slowest_seconds:
+            self.slowest, self.slowest_seconds = sql, seconds
+        if key not in self.statements or seconds > self.statements[key][0]:
+            self.statements[key] = (seconds, sql, params)
+
+    def profile(self, aliases=None):
+        """
+        context manager wrapping the connections of `aliases` (all by default)
+        """
+        stack = ExitStack()
+        for alias in aliases or connections:
+            stack.enter_context(connections[alias].execute_wrapper(self))
+        return stack
+
+    def duplicates(self, threshold=2):
+        """
+        fingerprint -> count of the statements repeated at least `threshold` times, most repeated first
+        """
+        return {sql: count for sql, count in self.fingerprints.most_common() if count >= threshold}
+
+
+class QueryProfilingMiddleware:
+    """
+    per request query count, SQL time, slowest statement and repeated (N+1)
+    statements, sent back as `Server-Timing` and `X-Query-Count` headers and
+    logged as one JSON line to the `association.profiling` logger.
+
+    the slowest statements also go to the slow query log (association.slow_queries).
+
+    opt in with `SQL_PROFILING = True`, otherwise the middleware removes itself
+    from the chain on startup. works with DEBUG off, queries run while a
+    streaming response is consumed are not counted.
+    """
+
+    def __init__(self, get_response):
+        if not getattr(settings, "SQL_PROFILING", False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.threshold = getattr(settings, "SQL_PROFILING_DUPLICATE_THRESHOLD", 2)
+
+    def __call__(self, request):
+        profile = QueryProfile()
+        started = time.perf_counter()
+        with profile.profile():
+            response = self.get_response(request)
+        total = time.perf_counter() - started
+
+        sql_ms, total_ms = profile.seconds * 1000, total * 1000
+        response["X-Query-Count"] = str(profile.count)
+        response["Server-Timing"] = ", ".join(filter(None, [
+            response.get("Server-Timing"),
+            f'sql;dur={sql_ms:.1f};desc="{profile.count} queries"',
+            f"app;dur={total_ms - sql_ms:.1f}",
+            f"total;dur={total_ms:.1f}",
+        ]))
+
+        duplicates = profile.duplicates(self.threshold)
+        match = getattr(request, "resolver_match", None)
+        get_slow_query_log().add(profile, match.view_name if match else request.path, request.GET)
+        logger.info(json.dumps({
+            "method": request.method,
+            "path": request.path,
+            "view": match.view_name if match else None,
+            "status": response.status_code,
+            "total_ms": round(total_ms, 1),
+            "sql_ms": round(sql_ms, 1),
+            "queries": profile.count,
+            "slowest_ms": round(profile.slowest_seconds * 1000, 1),
+            "slowest": profile.slowest,
+            "duplicates": [{"sql": sql, "count": count} for sql, count in duplicates.items()],
+        }, ensure_ascii=False))
+        return response
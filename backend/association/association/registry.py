@@ -0,0 +1,125 @@
+import copy
+import threading
+import time
+from uuid import uuid4
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+
+
+class ReferenceRegistry:
+    """
+    in-process cache of a small reference table.
+
+    rows are loaded once per process and reused until the table changes.
+    post_save/post_delete drop the local copy and bump a version stamp in the
+    shared cache on commit, other workers notice the new stamp (checked at most
+    every `check_interval` seconds) and reload.
+
+    `fields` limits the cached columns, for tables whose other columns change
+    without a save (e.g. balances moved by atomic updates). the rows are then
+    handed out as copies, a deferred column loaded on one doesn't end up in
+    the cache.
+    """
+
+    def __init__(self, model, check_interval=1.0, fields=None):
+        self.model = model
+        self.check_interval = check_interval
+        self.fields = fields
+        self.cache_key = f"reference-registry:{model._meta.label_lower}:version"
+
+        self._lock = threading.Lock()
+        self._rows = None
+        self._indexes = {}
+        self._version = None
+        self._checked_at = 0.0
+
+        dispatch_uid = f"reference-registry-{model._meta.label_lower}"
+        post_save.connect(self._on_change, sender=model, weak=False, dispatch_uid=dispatch_uid)
+        post_delete.connect(self._on_change, sender=model, weak=False, dispatch_uid=dispatch_uid)
+
+    def __deepcopy__(self, memo):
+        # shared per process, e.g. when a serializer field holding it is copied
+        return self
+
+    def _on_change(self, **kwargs):
+        self.clear()
+        transaction.on_commit(self.invalidate)
+
+    def clear(self):
+        """
+        drop the local copy only
+        """
+        with self._lock:
+            self._rows = None
+            self._indexes = {}
+
+    def invalidate(self):
+        """
+        drop the local copy and make every worker reload
+        """
+        cache.set(self.cache_key, uuid4().hex, None)
+        self.clear()
+
+    def _shared_version(self):
+        version = cache.get(self.cache_key)
+        if version is None:
+            cache.add(self.cache_key, uuid4().hex, None)
+            version = cache.get(self.cache_key)
+        return version
+
+    def _load(self, reload=False):
+        now = time.monotonic()
+        if self._rows is not None and not reload and now - self._checked_at < self.check_interval:
+            return self._rows
+
+        version = self._shared_version()
+        with self._lock:
+            if self._rows is None or reload or version != self._version:
+                queryset = self.model.objects.all()
+                self._rows = list(queryset.only(*self.fields) if self.fields else queryset)
+                self._indexes = {}
+                self._version = version
+            self._checked_at = now
+            return self._rows
+
+    def _index(self, fields, reload=False):
+        rows = self._load(reload)
+        index = self._indexes.get(fields)
+        if index is None:
+            index = {}
+            for row in rows:
+                index.setdefault(tuple(getattr(row, field) for field in fields), []).append(row)
+            self._indexes[fields] = index
+        return index
+
+    def _rows_out(self, rows):
+        return [copy.copy(row) for row in rows] if self.fields else list(rows)
+
+    def all(self):
+        return self._rows_out(self._load())
+
+    def filter(self, **lookup):
+        return self._filter(lookup)
+
+    def _filter(self, lookup, reload=False):
+        fields = tuple(sorted(lookup))
+        return self._rows_out(self._index(fields, reload).get(tuple(lookup[field] for field in fields), []))
+
+    def get(self, **lookup):
+        rows = self._filter(lookup)
+        if not rows:
+            # created by another worker since the last version check, or missing
+            rows = self._filter(lookup, reload=True)
+        if not rows:
+            raise self.model.DoesNotExist(f"{self.model.__name__} matching {lookup} does not exist.")
+        return rows[0]
+
+    def ids(self, field, values):
+        """
+        primary keys of the rows whose `field` is in `values`, to filter on the
+        foreign key column instead of joining the reference table
+        """
+        index = self._index((field,))
+        return [row.pk for value in values for row in index.get((value,), [])]
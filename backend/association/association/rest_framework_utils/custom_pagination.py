@@ -1,18 +1,47 @@
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from functools import reduce
+from operator import or_
+
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.db.models import Q, QuerySet
+from rest_framework.exceptions import NotFound
 from rest_framework.pagination import PageNumberPagination
 from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param, remove_query_param
 
 
 class CustomPageNumberPagination(PageNumberPagination):
     page_size_query_param = 'page_size'
     page_size = 10
 
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Invalid cursor'
+
     def paginate_queryset(self, queryset, request, view=None):
+        self.cursor_mode = False
         no_pagination = request.query_params.get("no_pagination", None)
         if no_pagination and no_pagination.lower() == 'true':
             return None
+
+        if self.cursor_query_param in request.query_params and isinstance(queryset, QuerySet):
+            ordering = self.get_cursor_ordering(queryset)
+            if ordering is not None:
+                return self.paginate_cursor(queryset, ordering, request)
+
         return super().paginate_queryset(queryset, request, view)
 
     def get_paginated_response(self, data):
+        if self.cursor_mode:
+            return Response({
+                'total_pages': None,
+                'page': None,
+                'count': None,
+                'next': self.get_cursor_link(self.next_cursor),
+                'previous': self.get_cursor_link(self.previous_cursor),
+                'data': data,
+            })
+
         total_pages = self.page.paginator.num_pages
         return Response({
             'total_pages': total_pages,
@@ -22,3 +51,110 @@ class CustomPageNumberPagination(PageNumberPagination):
             'previous': self.get_previous_link(),
             'data': data,
         })
+
+    # ---------- cursor (keyset) mode ----------
+    # `?cursor=` (empty for the first page) seeks on the queryset ordering plus the
+    # primary key as tie-breaker instead of OFFSET, and skips the COUNT query, so
+    # every page costs the same. orderings over related or nullable fields fall
+    # back to page numbers.
+
+    def get_cursor_ordering(self, queryset):
+        """
+        list of (field, descending) pairs ending with the primary key, None if unsupported
+        """
+        model = queryset.model
+        ordering = list(queryset.query.order_by or model._meta.ordering)
+
+        keys = []
+        for item in ordering:
+            if not isinstance(item, str) or item == "?":
+                return None
+            descending = item.startswith("-")
+            name = item.lstrip("-+")
+            if name == "pk":
+                name = model._meta.pk.name
+            try:
+                field = model._meta.get_field(name)
+            except FieldDoesNotExist:
+                return None
+            if field.null or field.is_relation and not field.concrete:
+                return None
+            keys.append((field, descending))
+
+        if not any(field.primary_key for field, __ in keys):
+            descending = keys[-1][1] if keys else False
+            keys.append((model._meta.pk, descending))
+
+        return keys
+
+    def encode_cursor(self, values, reverse):
+        payload = json.dumps({"v": values, "r": reverse}, separators=(",", ":"))
+        return urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+    def decode_cursor(self, cursor, keys):
+        try:
+            padded = cursor + "=" * (-len(cursor) % 4)
+            payload = json.loads(urlsafe_b64decode(padded.encode()))
+            values = [field.to_python(value) for (field, __), value in zip(keys, payload["v"], strict=True)]
+            return values, bool(payload["r"])
+        except (ValueError, TypeError, KeyError, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def cursor_values(self, obj, keys):
+        values = []
+        for field, __ in keys:
+            value = obj[field.attname] if isinstance(obj, dict) else field.value_from_object(obj)
+            if not isinstance(value, (int, float, str)):
+                value = value.isoformat() if hasattr(value, "isoformat") else str(value)
+            values.append(value)
+        return values
+
+    def seek_filter(self, keys, values, reverse):
+        """
+        rows strictly after `values` in the keys ordering (before, when reversed)
+        """
+        conditions = []
+        for i, (field, descending) in enumerate(keys):
+            after = "lt" if descending != reverse else "gt"
+            condition = {f"{field.attname}__{after}": values[i]}
+            condition.update({previous.attname: value for (previous, __), value in zip(keys[:i], values)})
+            conditions.append(Q(**condition))
+        return reduce(or_, conditions)
+
+    def paginate_cursor(self, queryset, keys, request):
+        self.cursor_mode = True
+        self.request = request
+        page_size = self.get_page_size(request)
+
+        cursor = request.query_params.get(self.cursor_query_param)
+        values, reverse = self.decode_cursor(cursor, keys) if cursor else (None, False)
+
+        order_by = [f"{'-' if descending != reverse else ''}{field.attname}" for field, descending in keys]
+        queryset = queryset.order_by(*order_by)
+        if values is not None:
+            queryset = queryset.filter(self.seek_filter(keys, values, reverse))
+
+        results = list(queryset[:page_size + 1])
+        has_more = len(results) > page_size
+        results = results[:page_size]
+        if reverse:
+            results.reverse()
+
+        self.next_cursor = None
+        self.previous_cursor = None
+        if results:
+            first, last = self.cursor_values(results[0], keys), self.cursor_values(results[-1], keys)
+            if reverse:
+                self.next_cursor = self.encode_cursor(last, False)
+                self.previous_cursor = self.encode_cursor(first, True) if has_more else None
+            else:
+                self.next_cursor = self.encode_cursor(last, False) if has_more else None
+                self.previous_cursor = self.encode_cursor(first, True) if values is not None else None
+
+        return results
+
+    def get_cursor_link(self, cursor):
+        if cursor is None:
+            return None
+        url = remove_query_param(self.request.build_absolute_uri(), self.page_query_param)
+        return replace_query_param(url, self.cursor_query_param, cursor)
@@ -0,0 +1,24 @@
+from django.core.exceptions import ObjectDoesNotExist
+from rest_framework import serializers
+
+
+class RegistryPrimaryKeyRelatedField(serializers.PrimaryKeyRelatedField):
+    """
+    primary key field resolved through an association.registry.ReferenceRegistry,
+    validating a list of records doesn't query the reference table per item
+    """
+
+    def __init__(self, registry, **kwargs):
+        self.registry = registry
+        kwargs.setdefault("queryset", registry.model.objects.all())
+        super().__init__(**kwargs)
+
+    def to_internal_value(self, data):
+        if isinstance(data, bool):
+            self.fail("incorrect_type", data_type=type(data).__name__)
+        try:
+            return self.registry.get(pk=int(data))
+        except ObjectDoesNotExist:
+            self.fail("does_not_exist", pk_value=data)
+        except (TypeError, ValueError):
+            self.fail("incorrect_type", data_type=type(data).__name__)
@@ -1,4 +1,6 @@
 # for this project
+import os
+import sys
 from datetime import timedelta
 
 import pytz
@@ -43,6 +45,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'association.profiling.QueryProfilingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
@@ -84,6 +87,25 @@ DATABASES = {
     }
 }
 
+# Cache
+# https://docs.djangoproject.com/en/5.0/topics/cache/
+# file based so the version stamps of association.registry are shared between workers
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.environ.get('CACHE_DIR', BASE_DIR / 'cache'),
+    }
+}
+
+# the test runs (benchmarks included) clear the cache, give them their own in-memory one
+if sys.argv[1:2] == ['test']:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
 # Password validation
 # https://docs.djangoproject.com/en/5.0/ref/settings/#auth-password-validators
 
@@ -161,6 +183,30 @@ CORS_ALLOW_HEADERS = list(default_headers) + [
     'X-CSRFToken'
 ]
 
+CORS_EXPOSE_HEADERS = ['Server-Timing', 'X-Query-Count']
+
+# per request SQL profiling (association.profiling), Server-Timing / X-Query-Count headers and a log line per request
+SQL_PROFILING = os.environ.get('SQL_PROFILING') == '1'
+# statements repeated this many times in one request are logged as duplicates
+SQL_PROFILING_DUPLICATE_THRESHOLD = 2
+# slow query log of the profiled requests (association.slow_queries, /api/admin/slow-queries/): the N slowest
+# statements of the last window seconds, optionally mirrored to a SQLite file shared by the workers
+SLOW_QUERY_LOG_SIZE = 50
+SLOW_QUERY_LOG_WINDOW = 3600
+SLOW_QUERY_LOG_MIN_MS = 20
+SLOW_QUERY_LOG_FILE = os.environ.get('SLOW_QUERY_LOG_FILE')
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'association.profiling': {'handlers': ['console'], 'level': 'INFO', 'propagate': False},
+    },
+}
+
 # csrf
 # CSRF_TRUSTED_ORIGINS = ['http://localhost:5173', 'kaffohrms.pythonanywhere.com']
 # CSRF_COOKIE_NAME = 'csrftoken'
@@ -0,0 +1,215 @@
+import json
+import sqlite3
+import threading
+import time
+from contextlib import closing, contextmanager
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.db import connection
+from rest_framework import status
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.permissions import BasePermission
+from rest_framework.response import Response
+
+# columns of the mirror table, in the order of the entry keys
+FIELDS = ("fingerprint", "sql", "params", "seconds", "slowest_at", "count", "total_seconds", "view",
+          "request_params", "first_seen", "last_seen")
+JSON_FIELDS = ("params", "request_params")
+
+
+class SlowQueryLog:
+    """
+    the `size` slowest statements, one entry per fingerprint, seen in the last
+    `window` seconds. statements faster than `min_ms` are ignored.
+
+    an entry keeps the sql and parameters of its slowest run together with the
+    view and query parameters of the request that ran it, enough to EXPLAIN it
+    later. entries not seen for a window expire, a slowest run older than the
+    window is replaced by the next run.
+
+    kept in process memory, with `path` the entries are also mirrored to a
+    local SQLite file so they are shared by the workers and survive restarts.
+    """
+
+    def __init__(self, size=50, window=3600, min_ms=20, path=None):
+        self.options = (size, window, min_ms, path)
+        self.size = size
+        self.window = window
+        self.min_seconds = min_ms / 1000
+        self.path = path
+
+        self._lock = threading.Lock()
+        self._entries = {}
+        if path:
+            with self._connect() as db:
+                db.execute(f"CREATE TABLE IF NOT EXISTS slow_queries ({', '.join(FIELDS)}, "
+                           f"PRIMARY KEY (fingerprint))")
+
+    @contextmanager
+    def _connect(self):
+        # one short write transaction per call, serialized between the workers by the file lock
+        with closing(sqlite3.connect(self.path, timeout=5, isolation_level=None)) as db:
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                yield db
+            except BaseException:
+                db.execute("ROLLBACK")
+                raise
+            db.execute("COMMIT")
+
+    def add(self, profile, view, request_params):
+        """
+        take the slow statements of a finished QueryProfile
+        """
+        now = time.time()
+        request_params = {key: values if len(values) > 1 else values[0]
+                          for key, values in request_params.lists()}
+        entries = [
+            {"fingerprint": key, "sql": sql, "params": _json_safe(params), "seconds": seconds, "slowest_at": now,
+             "count": profile.fingerprints[key], "total_seconds": profile.durations[key], "view": view,
+             "request_params": request_params, "first_seen": now, "last_seen": now}
+            for key, (seconds, sql, params) in profile.statements.items()
+            if seconds >= self.min_seconds and not sql.lstrip().upper().startswith("EXPLAIN")
+        ]
+        if not entries:
+            return
+
+        with self._lock:
+            for entry in entries:
+                self._entries[entry["fingerprint"]] = self._merge(self._entries.get(entry["fingerprint"]), entry)
+            self._entries = {entry["fingerprint"]: entry for entry in self._prune(self._entries.values(), now)}
+        if self.path:
+            self._mirror(entries, now)
+
+    def _merge(self, old, new):
+        if old is None or new["last_seen"] - old["last_seen"] > self.window:
+            return new
+        merged = {**old, "count": old["count"] + new["count"], "last_seen": new["last_seen"],
+                  "total_seconds": old["total_seconds"] + new["total_seconds"]}
+        if new["seconds"] >= old["seconds"] or new["last_seen"] - old["slowest_at"] > self.window:
+            for field in ("sql", "params", "seconds", "slowest_at", "view", "request_params"):
+                merged[field] = new[field]
+        return merged
+
+    def _prune(self, entries, now):
+        entries = [entry for entry in entries if now - entry["last_seen"] <= self.window]
+        return sorted(entries, key=lambda entry: entry["seconds"], reverse=True)[:self.size]
+
+    def _mirror(self, entries, now):
+        with self._connect() as db:
+            for entry in entries:
+                row = db.execute(f"SELECT {', '.join(FIELDS)} FROM slow_queries WHERE fingerprint = ?",
+                                 (entry["fingerprint"],)).fetchone()
+                merged = self._merge(_entry(row) if row else None, entry)
+                db.execute(f"INSERT OR REPLACE INTO slow_queries VALUES ({', '.join('?' * len(FIELDS))})",
+                           [json.dumps(merged[field], ensure_ascii=False) if field in JSON_FIELDS else merged[field]
+                            for field in FIELDS])
+            db.execute("DELETE FROM slow_queries WHERE last_seen < ?", (now - self.window,))
+            db.execute("DELETE FROM slow_queries WHERE fingerprint NOT IN "
+                       "(SELECT fingerprint FROM slow_queries ORDER BY seconds DESC LIMIT ?)", (self.size,))
+
+    def entries(self):
+        """
+        the current entries, slowest first, read from the mirror when there is one
+        """
+        now = time.time()
+        if self.path:
+            with self._connect() as db:
+                rows = db.execute(f"SELECT {', '.join(FIELDS)} FROM slow_queries").fetchall()
+            return self._prune([_entry(row) for row in rows], now)
+        with self._lock:
+            return self._prune(self._entries.values(), now)
+
+    def clear(self):
+        with self._lock:
+            self._entries = {}
+        if self.path:
+            with self._connect() as db:
+                db.execute("DELETE FROM slow_queries")
+
+
+def _entry(row):
+    entry = dict(zip(FIELDS, row))
+    for field in JSON_FIELDS:
+        entry[field] = json.loads(entry[field])
+    return entry
+
+
+def _json_safe(params):
+    # dates, decimals and the like as strings, still usable as parameters of EXPLAIN
+    return None if params is None else json.loads(json.dumps(list(params), default=str))
+
+
+_log = None
+
+
+def get_slow_query_log():
+    """
+    the process wide log configured by the SLOW_QUERY_LOG_* settings
+    """
+    global _log
+    options = (getattr(settings, "SLOW_QUERY_LOG_SIZE", 50), getattr(settings, "SLOW_QUERY_LOG_WINDOW", 3600),
+               getattr(settings, "SLOW_QUERY_LOG_MIN_MS", 20), getattr(settings, "SLOW_QUERY_LOG_FILE", None))
+    if _log is None or _log.options != options:
+        _log = SlowQueryLog(*options)
+    return _log
+
+
+def explain(sql, params):
+    """
+    the query plan of a logged SELECT statement, one line per plan node
+    """
+    if not sql.lstrip().upper().startswith(("SELECT", "WITH")):
+        return None
+    prefix = "EXPLAIN QUERY PLAN " if connection.vendor == "sqlite" else "EXPLAIN "
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(prefix + sql, params)
+            rows = cursor.fetchall()
+    except Exception as error:
+        return [f"error: {error}"]
+    # sqlite: (id, parent, notused, detail)
+    return [row[-1] if connection.vendor == "sqlite" else " ".join(map(str, row)) for row in rows]
+
+
+class IsSuperUser(BasePermission):
+    def has_permission(self, request, view):
+        return bool(request.user and request.user.is_superuser)
+
+
+def _timestamp(seconds):
+    return datetime.fromtimestamp(seconds, timezone.utc).isoformat(timespec="seconds")
+
+
+@api_view(["GET", "DELETE"])
+@permission_classes([IsSuperUser])
+def slow_queries(request):
+    """
+    the slow query log, ?explain=1 adds the query plan of every entry, DELETE empties it
+    """
+    log = get_slow_query_log()
+    if request.method == "DELETE":
+        log.clear()
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+    with_plan = request.query_params.get("explain", "").lower() in ("1", "true")
+    data = []
+    for entry in log.entries():
+        item = {
+            "fingerprint": entry["fingerprint"],
+            "sql": entry["sql"],
+            "params": entry["params"],
+            "view": entry["view"],
+            "request_params": entry["request_params"],
+            "count": entry["count"],
+            "slowest_ms": round(entry["seconds"] * 1000, 2),
+            "average_ms": round(entry["total_seconds"] / entry["count"] * 1000, 2),
+            "slowest_at": _timestamp(entry["slowest_at"]),
+            "first_seen": _timestamp(entry["first_seen"]),
+            "last_seen": _timestamp(entry["last_seen"]),
+        }
+        if with_plan:
+            item["plan"] = explain(entry["sql"], entry["params"])
+        data.append(item)
+    return Response({"window": log.window, "size": log.size, "data": data}, status=status.HTTP_200_OK)
@@ -0,0 +1,231 @@
+import random
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from clients.models import Client, WorkEntity, MembershipType, MaritalStatus, RankChoices
+from clients.search import rebuild_search_index
+from financials.balances import reconcile_balances
+from financials.dues import rebuild_client_dues
+from financials.models import BankAccount, FinancialRecord, Installment, Loan, Repayment, Subscription, \
+    TransactionType
+from financials.registry import rank_fees, get_system_transaction_type
+from financials.rollups import rebuild_monthly_rollups
+from financials.schedules import split_amount
+from projects.models import Project, ProjectTransaction
+
+FIRST_NAMES = ["أحمد", "محمد", "محمود", "مصطفى", "خالد", "عمر", "علي", "حسن", "حسين", "إبراهيم", "يوسف", "طارق",
+               "سامي", "عادل", "ماجد", "ناصر", "صالح", "عبد الله", "عبد الرحمن", "أيمن", "هشام", "وليد", "كريم",
+               "شريف", "عماد", "رامي", "باسم", "تامر", "ياسر", "إسلام"]
+FAMILY_NAMES = ["السيد", "عبد العزيز", "الشافعي", "المصري", "النجار", "الحداد", "عثمان", "فهمي", "منصور", "رشاد",
+                "سليمان", "عبد الحميد", "البنا", "الجمال", "شاهين", "زكي", "سالم", "فوزي", "رمضان", "حمدي"]
+RESIDENCES = ["القاهرة", "الجيزة", "الإسكندرية", "المنصورة", "طنطا", "أسيوط", "الزقازيق", "بورسعيد", "سوهاج"]
+WORK_ENTITIES = ["وزارة الداخلية", "وزارة الدفاع", "الحماية المدنية", "الأمن العام", "الأمن الوطني", "المرور",
+                 "الجوازات", "السجون", "الأحوال المدنية", "شرطة السياحة", "شرطة الكهرباء", "شرطة النقل",
+                 "الأمن المركزي", "المباحث", "الإدارة العامة", "أكاديمية الشرطة"]
+INCOME_TYPES = ["تبرعات", "رسوم خدمات", "إيجارات", "عائد ودائع"]
+EXPENSE_TYPES = ["مرتبات", "كهرباء ومياه", "صيانة", "أدوات مكتبية", "مكافآت", "ضيافة"]
+BANK_ACCOUNTS = ["البنك الأهلي", "بنك مصر", "بنك القاهرة"]
+
+
+def _add_months(month, count):
+    """
+    first day of the month `count` months after the first day `month`, cheaper than relativedelta in the hot loops
+    """
+    years, month_index = divmod(month.month - 1 + count, 12)
+    return date(month.year + years, month_index + 1, 1)
+
+
+class SyntheticDataset:
+    """
+    deterministic, realistic looking data for local performance work and the
+    endpoint benchmarks. members and loans are bulk created (their ids are
+    needed), the large tables are inserted from plain tuples with executemany
+    in chunks. the per-row signal work (balances, rollups, dues, search tokens)
+    is rebuilt once at the end
+    """
+
+    def __init__(self, members=1000, years=3, records=None, projects=None, seed=0, until=None, user=None,
+                 batch_size=5000):
+        self.members = members
+        self.years = years
+        self.records = members * 10 if records is None else records
+        self.projects = max(1, members // 500) if projects is None else projects
+        self.batch_size = batch_size
+        self.user = user
+        self.random = random.Random(seed)
+        self.until = until or datetime.today().astimezone(settings.CAIRO_TZ).date().replace(day=1)
+        self.since = _add_months(self.until, -12 * years)
+        self.counts = {}
+
+    def _count(self, model, count):
+        self.counts[model._meta.label] = self.counts.get(model._meta.label, 0) + count
+
+    def _create(self, model, objects):
+        objects = model.objects.bulk_create(objects, batch_size=self.batch_size)
+        self._count(model, len(objects))
+        return objects
+
+    def _insert(self, model, fields, rows):
+        """
+        insert value tuples of `fields` without building model instances, dates
+        and decimals are passed as strings
+        """
+        quote = connection.ops.quote_name
+        columns = ", ".join(quote(model._meta.get_field(field).column) for field in fields)
+        sql = (f"INSERT INTO {quote(model._meta.db_table)} ({columns}) "
+               f"VALUES ({', '.join(['%s'] * len(fields))})")
+        with connection.cursor() as cursor:
+            for start in range(0, len(rows), self.batch_size):
+                cursor.executemany(sql, rows[start:start + self.batch_size])
+        self._count(model, len(rows))
+
+    def _reference(self, model, names, **fields):
+        existing = {row.name: row for row in model.objects.filter(name__in=names, **fields)}
+        self._create(model, [model(name=name, **fields) for name in names if name not in existing])
+        return list(model.objects.filter(name__in=names, **fields))
+
+    def _day(self, start, end):
+        return start + timedelta(days=self.random.randrange(max(1, (end - start).days)))
+
+    def generate(self):
+        """
+        write the dataset, returns the number of created rows per model. meant
+        for an empty database: the balances, rollups, dues and search index are
+        rebuilt from all the rows, existing ones included
+        """
+        with transaction.atomic():
+            self.work_entities = self._reference(WorkEntity, WORK_ENTITIES)
+            self.bank_accounts = self._reference(BankAccount, BANK_ACCOUNTS)
+            self.incomes = self._reference(TransactionType, INCOME_TYPES, type=TransactionType.Type.INCOME)
+            self.expenses = self._reference(TransactionType, EXPENSE_TYPES, type=TransactionType.Type.EXPENSE)
+            self.fees = {rank_fee.rank: rank_fee.fee for rank_fee in rank_fees.all()}
+            self.created_at = str(connection.ops.adapt_datetimefield_value(timezone.now()))
+            self.created_by_id = self.user.pk if self.user else None
+
+            # continue after the existing members so the unique fields don't collide
+            first = (Client.objects.aggregate(last=Max("membership_number"))["last"] or 0) + 1
+            for start in range(first, first + self.members, self.batch_size):
+                self._members(start, min(first + self.members, start + self.batch_size))
+            self._financial_records()
+
+            # everything above skipped the signals maintaining these, rebuild them in one pass each
+            rebuild_monthly_rollups()
+            reconcile_balances(fix=True)
+            rebuild_client_dues()
+            rebuild_search_index()
+
+        return self.counts
+
+    def _members(self, start, end):
+        rng = self.random
+        clients = self._create(Client, [
+            Client(
+                name=f"{rng.choice(FIRST_NAMES)} {rng.choice(FIRST_NAMES)} {rng.choice(FAMILY_NAMES)}",
+                rank=rng.choice(RankChoices.values),
+                national_id=f"{27000000000000 + number:014d}",
+                birth_date=self._day(date(1960, 1, 1), date(2000, 1, 1)),
+                residence=rng.choice(RESIDENCES),
+                phone_number=f"01{rng.choice('0125')}{number:08d}",
+                membership_type=rng.choice(MembershipType.values),
+                work_entity=rng.choice(self.work_entities) if rng.random() < 0.9 else None,
+                membership_number=number,
+                subscription_date=_add_months(self.since, rng.randrange(-24, 12 * self.years)),
+                marital_status=rng.choice(MaritalStatus.values),
+                graduation_year=1980 + number % 40,
+                class_rank=str(number // 40 + 1),
+                subscription_fee=Decimal(rng.choice([0, 0, 0, 1000, 2000, 3000, 5000])),
+                prepaid=Decimal(0),
+                is_active=rng.random() < 0.85,
+                created_by=self.user,
+            )
+            for number in range(start, end)
+        ])
+
+        subscriptions, installments, loans = [], [], []
+        for client in clients:
+            subscriptions += self._subscriptions(client)
+            if client.subscription_fee:
+                installments += self._plan(Installment, client.pk, client.subscription_fee, rng.choice([6, 12, 24]),
+                                           client.subscription_date)
+            if rng.random() < 0.1:
+                loans.append(Loan(client=client, amount=Decimal(rng.choice([5000, 10000, 20000])),
+                                  issued_date=self._day(max(self.since, client.subscription_date), self.until)))
+
+        self._insert(Subscription, ("client", "date", "amount", "paid_at"), subscriptions)
+        self._insert(Installment, ("client", "installment_number", "due_date", "amount", "status", "paid_at"),
+                     installments)
+
+        repayments = []
+        for loan in self._create(Loan, loans):
+            repayments += self._plan(Repayment, loan.pk, loan.amount, rng.choice([10, 12, 24]), loan.issued_date)
+        self._insert(Repayment, ("loan", "repayment_number", "due_date", "amount", "status", "paid_at"), repayments)
+
+    def _subscriptions(self, client):
+        """
+        monthly subscriptions with realistic gaps: most members pay nearly every
+        month, some skip months regularly, retired members stopped at some point
+        """
+        rng = self.random
+        month = max(client.subscription_date, self.since)
+        stopped = self.until if client.is_active else self._day(month, self.until)
+        reliability = rng.choice([0.98, 0.95, 0.9, 0.75, 0.5])
+        fee = str(self.fees.get(client.rank, Decimal(100)))
+
+        rows = []
+        while month < stopped:
+            if rng.random() < reliability:
+                rows.append((client.pk, str(month), fee, str(month + timedelta(days=rng.randrange(28)))))
+            month = _add_months(month, 1)
+        return rows
+
+    def _plan(self, model, owner_id, total, count, start_date):
+        """
+        schedule rows (owner, number, due date, amount, status, paid at) whose past items are mostly paid
+        """
+        first = _add_months(start_date.replace(day=1), 1)
+        rows = []
+        for number, amount in enumerate(split_amount(total, count)):
+            due_date = _add_months(first, number)
+            paid = due_date < self.until and self.random.random() < 0.9
+            rows.append((owner_id, number + 1, str(due_date), str(amount),
+                         model.Status.PAID if paid else model.Status.UNPAID,
+                         str(due_date) if paid else None))
+        return rows
+
+    def _financial_records(self):
+        rng = self.random
+        projects = self._create(Project, [
+            Project(name=f"مشروع {index + 1}", start_date=self._day(self.since, self.until),
+                    status=rng.choice(Project.Status.values), created_by=self.user)
+            for index in range(self.projects)
+        ])
+        project_types = (get_system_transaction_type("إيرادات مشاريع", TransactionType.Type.INCOME),
+                         get_system_transaction_type("مصروفات مشاريع", TransactionType.Type.EXPENSE))
+        cash = FinancialRecord.PaymentMethod.CASH
+        methods = FinancialRecord.PaymentMethod.values
+        last = FinancialRecord.objects.aggregate(last=Max("pk"))["last"] or 0
+
+        rows = []
+        for index in range(self.records):
+            if rng.random() < 0.05:
+                transaction_type = rng.choice(project_types)
+            else:
+                transaction_type = rng.choice(self.incomes if rng.random() < 0.6 else self.expenses)
+            method = rng.choice(methods)
+            rows.append((str(Decimal(rng.randrange(50, 20000))), transaction_type.pk,
+                         str(self._day(self.since, self.until)), method,
+                         None if method == cash else rng.choice(self.bank_accounts).pk,
+                         str(100000 + index), self.created_at, self.created_by_id))
+        self._insert(FinancialRecord, ("amount", "transaction_type", "date", "payment_method", "bank_account",
+                                       "receipt_number", "created_at", "created_by"), rows)
+
+        # the project typed records just written belong to a project each
+        record_ids = (FinancialRecord.objects.filter(pk__gt=last, transaction_type__in=project_types)
+                      .order_by("pk").values_list("pk", flat=True))
+        self._insert(ProjectTransaction, ("statement", "financial_record", "project"),
+                     [("بيان", record_id, rng.choice(projects).pk) for record_id in record_ids])
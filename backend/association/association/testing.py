@@ -0,0 +1,33 @@
+from datetime import date
+from decimal import Decimal
+
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+
+from clients.models import Client, RankChoices
+
+
+def clear_cache():
+    """
+    empty the cache between tests, only ever the in-memory one of the test runs
+    """
+    if not isinstance(caches["default"], LocMemCache):
+        raise RuntimeError("the tests must run with the in-memory cache, refusing to clear the application cache")
+    caches["default"].clear()
+
+
+def create_client(index, subscription_date, **kwargs):
+    return Client.objects.create(
+        name=f"عضو {index}",
+        rank=RankChoices.NAQIB,
+        national_id=f"{index:014d}",
+        birth_date=date(1990, 1, 1),
+        phone_number=f"010{index:08d}",
+        membership_number=index,
+        subscription_date=subscription_date,
+        marital_status="أعزب",
+        graduation_year=2010,
+        class_rank=str(index),
+        subscription_fee=Decimal("0"),
+        **kwargs
+    )
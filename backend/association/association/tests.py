@@ -0,0 +1,145 @@
+import json
+import tempfile
+from datetime import date
+from io import StringIO
+
+from django.core.management import call_command, CommandError
+from django.db import connection
+from django.db.models import Sum
+from django.http import QueryDict
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from clients.models import Client
+from financials.balances import reconcile_balances
+from financials.models import FinancialRecord, Installment, Subscription
+from users.models import User
+from .profiling import QueryProfile
+from .slow_queries import SlowQueryLog, get_slow_query_log
+from .testing import clear_cache, create_client
+
+
+class SeedTests(TestCase):
+    def test_seed_is_deterministic_and_consistent(self):
+        call_command("seed", "--members", "30", "--years", "2", "--seed", "7", "--records", "200",
+                     "--batch-size", "8", stdout=StringIO())
+
+        self.assertEqual(Client.objects.count(), 30)
+        self.assertEqual(FinancialRecord.objects.count(), 200)
+        self.assertTrue(Subscription.objects.exists())
+        first = list(Client.objects.order_by("pk").values_list("name", "rank", "subscription_date"))
+
+        # the balances and dues skipped by the raw inserts were rebuilt
+        self.assertEqual(reconcile_balances(), [])
+        unpaid = Installment.objects.filter(status=Installment.Status.UNPAID).count()
+        self.assertEqual(Client.objects.aggregate(total=Sum("dues_snapshot__unpaid_installments"))["total"], unpaid)
+
+        # a database with data is only seeded with --force
+        with self.assertRaises(CommandError):
+            call_command("seed", "--members", "30", stdout=StringIO())
+        self.assertEqual(Client.objects.count(), 30)
+
+        # a second run continues the membership numbers and repeats the same members
+        call_command("seed", "--members", "30", "--years", "2", "--seed", "7", "--records", "200",
+                     "--batch-size", "8", "--force", stdout=StringIO())
+        second = list(Client.objects.order_by("pk").values_list("name", "rank", "subscription_date")[30:])
+        self.assertEqual(second, first)
+        self.assertEqual(Client.objects.order_by("-membership_number").first().membership_number, 60)
+
+
+class QueryProfilingTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username="admin", password="admin")
+        for index in range(1, 4):
+            create_client(index, date(2024, 1, 1))
+
+    def setUp(self):
+        clear_cache()
+        self.api = APIClient()
+        self.api.force_authenticate(self.user)
+
+    def test_disabled_by_default(self):
+        response = self.api.get("/api/clients/clients/")
+
+        self.assertNotIn("X-Query-Count", response)
+        self.assertNotIn("Server-Timing", response)
+
+    @override_settings(SQL_PROFILING=True, DEBUG=False)
+    def test_headers_and_log_line(self):
+        with self.assertLogs("association.profiling", "INFO") as logs, \
+                CaptureQueriesContext(connection) as queries:
+            response = self.api.get("/api/clients/clients/")
+
+        self.assertEqual(response["X-Query-Count"], str(len(queries)))
+        self.assertRegex(response["Server-Timing"],
+                         rf'^sql;dur=[\d.]+;desc="{len(queries)} queries", app;dur=[\d.]+, total;dur=[\d.]+$')
+        line = json.loads(logs.records[0].getMessage())
+        self.assertEqual((line["view"], line["status"], line["queries"]), ("client-list", 200, len(queries)))
+        self.assertIn(line["slowest"], [query["sql"] for query in queries])
+        self.assertEqual(line["duplicates"], [])
+
+    def test_duplicate_fingerprints(self):
+        profile = QueryProfile()
+        with profile.profile():
+            for client in Client.objects.order_by("pk"):
+                Subscription.objects.filter(client=client).exists()
+            list(Client.objects.filter(pk__in=[1, 2]))
+            list(Client.objects.filter(pk__in=[1, 2, 3]))
+
+        self.assertEqual(profile.count, 6)
+        (subscriptions, three), (clients, two) = profile.duplicates().items()
+        self.assertEqual((three, two), (3, 2))
+        self.assertIn('"financials_subscription"', subscriptions)
+        self.assertIn('"clients_client"."id" IN (...)', clients)
+        self.assertEqual(profile.duplicates(threshold=3), {subscriptions: 3})
+
+    @override_settings(SQL_PROFILING=True, SLOW_QUERY_LOG_MIN_MS=0, SLOW_QUERY_LOG_SIZE=3)
+    def test_slow_query_log(self):
+        get_slow_query_log().clear()
+        with self.assertLogs("association.profiling", "INFO"):
+            self.api.get("/api/clients/clients/", {"search": "عضو"})
+            self.api.get("/api/clients/clients/", {"search": "عضو", "page": 1})
+            self.api.get("/api/clients/workentities/")
+            self.api.get("/api/clients/clients/1/")
+
+        with self.assertLogs("association.profiling", "INFO"):
+            response = self.api.get("/api/admin/slow-queries/", {"explain": 1})
+        self.assertEqual(response.status_code, 403)
+
+        self.user.is_superuser = True
+        self.user.save()
+        with self.assertLogs("association.profiling", "INFO"):
+            response = self.api.get("/api/admin/slow-queries/", {"explain": 1})
+        data = response.data["data"]
+        self.assertEqual(len(data), 3)
+        self.assertEqual([entry["slowest_ms"] for entry in data],
+                         sorted([entry["slowest_ms"] for entry in data], reverse=True))
+        client_list = [entry for entry in data if entry["view"] == "client-list"]
+        self.assertTrue(client_list)
+        self.assertEqual(client_list[0]["request_params"]["search"], "عضو")
+        select = next(entry for entry in data if entry["sql"].startswith("SELECT"))
+        self.assertTrue(select["plan"])
+
+        with self.assertLogs("association.profiling", "INFO"):
+            self.assertEqual(self.api.delete("/api/admin/slow-queries/").status_code, 204)
+        self.assertEqual(get_slow_query_log().entries(), [])
+
+    def test_slow_query_log_file_is_shared(self):
+        # explicit timings, the slowest of two real runs of the same statement is not deterministic
+        profile = QueryProfile()
+        profile.record('SELECT * FROM "clients_client"', (), 0.01)
+        profile.record('SELECT * FROM "clients_client" WHERE "id" IN (%s, %s)', (1, 2), 0.03)
+        profile.record('SELECT * FROM "clients_client" WHERE "id" IN (%s, %s)', (2, 3), 0.02)
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = f"{directory}/slow.sqlite3"
+            SlowQueryLog(size=10, min_ms=0, path=path).add(profile, "client-list", QueryDict("page=1"))
+            SlowQueryLog(size=10, min_ms=0, path=path).add(profile, "client-detail", QueryDict())
+
+            entries = SlowQueryLog(size=1, min_ms=0, path=path).entries()
+            self.assertEqual(len(entries), 1)
+            entries = SlowQueryLog(size=10, min_ms=0, path=path).entries()
+        self.assertEqual(sorted(entry["count"] for entry in entries), [2, 4])
+        self.assertEqual(next(entry for entry in entries if entry["count"] == 4)["params"], [1, 2])
@@ -0,0 +1,68 @@
+from django.core.exceptions import ValidationError
+
+
+class OriginalValuesMixin:
+    """
+    model mixin remembering the field values as loaded from (or last saved to)
+    the database, so signals can compare against the old state without
+    re-reading the row and updates can write only the changed columns.
+    """
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
+
+    @property
+    def original_values(self):
+        """
+        attname -> value as loaded or last saved, empty for unsaved instances
+        """
+        return dict(getattr(self, "_loaded_values", {}))
+
+    @property
+    def changed_fields(self):
+        """
+        names of the loaded fields whose value differs from the loaded one
+        """
+        loaded = getattr(self, "_loaded_values", {})
+        return [
+            field.name for field in self._meta.concrete_fields
+            if field.attname in loaded and not self._same_value(field, getattr(self, field.attname),
+                                                                 loaded[field.attname])
+        ]
+
+    @staticmethod
+    def _same_value(field, value, original):
+        if value == original:
+            return True
+        # values assigned from request data, e.g. "50.00" for a decimal field
+        try:
+            return field.to_python(value) == original
+        except ValidationError:
+            return False
+
+    def save_changed(self, *extra_fields):
+        """
+        save only the changed fields (plus `extra_fields`), returns False when there was nothing to save
+        """
+        update_fields = [*self.changed_fields, *extra_fields]
+        if self._state.adding:
+            self.save()
+        elif update_fields:
+            self.save(update_fields=update_fields)
+        else:
+            return False
+        return True
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+
+        update_fields = kwargs.get("update_fields")
+        fields = self._meta.concrete_fields
+        if update_fields is not None:
+            fields = [field for field in fields if field.name in update_fields or field.attname in update_fields]
+
+        self._loaded_values = {**getattr(self, "_loaded_values", {}),
+                               **{field.attname: getattr(self, field.attname) for field in fields}}
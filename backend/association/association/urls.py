@@ -3,6 +3,8 @@ from django.contrib import admin
 from django.urls import path, include
 from django.conf.urls.static import static
 
+from .slow_queries import slow_queries
+
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/', include([
@@ -11,6 +13,7 @@ urlpatterns = [
         path('clients/', include('clients.urls')),
         path('financials/', include('financials.urls')),
         path('projects/', include('projects.urls')),
+        path('admin/slow-queries/', slow_queries, name='slow-queries'),
     ])),
 ]
 
@@ -1,6 +1,8 @@
 from datetime import date
 import re
 
+from django.db import connections
+
 
 def calculate_age(born):
     today = date.today()
@@ -12,3 +14,23 @@ def clean_excel_name(name: str, max_len: int = 31) -> str:
     name = re.sub(r'[\x00-\x1f<>:"/\\|?*\[\]]', '', name)
     name = name.replace('\u202A', '').replace('\u202B', '').replace('\u200F', '')
     return name[:max_len]
+
+
+def delete_rows(queryset):
+    """
+    delete the rows of `queryset` with a single DELETE statement, returns the
+    number of deleted rows.
+
+    bypasses what `QuerySet.delete()` does per row: no pre/post_delete signals,
+    no on_delete handling of the rows referencing them and no Model.delete().
+    the caller deletes the related rows and redoes the signals' work itself.
+    """
+    model = queryset.model
+    connection = connections[queryset.db]
+    pk_sql, params = queryset.order_by().values("pk").query.sql_with_params()
+    quote = connection.ops.quote_name
+    with connection.cursor() as cursor:
+        # the subquery is wrapped in a derived table, MySQL refuses a DELETE reading its own table
+        cursor.execute(f"DELETE FROM {quote(model._meta.db_table)} WHERE {quote(model._meta.pk.column)} IN "
+                       f"(SELECT * FROM ({pk_sql}) AS pks)", params)
+        return cursor.rowcount
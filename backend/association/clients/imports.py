@@ -0,0 +1,199 @@
+from datetime import datetime
+from decimal import Decimal
+
+import openpyxl
+from django.db import transaction
+from rest_framework import serializers
+from rest_framework.validators import UniqueValidator
+
+from association.rest_framework_utils.fields import RegistryPrimaryKeyRelatedField
+from financials.dues import refresh_client_dues
+from financials.models import Installment
+from financials.schedules import build_schedule
+from . import stats
+from .models import Client
+from .registry import work_entities
+from .resourses import fieldLabels
+from .search import index_clients
+from .serializers import ClientWriteSerializer
+
+IMPORT_BATCH_SIZE = 500
+
+# import only columns, next to the export labels of clients.resourses
+importLabels = {
+    "subscription_fee": "رسوم الاشتراك",
+    "prepaid": "المدفوع مقدما",
+    "installments_count": "عدد الأقساط",
+    "payment_start_date": "تاريخ بداية الأقساط",
+}
+
+IMPORT_FIELDS = (
+    "name", "rank", "national_id", "birth_date", "residence", "phone_number", "membership_type", "work_entity",
+    "membership_number", "subscription_date", "marital_status", "graduation_year", "class_rank", "notes",
+    "is_active", *importLabels,
+)
+
+ACTIVE_LABELS = {"في الخدمة": True, "متقاعد": False}
+
+
+class ClientImportSerializer(ClientWriteSerializer):
+    """
+    ClientWriteSerializer without the per-row unique queries, the importer checks
+    uniqueness against preloaded sets
+    """
+    work_entity = RegistryPrimaryKeyRelatedField(work_entities, allow_null=True, required=False)
+
+    class Meta(ClientWriteSerializer.Meta):
+        validators = []
+
+    def get_fields(self):
+        fields = super().get_fields()
+        for field in fields.values():
+            field.validators = [validator for validator in field.validators
+                                if not isinstance(validator, UniqueValidator)]
+        return fields
+
+
+def _column_fields(header):
+    labels = {**{label: field for field, label in fieldLabels.items()},
+              **{label: field for field, label in importLabels.items()}}
+    columns = {}
+    for index, title in enumerate(header):
+        title = str(title or "").strip()
+        field = title if title in IMPORT_FIELDS else labels.get(title)
+        if field in IMPORT_FIELDS:
+            columns[index] = field
+    return columns
+
+
+def _cell(value):
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    if isinstance(value, str):
+        return value.strip() or None
+    return value
+
+
+def _row_data(row, columns):
+    data = {field: _cell(row[index]) for index, field in columns.items() if index < len(row)}
+    data = {field: value for field, value in data.items() if value is not None}
+
+    if "is_active" in data and data["is_active"] in ACTIVE_LABELS:
+        data["is_active"] = ACTIVE_LABELS[data["is_active"]]
+    if "work_entity" in data:
+        entities = work_entities.filter(name=str(data["work_entity"]))
+        data["work_entity"] = entities[0].pk if entities else data["work_entity"]
+    data.setdefault("prepaid", Decimal(0))
+    return data
+
+
+class ClientImporter:
+    """
+    validate and insert the members of an .xlsx roster in batches. the sheet is
+    read row by row (openpyxl read_only mode) and unique fields are checked
+    against sets loaded once, so memory and queries don't grow with each row.
+    """
+
+    def __init__(self, user=None, batch_size=IMPORT_BATCH_SIZE):
+        self.user = user
+        self.batch_size = batch_size
+        self.created = 0
+        self.errors = []
+
+        self.serializer = ClientImportSerializer(context={"request": None})
+        self.national_ids = set(Client.objects.values_list("national_id", flat=True))
+        self.phone_numbers = set(Client.objects.values_list("phone_number", flat=True))
+        self.membership_numbers = set(Client.objects.values_list("membership_number", flat=True))
+        self.seniorities = set(Client.objects.values_list("graduation_year", "class_rank"))
+
+    def run(self, file):
+        workbook = openpyxl.load_workbook(file, read_only=True, data_only=True)
+        try:
+            rows = workbook.active.iter_rows(values_only=True)
+            columns = _column_fields(next(rows, ()))
+            missing = {"name", "national_id", "membership_number"} - set(columns.values())
+            if missing:
+                self.errors.append({"row": 1, "errors": {field: ["عمود غير موجود"] for field in sorted(missing)}})
+                return self
+
+            batch = []
+            for row_number, row in enumerate(rows, start=2):
+                if not any(value not in (None, "") for value in row):
+                    continue
+                validated = self.validate(row_number, _row_data(row, columns))
+                if validated is not None:
+                    batch.append(validated)
+                if len(batch) >= self.batch_size:
+                    self.write(batch)
+                    batch = []
+            self.write(batch)
+        finally:
+            workbook.close()
+        return self
+
+    def validate(self, row_number, data):
+        try:
+            validated = self.serializer.run_validation(data)
+        except serializers.ValidationError as error:
+            self.errors.append({"row": row_number, "errors": error.detail})
+            return None
+
+        duplicates = {}
+        for field, seen in (("national_id", self.national_ids), ("phone_number", self.phone_numbers),
+                            ("membership_number", self.membership_numbers)):
+            if validated[field] in seen:
+                duplicates[field] = [str(Client._meta.get_field(field).error_messages["unique"])]
+        if (validated["graduation_year"], validated["class_rank"]) in self.seniorities:
+            duplicates["class_rank"] = [str(ClientWriteSerializer.Meta.validators[0].message)]
+        if duplicates:
+            self.errors.append({"row": row_number, "errors": duplicates})
+            return None
+
+        self.national_ids.add(validated["national_id"])
+        self.phone_numbers.add(validated["phone_number"])
+        self.membership_numbers.add(validated["membership_number"])
+        self.seniorities.add((validated["graduation_year"], validated["class_rank"]))
+        return validated
+
+    def write(self, batch):
+        if not batch:
+            return
+
+        plans = []
+        clients = []
+        for data in batch:
+            data = dict(data)
+            plans.append((data.pop("installments_count", None), data.pop("payment_start_date", None)))
+            clients.append(Client(**data, created_by=self.user))
+
+        with transaction.atomic():
+            clients = Client.objects.bulk_create(clients)
+
+            installments = []
+            for client, (installments_count, payment_start_date) in zip(clients, plans):
+                remaining = client.subscription_fee - (client.prepaid or 0)
+                if client.subscription_fee > 0 and remaining > 0:
+                    start_date = payment_start_date or client.subscription_date
+                    installments += build_schedule(Installment, remaining, installments_count, start_date,
+                                                   client=client)
+            Installment.objects.bulk_create(installments, batch_size=self.batch_size)
+
+            # bulk_create skips the signals maintaining these
+            index_clients(clients)
+            refresh_client_dues([client.pk for client in clients])
+
+        stats.invalidate_for(Client)
+        stats.invalidate_for(Installment)
+        self.created += len(clients)
+
+    def report(self):
+        return {"created": self.created, "errors": self.errors}
+
+
+def import_clients(file, user=None, batch_size=IMPORT_BATCH_SIZE):
+    """
+    import the members of an .xlsx file, returns {"created": count, "errors": [{"row", "errors"}]}
+    """
+    return ClientImporter(user, batch_size).run(file).report()
@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from clients.imports import IMPORT_BATCH_SIZE, import_clients
+from users.models import User
+
+
+class Command(BaseCommand):
+    help = "Import members from an .xlsx file, reporting the rows that could not be imported"
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="path of the .xlsx file")
+        parser.add_argument("--batch-size", type=int, default=IMPORT_BATCH_SIZE,
+                            help="members inserted per transaction")
+        parser.add_argument("--user", help="username recorded as the creator of the imported members")
+
+    def handle(self, *args, **options):
+        user = None
+        if options["user"]:
+            user = User.objects.filter(username=options["user"]).first()
+            if user is None:
+                raise CommandError(f"User {options['user']} does not exist")
+
+        with open(options["path"], "rb") as file:
+            report = import_clients(file, user=user, batch_size=options["batch_size"])
+
+        for error in report["errors"]:
+            self.stdout.write(f"row {error['row']}: {error['errors']}")
+
+        self.stdout.write(self.style.SUCCESS(f"Imported {report['created']} members."))
+        if report["errors"]:
+            self.stdout.write(self.style.WARNING(f"{len(report['errors'])} rows were skipped."))
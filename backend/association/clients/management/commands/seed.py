@@ -0,0 +1,45 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from association.synthetic import SyntheticDataset
+from clients.models import Client
+from financials.models import FinancialRecord
+from users.models import User
+
+
+class Command(BaseCommand):
+    help = "Generate a deterministic synthetic dataset of members, their payments, loans, projects and records"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--members", type=int, default=1000)
+        parser.add_argument("--years", type=int, default=3, help="years of payment history")
+        parser.add_argument("--seed", type=int, default=0, help="random seed, the same seed gives the same data")
+        parser.add_argument("--records", type=int, help="financial records, 10 per member by default")
+        parser.add_argument("--projects", type=int, help="projects, one per 500 members by default")
+        parser.add_argument("--batch-size", type=int, default=5000)
+        parser.add_argument("--user", help="username recorded as the creator of the generated rows")
+        parser.add_argument("--force", action="store_true",
+                            help="seed a database that already has data, its balances, rollups, dues and search "
+                                 "index are rebuilt from all the rows")
+
+    def handle(self, *args, **options):
+        if not options["force"] and (Client.objects.exists() or FinancialRecord.objects.exists()):
+            raise CommandError("The database already has data, seeding rebuilds its balances, rollups, dues and "
+                               "search index. Pass --force to seed it anyway.")
+
+        user = None
+        if options["user"]:
+            user = User.objects.filter(username=options["user"]).first()
+            if user is None:
+                raise CommandError(f"User {options['user']} does not exist")
+
+        started = time.perf_counter()
+        counts = SyntheticDataset(members=options["members"], years=options["years"], records=options["records"],
+                                  projects=options["projects"], seed=options["seed"], user=user,
+                                  batch_size=options["batch_size"]).generate()
+
+        for label, count in counts.items():
+            self.stdout.write(f"{label}: {count}")
+        self.stdout.write(self.style.SUCCESS(f"Created {sum(counts.values())} rows in "
+                                             f"{time.perf_counter() - started:.1f}s."))
@@ -0,0 +1,65 @@
+# Generated by Django 5.2 on 2026-10-18 16:48
+
+import re
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+# frozen copy of clients.search.search_tokens as of this migration, later
+# changes to the tokenizer must not change what this migration writes
+_DIACRITICS = re.compile(r"[\u0610-\u061a\u064b-\u065f\u0670\u06d6-\u06ed\u0640]")
+
+_LETTERS = str.maketrans({
+    "أ": "ا",
+    "إ": "ا",
+    "آ": "ا",
+    "ٱ": "ا",
+    "ة": "ه",
+    "ى": "ي",
+    "ؤ": "و",
+    "ئ": "ي",
+    **{chr(0x0660 + digit): str(digit) for digit in range(10)},
+    **{chr(0x06f0 + digit): str(digit) for digit in range(10)},
+})
+
+
+def search_tokens(text):
+    text = _DIACRITICS.sub("", str(text or "")).translate(_LETTERS).lower()
+    return list(dict.fromkeys(re.findall(r"\w+", text)))
+
+
+def index_existing_clients(apps, schema_editor):
+    Client = apps.get_model("clients", "Client")
+    ClientSearchToken = apps.get_model("clients", "ClientSearchToken")
+
+    tokens = []
+    for client in Client.objects.only("id", "name", "membership_number", "national_id", "phone_number").iterator():
+        for field in ("name", "membership_number", "national_id", "phone_number"):
+            for token in search_tokens(getattr(client, field)):
+                tokens.append(ClientSearchToken(client_id=client.pk, field=field, token=token[:255]))
+    ClientSearchToken.objects.bulk_create(tokens, batch_size=2000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clients', '0014_rename_prepaid_amount_temp_client_prepaid'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ClientSearchToken',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('field', models.CharField(choices=[('name', 'الاسم'), ('membership_number', 'رقم العضوية'), ('national_id', 'الرقم القومي'), ('phone_number', 'رقم الهاتف')], max_length=20, verbose_name='الحقل')),
+                ('token', models.CharField(max_length=255, verbose_name='الكلمة')),
+                ('client', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='search_tokens', to='clients.client', verbose_name='العضو')),
+            ],
+            options={
+                'verbose_name': 'كلمة بحث',
+                'verbose_name_plural': 'كلمات البحث',
+                'indexes': [models.Index(fields=['field', 'token'], name='clients_search_field_token')],
+            },
+        ),
+        migrations.RunPython(index_existing_clients, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2 on 2026-10-18 17:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clients', '0015_clientsearchtoken'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='client',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['subscription_date'], name='clients_client_active'),
+        ),
+    ]
@@ -4,11 +4,12 @@ from django.db import models
 from django.db.models import RestrictedError
 from django.utils.translation import gettext_lazy as _
 
+from association.tracking import OriginalValuesMixin
 from users.models import User
 from datetime import date, datetime
 
 
-class WorkEntity(models.Model):
+class WorkEntity(OriginalValuesMixin, models.Model):
     name = models.CharField(
         max_length=100,
         verbose_name=_("جهة العمل"),
@@ -48,7 +49,19 @@ class RankChoices(models.TextChoices):
     ASSISTANT_MINISTER = "لواء مساعد وزير", _("لواء مساعد وزير")
 
 
-class Client(models.Model):
+def membership_age(birth_date):
+    """Return age in whole years, rounded up if more than exact year difference."""
+    today = date.today()
+    years = today.year - birth_date.year
+    months = today.month - birth_date.month
+    days = today.day - birth_date.day
+
+    if months > 6 or (months == 6 and days > 1):
+        return years + 1
+    return years
+
+
+class Client(OriginalValuesMixin, models.Model):
     name = models.CharField(
         max_length=255,
         verbose_name=_("الاسم"),
@@ -166,18 +179,14 @@ class Client(models.Model):
     class Meta:
         verbose_name = _("عميل")
         verbose_name_plural = _("العملاء")
+        # partial rather than (is_active, subscription_date): the boolean filter is rendered as a bare
+        # `WHERE "is_active"` on SQLite, which can match an index condition but not seek an index column
+        indexes = [models.Index(fields=["subscription_date"], condition=models.Q(is_active=True),
+                                name="clients_client_active")]
 
     @property
     def age(self):
-        """Return age in whole years, rounded up if more than exact year difference."""
-        today = date.today()
-        years = today.year - self.birth_date.year
-        months = today.month - self.birth_date.month
-        days = today.day - self.birth_date.day
-
-        if months > 6 or (months == 6 and days > 1):
-            return years + 1
-        return years
+        return membership_age(self.birth_date)
 
     def get_seniority(self):
         return f"{self.graduation_year}/{self.class_rank}"
@@ -201,3 +210,33 @@ class Client(models.Model):
 
     def __str__(self):
         return f"{self.get_rank_display()} {self.name} - {self.membership_number}"
+
+
+class ClientSearchToken(models.Model):
+    """
+    normalized search tokens of a client, maintained by clients.signals and
+    queried through clients.search
+    """
+
+    class Field(models.TextChoices):
+        NAME = "name", _("الاسم")
+        MEMBERSHIP_NUMBER = "membership_number", _("رقم العضوية")
+        NATIONAL_ID = "national_id", _("الرقم القومي")
+        PHONE_NUMBER = "phone_number", _("رقم الهاتف")
+
+    client = models.ForeignKey(
+        Client,
+        on_delete=models.CASCADE,
+        related_name="search_tokens",
+        verbose_name=_("العضو"),
+    )
+    field = models.CharField(max_length=20, choices=Field.choices, verbose_name=_("الحقل"))
+    token = models.CharField(max_length=255, verbose_name=_("الكلمة"))
+
+    class Meta:
+        verbose_name = _("كلمة بحث")
+        verbose_name_plural = _("كلمات البحث")
+        indexes = [models.Index(fields=["field", "token"], name="clients_search_field_token")]
+
+    def __str__(self):
+        return f"{self.field}: {self.token}"
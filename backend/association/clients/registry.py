@@ -0,0 +1,4 @@
+from association.registry import ReferenceRegistry
+from .models import WorkEntity
+
+work_entities = ReferenceRegistry(WorkEntity)
@@ -0,0 +1,155 @@
+import re
+from functools import reduce
+from operator import or_
+
+from django.db.models import Q, Count, Max, Case, When, Value, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from .models import Client, ClientSearchToken
+
+# search_type values sent by the frontend mapped to indexed fields
+SEARCH_FIELDS = {
+    "name__icontains": ClientSearchToken.Field.NAME,
+    "name": ClientSearchToken.Field.NAME,
+    "membership_number": ClientSearchToken.Field.MEMBERSHIP_NUMBER,
+    "national_id": ClientSearchToken.Field.NATIONAL_ID,
+    "phone_number": ClientSearchToken.Field.PHONE_NUMBER,
+}
+
+MAX_SEARCH_TERMS = 5
+
+# upper bound for prefix range lookups, sorts after every other code point
+_PREFIX_END = "\U0010ffff"
+
+_DIACRITICS = re.compile(r"[\u0610-\u061a\u064b-\u065f\u0670\u06d6-\u06ed\u0640]")
+
+_LETTERS = str.maketrans({
+    "أ": "ا",
+    "إ": "ا",
+    "آ": "ا",
+    "ٱ": "ا",
+    "ة": "ه",
+    "ى": "ي",
+    "ؤ": "و",
+    "ئ": "ي",
+    **{chr(0x0660 + digit): str(digit) for digit in range(10)},  # Arabic-Indic digits
+    **{chr(0x06f0 + digit): str(digit) for digit in range(10)},  # Persian digits
+})
+
+
+def normalize_arabic(text) -> str:
+    """
+    fold hamza/alef, taa marbuta and alef maksura variants, drop diacritics
+    and tatweel and convert Arabic digits, so spelling variants match
+    """
+    text = _DIACRITICS.sub("", str(text or ""))
+    return text.translate(_LETTERS).lower()
+
+
+def search_tokens(text) -> list[str]:
+    tokens = re.findall(r"\w+", normalize_arabic(text))
+    return list(dict.fromkeys(tokens))
+
+
+def client_tokens(client: Client) -> list[ClientSearchToken]:
+    values = {
+        ClientSearchToken.Field.NAME: client.name,
+        ClientSearchToken.Field.MEMBERSHIP_NUMBER: client.membership_number,
+        ClientSearchToken.Field.NATIONAL_ID: client.national_id,
+        ClientSearchToken.Field.PHONE_NUMBER: client.phone_number,
+    }
+    return [
+        ClientSearchToken(client_id=client.pk, field=field, token=token[:255])
+        for field, value in values.items()
+        for token in search_tokens(value)
+    ]
+
+
+def index_clients(clients):
+    """
+    replace the search tokens of the given clients
+    """
+    clients = list(clients)
+    ClientSearchToken.objects.filter(client__in=[client.pk for client in clients]).delete()
+    ClientSearchToken.objects.bulk_create([token for client in clients for token in client_tokens(client)])
+
+
+def rebuild_search_index(batch_size=2000):
+    """
+    rebuild the search tokens of every client, returns the number of indexed clients
+    """
+    ClientSearchToken.objects.all().delete()
+
+    count = 0
+    batch = []
+    fields = ("id", "name", "membership_number", "national_id", "phone_number")
+    for client in Client.objects.only(*fields).iterator(chunk_size=batch_size):
+        batch.extend(client_tokens(client))
+        count += 1
+        if len(batch) >= batch_size:
+            ClientSearchToken.objects.bulk_create(batch)
+            batch = []
+
+    ClientSearchToken.objects.bulk_create(batch)
+    return count
+
+
+def _prefix(term):
+    return Q(token__gte=term, token__lt=term + _PREFIX_END)
+
+
+def search_clients(queryset, search, search_type="name__icontains", rank=False):
+    """
+    filter a Client queryset to clients whose `search_type` field has a token
+    starting with every search term. with `rank`, annotates `search_rank`,
+    the number of terms matching a whole token
+    """
+    if rank:
+        # every result carries search_rank, also the ones of unindexed fields
+        queryset = queryset.annotate(search_rank=search_rank(search, search_type))
+
+    field = SEARCH_FIELDS.get(search_type)
+    if field is None:
+        try:
+            return queryset.filter(**{search_type: search})
+        except ValueError:
+            return queryset
+
+    terms = search_tokens(search)[:MAX_SEARCH_TERMS]
+    if not terms:
+        return queryset.none()
+
+    matches = (
+        ClientSearchToken.objects.filter(field=field)
+        .filter(reduce(or_, [_prefix(term) for term in terms]))
+        .values("client")
+        .annotate(**{
+            f"term_{i}": Max(Case(When(_prefix(term), then=Value(1)), default=Value(0)))
+            for i, term in enumerate(terms)
+        })
+        .filter(**{f"term_{i}": 1 for i in range(len(terms))})
+    )
+
+    return queryset.filter(pk__in=matches.values("client"))
+
+
+def search_rank(search, search_type="name__icontains", client=OuterRef("pk")):
+    """
+    expression counting the search terms that match a whole token of the
+    client's `search_type` field, order by it descending to list the client
+    typed in full (e.g. membership number 12 before 120) first. `client`
+    refers to the client of the outer query, e.g. OuterRef("client_id")
+    """
+    field = SEARCH_FIELDS.get(search_type)
+    terms = search_tokens(search)[:MAX_SEARCH_TERMS]
+    if field is None or not terms:
+        return Value(0)
+
+    exact = (
+        ClientSearchToken.objects.filter(client=client, field=field, token__in=terms)
+        .order_by()
+        .values("client")
+        .annotate(total=Count("token", distinct=True))
+        .values("total")
+    )
+    return Coalesce(Subquery(exact, output_field=IntegerField()), Value(0))
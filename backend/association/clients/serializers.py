@@ -4,8 +4,10 @@ from django.db import transaction
 from rest_framework import serializers
 
 from .models import Client, WorkEntity
-from financials.models import RankFee, Installment, Repayment
-from dateutil.relativedelta import relativedelta
+from .registry import work_entities
+from financials.models import Installment
+from financials.registry import rank_fees
+from financials.schedules import create_schedule
 
 
 class WorkEntitySerializer(serializers.ModelSerializer):
@@ -36,12 +38,11 @@ class ClientListSerializer(serializers.ModelSerializer):
         return obj.get_seniority()
 
     def get_dues(self, obj: Client):
-        due_months, paid_subscriptions = obj.get_subscriptions_status()
-        unpaid_installments = obj.installments.filter(status=Installment.Status.UNPAID).count()
-        unpaid_repayments = Repayment.objects.filter(status=Repayment.Status.UNPAID, loan__client=obj).count()
-        return {"unpaid_subscriptions": max(due_months - paid_subscriptions, 0),
-                "unpaid_installments": unpaid_installments,
-                "unpaid_repayments": unpaid_repayments
+        # every member has a ClientDues snapshot (kept by the signals, filled for existing members by migration)
+        snapshot = obj.dues_snapshot
+        return {"unpaid_subscriptions": snapshot.unpaid_subscriptions,
+                "unpaid_installments": snapshot.unpaid_installments,
+                "unpaid_repayments": snapshot.unpaid_repayments
                 }
 
 
@@ -49,7 +50,7 @@ class ClientReadSerializer(serializers.ModelSerializer):
     created_at = serializers.SerializerMethodField()
     created_by = serializers.StringRelatedField(source="created_by.name")
     seniority = serializers.SerializerMethodField()
-    work_entity = serializers.StringRelatedField(source="work_entity.name")
+    work_entity = serializers.SerializerMethodField()
     age = serializers.SerializerMethodField()
     rank_fee = serializers.SerializerMethodField()
 
@@ -66,8 +67,13 @@ class ClientReadSerializer(serializers.ModelSerializer):
     def get_seniority(self, obj: Client):
         return obj.get_seniority()
 
+    def get_work_entity(self, obj: Client):
+        if obj.work_entity_id is None:
+            return None
+        return work_entities.get(pk=obj.work_entity_id).name
+
     def get_rank_fee(self, obj: Client):
-        return RankFee.objects.get(rank=obj.rank).fee
+        return rank_fees.get(rank=obj.rank).fee
 
     def get_unpaid_subscriptions(self, obj: Client):
         return obj.get_subscriptions_status()
@@ -194,17 +200,6 @@ class ClientWriteSerializer(serializers.ModelSerializer):
         client = super().create({**validated_data, "created_by": user})
 
         if subscription_fee > 0 and prepaid < subscription_fee:
-            remaining = subscription_fee - prepaid
-            installment_amount = remaining / installments_count
-            payment_start_date = payment_start_date.replace(day=1)
-
-            for i in range(installments_count):
-                due_date = payment_start_date + relativedelta(months=i)
-                Installment.objects.create(
-                    amount=installment_amount,
-                    client=client,
-                    installment_number=i + 1,
-                    due_date=due_date,
-                )
+            create_schedule(Installment, client, subscription_fee - prepaid, installments_count, payment_start_date)
 
         return client
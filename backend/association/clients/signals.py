@@ -0,0 +1,25 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from . import stats
+from .models import Client
+from .registry import work_entities  # noqa, connects the registry invalidation signals
+from .search import SEARCH_FIELDS, index_clients
+
+
+# keep the search index current
+@receiver(post_save, sender=Client)
+def index_client_on_save(sender, instance: Client, update_fields=None, **kwargs):
+    if update_fields is not None and not set(update_fields) & set(SEARCH_FIELDS.values()):
+        return
+    index_clients([instance])
+
+
+# drop the cached dashboard sections computed from the changed table
+def invalidate_dashboard_stats(sender, **kwargs):
+    stats.invalidate_for(sender)
+
+
+for model in stats.MODEL_SECTIONS:
+    post_save.connect(invalidate_dashboard_stats, sender=model, dispatch_uid=f"dashboard-stats-{model.__name__}")
+    post_delete.connect(invalidate_dashboard_stats, sender=model, dispatch_uid=f"dashboard-stats-{model.__name__}")
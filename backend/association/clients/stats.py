@@ -0,0 +1,255 @@
+from datetime import datetime
+
+from dateutil.relativedelta import relativedelta
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, Sum, Value, CharField, Q, ExpressionWrapper, F, Case, When, IntegerField
+from django.db.models.functions import TruncMonth, ExtractYear, ExtractMonth, Concat
+
+from financials.models import Installment, Subscription, FinancialRecord, TransactionType, Loan
+from financials.registry import transaction_types
+from financials.rollups import financial_totals
+from .models import Client, WorkEntity, RankChoices
+
+# safety net for writes that bypass model signals (queryset.update, bulk_create, raw sql)
+STATS_TTL = 60 * 10
+
+CACHE_PREFIX = "dashboard-stats"
+
+
+def _now():
+    return datetime.now().astimezone(settings.CAIRO_TZ)
+
+
+def _period():
+    """
+    sections are computed relative to the current month, so it is part of the cache key
+    """
+    return f"{settings.CAIRO_TZ.zone}:{_now():%Y-%m}"
+
+
+def _cache_key(section):
+    return f"{CACHE_PREFIX}:{section}:{_period()}"
+
+
+# ---------- sections ----------
+
+def members_stats():
+    ranks = Client.objects.values("rank").annotate(total=Count("id")).order_by()
+    rank_dict = {r["rank"]: r["total"] for r in ranks}
+
+    activity = Client.objects.values("is_active").annotate(total=Count("id")).order_by()
+    active_dict = {a["is_active"]: a["total"] for a in activity}
+
+    return {
+        "rank_counts": [{"rank": choice.value, "العدد": rank_dict.get(choice.value, 0)} for choice in RankChoices],
+        "active_status": [
+            {"name": "بالخدمة", "value": active_dict.get(True, 0)},
+            {"name": "متقاعد", "value": active_dict.get(False, 0)},
+        ],
+        "entities_count": list(WorkEntity.objects.annotate(count=Count("client")).values("name", "id", "count")),
+    }
+
+
+def subscription_growth_stats():
+    start_date = (_now().date() - relativedelta(months=6)).replace(day=1)
+
+    month_totals = (Subscription.objects.filter(date__gte=start_date)
+                    .annotate(month=TruncMonth("date"))
+                    .annotate(month=Concat(ExtractYear("month"), Value("-"), ExtractMonth("month"),
+                                           output_field=CharField()))
+                    .values("month").annotate(اشتراكات=Sum("amount")).order_by("month"))
+
+    return {"month_totals": list(month_totals)}
+
+
+def records_stats():
+    today = _now().date()
+    month_start = today.replace(day=1)
+
+    # whole months only, served by the monthly rollups
+    start = (today - relativedelta(months=6)).replace(day=1)
+    totals = {TransactionType.Type.INCOME: {}, TransactionType.Type.EXPENSE: {}}
+    for row in financial_totals(start, group_by=("month", "transaction_type")):
+        kind_totals = totals[transaction_types.get(id=row["transaction_type"]).type]
+        kind_totals[row["month"]] = kind_totals.get(row["month"], 0) + row["total"]
+
+    incomes, expenses = totals[TransactionType.Type.INCOME], totals[TransactionType.Type.EXPENSE]
+    return {
+        "incomes": incomes.get(month_start, 0),
+        "expenses": expenses.get(month_start, 0),
+        "last_6_monthly_totals": [
+            {"month": month, "total_incomes": incomes.get(month), "total_expenses": expenses.get(month)}
+            for month in sorted(incomes.keys() | expenses.keys())
+        ],
+    }
+
+
+def subscriptions_stats():
+    now = _now()
+    month_start = now.date().replace(day=1)
+
+    current_month_subs = Subscription.objects.filter(
+        date__gte=month_start, date__lt=month_start + relativedelta(months=1), client__is_active=True
+    ).aggregate(total=Sum("amount"), count=Count("id"))
+    subscriptions_count = current_month_subs["count"]
+
+    due_clients = Client.objects.filter(is_active=True, subscription_date__lt=month_start).count()
+
+    subscription_stats = (Client.objects.filter(is_active=True)
+    .annotate(
+        start_year=ExtractYear("subscription_date"),
+        start_month=ExtractMonth("subscription_date"),
+    ).annotate(
+        due_months=ExpressionWrapper(
+            (now.year - F("start_year")) * 12 + (now.month - F("start_month")),
+            output_field=IntegerField(),
+        ),
+        paid=Count("subscriptions"),
+    ).annotate(
+        unpaid=ExpressionWrapper(
+            F("due_months") - F("paid"),
+            output_field=IntegerField(),
+        )
+    )).aggregate(total_paid=Sum("paid"), total_unpaid=Sum(
+        Case(
+            When(unpaid__gt=0, then=F("unpaid")),
+            default=Value(0),
+            output_field=IntegerField(),
+        )
+    ))
+
+    return {
+        "subscriptions": current_month_subs["total"] or 0,
+        "subscriptions_count": subscriptions_count,
+        "unpaid_subscriptions": max(due_clients - subscriptions_count, 0),
+        "total_paid_subscriptions": subscription_stats["total_paid"],
+        "total_unpaid_subscriptions": subscription_stats["total_unpaid"],
+    }
+
+
+def installments_stats():
+    month_start = _now().date().replace(day=1)
+    month_end = month_start + relativedelta(months=1)
+
+    current_month = Installment.objects.filter(due_date__gte=month_start, due_date__lt=month_end).aggregate(
+        paid_sum=Sum("amount", filter=Q(status=Installment.Status.PAID)),
+        paid=Count("id", filter=Q(status=Installment.Status.PAID)),
+        unpaid=Count("id", filter=Q(status=Installment.Status.UNPAID)),
+    )
+
+    till_now = Installment.objects.filter(due_date__lt=month_end).aggregate(
+        paid=Count("id", filter=Q(status=Installment.Status.PAID)),
+        unpaid=Count("id", filter=Q(status=Installment.Status.UNPAID)),
+    )
+
+    return {
+        "installments": current_month["paid_sum"] or 0,
+        "installments_count": current_month["paid"],
+        "unpaid_installments": current_month["unpaid"],
+        "total_paid_installments": till_now["paid"],
+        "total_unpaid_installments": till_now["unpaid"],
+    }
+
+
+def loans_stats():
+    month_start = _now().date().replace(day=1)
+
+    loans_sum = Loan.objects.filter(
+        issued_date__gte=month_start, issued_date__lt=month_start + relativedelta(months=1)
+    ).aggregate(total=Sum("amount"))["total"] or 0
+
+    loans_data = (Loan.objects.annotate(month=TruncMonth("issued_date")).values("month")
+                  .annotate(value=Sum("amount")).order_by("month"))
+
+    return {"loans": loans_sum, "loans_data": list(loans_data)}
+
+
+SECTIONS = {
+    "members": members_stats,
+    "subscription_growth": subscription_growth_stats,
+    "records": records_stats,
+    "subscriptions": subscriptions_stats,
+    "installments": installments_stats,
+    "loans": loans_stats,
+}
+
+# model -> sections computed from its rows
+MODEL_SECTIONS = {
+    Client: ("members", "subscriptions"),
+    WorkEntity: ("members",),
+    Subscription: ("subscription_growth", "subscriptions"),
+    FinancialRecord: ("records",),
+    TransactionType: ("records",),
+    Installment: ("installments",),
+    Loan: ("loans",),
+}
+
+
+def get_sections(names, fresh=False):
+    """
+    cached payloads of the given sections, missing (or all, if `fresh`) ones are computed and stored
+    """
+    keys = {name: _cache_key(name) for name in names}
+    cached = {} if fresh else cache.get_many(keys.values())
+
+    data, missing = {}, {}
+    for name, key in keys.items():
+        if key in cached:
+            data[name] = cached[key]
+        else:
+            data[name] = missing[key] = SECTIONS[name]()
+
+    if missing:
+        cache.set_many(missing, STATS_TTL)
+    return data
+
+
+def invalidate(*sections):
+    cache.delete_many([_cache_key(section) for section in sections])
+
+
+def invalidate_for(model):
+    """
+    drop the sections depending on `model` now and again on commit, so values
+    computed from uncommitted rows are not kept
+    """
+    sections = MODEL_SECTIONS.get(model, ())
+    if sections:
+        invalidate(*sections)
+        transaction.on_commit(lambda: invalidate(*sections))
+
+
+def home_stats(fresh=False):
+    sections = get_sections(("members", "subscription_growth"), fresh)
+    return {**sections["members"], **sections["subscription_growth"]}
+
+
+def home_financial_stats(fresh=False):
+    sections = get_sections(("records", "subscriptions", "installments", "loans"), fresh)
+    records, subscriptions = sections["records"], sections["subscriptions"]
+    installments, loans = sections["installments"], sections["loans"]
+
+    return {
+        "month_totals": {
+            "incomes": records["incomes"],
+            "expenses": records["expenses"],
+            "net": records["incomes"] - records["expenses"],
+            "subscriptions": subscriptions["subscriptions"],
+            "installments": installments["installments"],
+            "loans": loans["loans"],
+        },
+        "last_6_monthly_totals": records["last_6_monthly_totals"],
+        "subscriptions_count": subscriptions["subscriptions_count"],
+        "unpaid_subscriptions": subscriptions["unpaid_subscriptions"],
+        "installments_count": installments["installments_count"],
+        "unpaid_installments": installments["unpaid_installments"],
+        "till_now_subs_inst": {
+            "total_paid_subscriptions": subscriptions["total_paid_subscriptions"],
+            "total_paid_installments": installments["total_paid_installments"],
+            "total_unpaid_subscriptions": subscriptions["total_unpaid_subscriptions"],
+            "total_unpaid_installments": installments["total_unpaid_installments"],
+        },
+        "loans_data": loans["loans_data"],
+    }
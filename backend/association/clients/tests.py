@@ -1,3 +1,324 @@
+import json
+import tempfile
+from datetime import date, datetime
+from decimal import Decimal
+from io import BytesIO, StringIO
+
+import openpyxl
+from dateutil.relativedelta import relativedelta
+from django.conf import settings
+from django.core.management import call_command
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from financials.models import Subscription, Installment, Loan, Repayment, FinancialRecord, TransactionType
+from association.testing import clear_cache, create_client
+from users.models import User
+from .models import Client, RankChoices, WorkEntity
+from .search import normalize_arabic, search_clients
+
+
+class ClientListDuesTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username="admin", password="admin")
+        cls.work_entity = WorkEntity.objects.create(name="جهة")
+        cls.this_month = datetime.today().astimezone(settings.CAIRO_TZ).date().replace(day=1)
+
+    def setUp(self):
+        self.api = APIClient()
+        self.api.force_authenticate(self.user)
+
+    def seed(self, start, count):
+        for i in range(start, start + count):
+            client = create_client(i, self.this_month - relativedelta(months=6), work_entity=self.work_entity)
+            for months in range(1, 3):
+                Subscription.objects.create(client=client, amount=100, date=self.this_month - relativedelta(months=months))
+            Installment.objects.create(client=client, installment_number=1, due_date=self.this_month, amount=50)
+            Installment.objects.create(client=client, installment_number=2, due_date=self.this_month, amount=50,
+                                       status=Installment.Status.PAID, paid_at=self.this_month)
+            loan = Loan.objects.create(client=client, amount=300, issued_date=self.this_month)
+            for number in range(1, 4):
+                Repayment.objects.create(loan=loan, repayment_number=number, due_date=self.this_month, amount=100)
+
+    def test_dues_values(self):
+        self.seed(1, 1)
+        create_client(2, self.this_month)
+
+        response = self.api.get("/api/clients/clients/", {"page_size": 100})
+
+        dues = {row["membership_number"]: row["dues"] for row in response.data["data"]}
+        self.assertEqual(dues[1], {"unpaid_subscriptions": 4, "unpaid_installments": 1, "unpaid_repayments": 3})
+        self.assertEqual(dues[2], {"unpaid_subscriptions": 0, "unpaid_installments": 0, "unpaid_repayments": 0})
+
+    def test_list_query_count_is_constant(self):
+        self.seed(1, 5)
+        with self.assertNumQueries(2):
+            self.api.get("/api/clients/clients/", {"page_size": 100})
+
+        self.seed(6, 30)
+        with self.assertNumQueries(2):
+            response = self.api.get("/api/clients/clients/", {"page_size": 100})
+        self.assertEqual(len(response.data["data"]), 35)
+
+        with self.assertNumQueries(1):
+            self.api.get("/api/clients/clients/", {"no_pagination": "true"})
+
+    def test_filter_and_sort_by_dues(self):
+        self.seed(1, 1)
+        create_client(2, self.this_month - relativedelta(months=2))
+        create_client(3, self.this_month)
+
+        response = self.api.get("/api/clients/clients/", {"min_unpaid_subscriptions": 2, "sort_by": "dues",
+                                                          "order": "-"})
+
+        self.assertEqual([row["membership_number"] for row in response.data["data"]], [1, 2])
+
+
+class ClientSearchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username="admin", password="admin")
+        subscription_date = date(2020, 1, 1)
+        cls.ahmed = create_client(1, subscription_date)
+        cls.ahmed.name = "أحمد عبد الله إبراهيم"
+        cls.ahmed.save()
+        cls.fatma = create_client(2, subscription_date)
+        cls.fatma.name = "فاطِمة مصطفى"
+        cls.fatma.save()
+        cls.ahmedy = create_client(3, subscription_date)
+        cls.ahmedy.name = "احمدي علي"
+        cls.ahmedy.save()
+
+    def setUp(self):
+        self.api = APIClient()
+        self.api.force_authenticate(self.user)
+
+    def search(self, search, search_type="name__icontains"):
+        response = self.api.get("/api/clients/clients/", {"search": search, "search_type": search_type})
+        return [row["membership_number"] for row in response.data["data"]]
+
+    def test_normalize_arabic(self):
+        self.assertEqual(normalize_arabic("أإآى ة ـمُحَمّد ١٢٣"), "اااي ه محمد 123")
+
+    def test_spelling_variants_and_diacritics(self):
+        self.assertEqual(self.search("فاطمه"), [2])
+        self.assertEqual(self.search("ابراهيم"), [1])
+        self.assertEqual(self.search("مُصطفي"), [2])
+
+    def test_prefix_match_ranks_exact_tokens_first(self):
+        self.assertEqual(self.search("احمد"), [1, 3])
+        self.assertEqual(self.search("احمد عب"), [1])
+
+    def test_other_fields(self):
+        self.assertEqual(self.search("3", "membership_number"), [3])
+        self.assertEqual(self.search("01000000002", "phone_number"), [2])
+        self.assertEqual(self.search("abc", "membership_number"), [])
+
+    def test_whole_number_first(self):
+        for index in (120, 1200, 12):
+            client = create_client(index, date(2020, 1, 1))
+            Loan.objects.create(client=client, amount=100, issued_date=date(2021, 1, 1))
+            Installment.objects.create(client=client, installment_number=1, amount=10, due_date=date(2021, 1, 10))
+
+        self.assertEqual(self.search("12", "membership_number"), [12, 120, 1200])
+        response = self.api.get("/api/financials/get-month-subscriptions/",
+                                {"month": 1, "year": 2021, "search": "12", "search_type": "membership_number"})
+        self.assertEqual([row["membership_number"] for row in response.data["data"]], [12, 120, 1200])
+        response = self.api.get("/api/financials/get-month-installments/",
+                                {"month": 1, "year": 2021, "search": "12", "search_type": "membership_number"})
+        self.assertEqual([row["membership_number"] for row in response.data["data"]][0], 12)
+        response = self.api.get("/api/financials/loans/", {"search": "12", "search_type": "membership_number"})
+        self.assertEqual(Client.objects.get(pk=response.data["data"][0]["client"]).membership_number, 12)
+
+    def test_month_subscriptions_and_loans_search(self):
+        response = self.api.get("/api/financials/get-month-subscriptions/",
+                                {"month": 1, "year": 2021, "search": "فاطمة"})
+        self.assertEqual([row["client_id"] for row in response.data["data"]], [self.fatma.id])
+
+        Loan.objects.create(client=self.fatma, amount=100, issued_date=date(2021, 1, 1))
+        Loan.objects.create(client=self.ahmed, amount=100, issued_date=date(2021, 1, 1))
+        response = self.api.get("/api/financials/loans/", {"search": "فاطمه"})
+        self.assertEqual([row["client"] for row in response.data["data"]], [self.fatma.id])
+
+
+class ClientExportTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username="admin", password="admin")
+        work_entity = WorkEntity.objects.create(name="جهة")
+        create_client(1, date(2020, 1, 1), work_entity=work_entity)
+        create_client(2, date(2020, 1, 1), is_active=False)
+
+    def setUp(self):
+        self.api = APIClient()
+        self.api.force_authenticate(self.user)
+
+    def export(self, export_format):
+        response = self.api.get("/api/clients/clients/export/", {
+            "fields": "membership_number,name,seniority,work_entity,is_active,unknown",
+            "format": export_format,
+        })
+        self.assertEqual(response.status_code, 200)
+        return b"".join(response.streaming_content).decode("utf-8")
+
+    def test_csv_export(self):
+        lines = self.export("csv").lstrip("\ufeff").splitlines()
+
+        self.assertEqual(lines[0], "رقم العضوية,الاسم,الأقدمية,جهة العمل,الحالة")
+        self.assertEqual(sorted(lines[1:]), ["1,عضو 1,2010/1,جهة,في الخدمة", "2,عضو 2,2010/2,,متقاعد"])
+
+    def test_ndjson_export(self):
+        rows = sorted([json.loads(line) for line in self.export("ndjson").splitlines()],
+                      key=lambda row: row["membership_number"])
+
+        self.assertEqual(rows[1], {"membership_number": 2, "name": "عضو 2", "seniority": "2010/2",
+                                   "work_entity": None, "is_active": "متقاعد"})
+
+
+class DashboardStatsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username="admin", password="admin")
+        cls.manager = User.objects.create_user(username="manager", password="manager", role=User.Role.manager)
+        cls.this_month = datetime.today().astimezone(settings.CAIRO_TZ).date().replace(day=1)
+        cls.member = create_client(1, cls.this_month - relativedelta(months=3))
+        cls.income = TransactionType.objects.create(name="دخل", type=TransactionType.Type.INCOME)
+
+    def setUp(self):
+        clear_cache()
+        self.api = APIClient()
+        self.api.force_authenticate(self.user)
+
+    def financial_stats(self, **params):
+        return self.api.get("/api/clients/get-home-financial-stats/", params).data
+
+    def test_cached_until_related_rows_change(self):
+        self.api.get("/api/clients/get-home-stats/")
+        stats = self.financial_stats()
+        self.assertEqual(stats["till_now_subs_inst"]["total_unpaid_subscriptions"], 3)
+
+        with self.assertNumQueries(0):
+            self.api.get("/api/clients/get-home-stats/")
+            self.financial_stats()
+
+        Subscription.objects.create(client=self.member, amount=100, date=self.this_month)
+        with self.assertNumQueries(3):
+            stats = self.financial_stats()
+        self.assertEqual(stats["subscriptions_count"], 1)
+        self.assertEqual(stats["month_totals"]["subscriptions"], 100)
+
+        with self.assertNumQueries(1):
+            response = self.api.get("/api/clients/get-home-stats/")
+        self.assertEqual(response.data["month_totals"], [{"month": f"{self.this_month.year}-{self.this_month.month}",
+                                                          "اشتراكات": 100}])
+
+        FinancialRecord.objects.create(amount=250, transaction_type=self.income, date=self.this_month,
+                                       payment_method="نقدي")
+        self.assertEqual(self.financial_stats()["month_totals"]["incomes"], 250)
+
+    def test_fresh_is_limited_to_admins(self):
+        self.financial_stats()
+        Subscription.objects.bulk_create([Subscription(client=self.member, amount=100, date=self.this_month)])
+
+        with self.assertNumQueries(0):
+            self.assertEqual(self.financial_stats(fresh=1)["subscriptions_count"], 0)
+
+        self.api.force_authenticate(self.manager)
+        with self.assertNumQueries(8):
+            self.assertEqual(self.financial_stats(fresh=1)["subscriptions_count"], 1)
+
+
+class SwitchActiveTests(TestCase):
+    def test_only_is_active_is_written(self):
+        user = User.objects.create_user(username="admin", password="admin")
+        member = create_client(1, date(2020, 1, 1))
+        api = APIClient()
+        api.force_authenticate(user)
+
+        with CaptureQueriesContext(connection) as queries:
+            response = api.post(f"/api/clients/clients/{member.pk}/switch_active/")
+
+        self.assertEqual(response.data, {"is_active": False})
+        update = next(query["sql"] for query in queries if query["sql"].startswith('UPDATE "clients_client"'))
+        self.assertEqual(update.split(" WHERE ")[0], 'UPDATE "clients_client" SET "is_active" = 0')
+        self.assertFalse([query for query in queries if "clients_clientsearchtoken" in query["sql"]])
+
+
+class ClientImportTests(TestCase):
+    HEADER = ["الاسم", "الرتبة", "الرقم القومي", "تاريخ الميلاد", "رقم الهاتف", "رقم العضوية", "تاريخ الاشتراك",
+              "الحالة الاجتماعية", "سنة التخرج", "الترتيب على الدفعة", "جهة العمل", "رسوم الاشتراك", "عدد الأقساط",
+              "تاريخ بداية الأقساط", "الحالة", "عمود غير معروف"]
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username="admin", password="admin")
+        WorkEntity.objects.create(name="جهة")
+        create_client(1, date(2020, 1, 1))
+
+    def setUp(self):
+        clear_cache()
+        self.api = APIClient()
+        self.api.force_authenticate(self.user)
+
+    def row(self, index, **kwargs):
+        values = {
+            "name": f"عضو {index}", "rank": RankChoices.NAQIB, "national_id": f"{index:014d}",
+            "birth_date": datetime(1990, 1, 1), "phone_number": f"010{index:08d}", "membership_number": index,
+            "subscription_date": datetime(2024, 1, 1), "marital_status": "أعزب", "graduation_year": 2015,
+            "class_rank": str(index), "work_entity": "جهة", "subscription_fee": 0, "installments_count": None,
+            "payment_start_date": None, "is_active": "في الخدمة", "unknown": "x", **kwargs,
+        }
+        return list(values.values())
+
+    def workbook(self, rows):
+        workbook = openpyxl.Workbook()
+        sheet = workbook.active
+        sheet.append(self.HEADER)
+        for row in rows:
+            sheet.append(row)
+        file = BytesIO()
+        workbook.save(file)
+        file.seek(0)
+        file.name = "members.xlsx"
+        return file
+
+    def test_import_reports_invalid_rows(self):
+        file = self.workbook([
+            self.row(2, subscription_fee=1000, installments_count=3, payment_start_date=datetime(2024, 2, 1)),
+            self.row(3, national_id="00000000000001"),
+            self.row(4, membership_number=2),
+            self.row(5, rank="غير موجودة", work_entity="جهة أخرى"),
+            [None] * len(self.HEADER),
+            self.row(6, is_active="متقاعد"),
+        ])
+
+        response = self.api.post("/api/clients/clients/import/", {"file": file}, format="multipart")
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data["created"], 2)
+        errors = {error["row"]: set(error["errors"]) for error in response.data["errors"]}
+        self.assertEqual(errors, {3: {"national_id"}, 4: {"membership_number"}, 5: {"rank", "work_entity"}})
+
+        member = Client.objects.get(membership_number=2)
+        self.assertEqual(member.created_by, self.user)
+        self.assertEqual(member.work_entity.name, "جهة")
+        self.assertEqual(list(member.installments.order_by("installment_number").values_list("amount", "due_date")),
+                         [(Decimal("333.34"), date(2024, 2, 1)), (Decimal("333.33"), date(2024, 3, 1)),
+                          (Decimal("333.33"), date(2024, 4, 1))])
+        self.assertFalse(Client.objects.get(membership_number=6).is_active)
+        self.assertEqual(list(search_clients(Client.objects.all(), "6")), [Client.objects.get(membership_number=6)])
+
+    def test_import_command_in_batches(self):
+        file = self.workbook([self.row(index) for index in range(2, 7)])
+        with tempfile.NamedTemporaryFile(suffix=".xlsx") as path:
+            path.write(file.read())
+            path.flush()
+            with CaptureQueriesContext(connection) as queries:
+                call_command("import_clients", path.name, "--batch-size", "2", "--user", "admin", stdout=StringIO())
 
-# Create your tests here.
+        self.assertEqual(Client.objects.filter(created_by=self.user).count(), 5)
+        inserts = [query for query in queries if query["sql"].startswith('INSERT INTO "clients_client"')]
+        self.assertEqual(len(inserts), 3)
@@ -1,24 +1,30 @@
 from decimal import Decimal
+from zipfile import BadZipFile
 
 import openpyxl
-from dateutil.relativedelta import relativedelta
+from openpyxl.utils.exceptions import InvalidFileException
 from django.conf import settings
-from django.db.models.fields import IntegerField
 from rest_framework.viewsets import ModelViewSet
 from rest_framework.decorators import action, api_view
+from rest_framework.parsers import MultiPartParser
 from rest_framework.response import Response
 from rest_framework import status
 
+from association.exports import EXPORT_RENDERER_CLASSES, get_export_format, streaming_export
 from association.utils import clean_excel_name
-from financials.models import Installment, Subscription, FinancialRecord, TransactionType, Loan
-from .models import Client, WorkEntity, RankChoices
+from financials.models import Installment, Subscription, Loan
+from users.models import User
+from . import stats
+from .imports import import_clients
+from .models import Client, WorkEntity, membership_age
+from .registry import work_entities
+from .search import search_clients
 from .serializers import WorkEntitySerializer, ClientListSerializer, ClientReadSerializer, ClientWriteSerializer, \
     ClientSelectSerializer
 from django.utils.translation import gettext_lazy as _
-from django.db.models import RestrictedError, Count, Sum, Value, CharField, Q, ExpressionWrapper, F, Case, When
-from django.db.models.functions import TruncMonth, ExtractYear, ExtractMonth, Concat
+from django.db.models import RestrictedError
+from django.db.models.functions import ExtractMonth
 
-from datetime import datetime, date
 
 # for excel file creation
 from io import BytesIO
@@ -26,6 +32,34 @@ from django.http import FileResponse
 from .resourses import fieldLabels
 
 
+def _format_datetime(value):
+    return value.astimezone(settings.CAIRO_TZ).strftime("%Y-%m-%d %I:%M%p") if value else None
+
+
+# field -> (values_list lookups, formatter) for the streaming export
+export_columns = {
+    "rank": (("rank",), None),
+    "name": (("name",), None),
+    "membership_number": (("membership_number",), None),
+    "seniority": (("graduation_year", "class_rank"), lambda year, class_rank: f"{year}/{class_rank}"),
+    "subscription_date": (("subscription_date",), None),
+    "work_entity": (("work_entity__name",), None),
+    "age": (("birth_date",), membership_age),
+    "national_id": (("national_id",), None),
+    "birth_date": (("birth_date",), None),
+    "residence": (("residence",), None),
+    "phone_number": (("phone_number",), None),
+    "membership_type": (("membership_type",), None),
+    "marital_status": (("marital_status",), None),
+    "graduation_year": (("graduation_year",), None),
+    "class_rank": (("class_rank",), None),
+    "notes": (("notes",), None),
+    "is_active": (("is_active",), lambda is_active: "في الخدمة" if is_active else "متقاعد"),
+    "created_at": (("created_at",), _format_datetime),
+    "created_by": (("created_by__name",), None),
+}
+
+
 class WorkEntityViewSet(ModelViewSet):
     queryset = WorkEntity.objects.all()
     serializer_class = WorkEntitySerializer
@@ -55,14 +89,12 @@ class ClientViewSet(ModelViewSet):
         entities_filters = self.request.query_params.get('entities', [])
         sort_by = self.request.query_params.get('sort_by', None)
         order = self.request.query_params.get('order', None)
+        min_unpaid_subscriptions = self.request.query_params.get('min_unpaid_subscriptions', None)
+        min_unpaid_installments = self.request.query_params.get('min_unpaid_installments', None)
+        min_unpaid_repayments = self.request.query_params.get('min_unpaid_repayments', None)
 
         if search not in (None, ""):
-            try:
-                if search_type == "membership_number" and not search.isdigit():
-                    raise ValueError("membership_number must be an integer")
-                queryset = queryset.filter(**{search_type: search})
-            except ValueError:
-                pass
+            queryset = search_clients(queryset, search, search_type, rank=True)
 
         if status_filters == "active":
             queryset = queryset.filter(is_active=True)
@@ -71,7 +103,7 @@ class ClientViewSet(ModelViewSet):
 
         if len(entities_filters) > 0:
             entities_filters = entities_filters.split(',')
-            queryset = queryset.filter(work_entity__name__in=entities_filters)
+            queryset = queryset.filter(work_entity_id__in=work_entities.ids("name", entities_filters))
 
         if len(rank_filters) > 0:
             rank_filters = rank_filters.split(',')
@@ -81,8 +113,28 @@ class ClientViewSet(ModelViewSet):
             graduation_year_filters = graduation_year_filters.split(',')
             queryset = queryset.filter(graduation_year__in=graduation_year_filters)
 
+        # arrears filters, served from the indexed ClientDues snapshot
+        if min_unpaid_subscriptions and min_unpaid_subscriptions.isdigit():
+            queryset = queryset.filter(dues_snapshot__unpaid_subscriptions__gte=min_unpaid_subscriptions)
+
+        if min_unpaid_installments and min_unpaid_installments.isdigit():
+            queryset = queryset.filter(dues_snapshot__unpaid_installments__gte=min_unpaid_installments)
+
+        if min_unpaid_repayments and min_unpaid_repayments.isdigit():
+            queryset = queryset.filter(dues_snapshot__unpaid_repayments__gte=min_unpaid_repayments)
+
+        if sort_by == "dues":
+            sort_by = "dues_snapshot__total_unpaid"
+
         if sort_by is not None:
             queryset = queryset.order_by(f"{order}{sort_by}")
+        elif search not in (None, ""):
+            queryset = queryset.order_by("-search_rank", "membership_number")
+
+        if self.action in ["list", "retrieve"] and self.request.query_params.get("serializer") != "select":
+            queryset = queryset.select_related("work_entity", "dues_snapshot")
+        elif self.action == "export":
+            queryset = queryset.select_related("created_by")
 
         return queryset
 
@@ -109,7 +161,7 @@ class ClientViewSet(ModelViewSet):
         try:
             client = Client.objects.get(pk=pk)
             client.is_active = not client.is_active
-            client.save()
+            client.save_changed()
             return Response({"is_active": client.is_active})
         except Exception:
             return Response({'detail': _('عضو غير موجود')}, status=status.HTTP_404_NOT_FOUND)
@@ -145,7 +197,18 @@ class ClientViewSet(ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
 
-    @action(detail=False, methods=["get"], url_path="export")
+    @action(detail=False, methods=["post"], url_path="import", parser_classes=[MultiPartParser])
+    def import_clients(self, request):
+        file = request.FILES.get("file")
+        if file is None:
+            return Response({"file": [_("يرجى اختيار ملف")]}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            report = import_clients(file, user=request.user)
+        except (InvalidFileException, BadZipFile):
+            return Response({"file": [_("يرجى اختيار ملف Excel صالح")]}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(report, status=status.HTTP_201_CREATED if report["created"] else status.HTTP_200_OK)
+
+    @action(detail=False, methods=["get"], url_path="export", renderer_classes=EXPORT_RENDERER_CLASSES)
     def export(self, request):
         queryset = self.get_queryset()
         fields = request.query_params.get("fields", None)
@@ -155,6 +218,10 @@ class ClientViewSet(ModelViewSet):
 
         fields = fields.split(',')
 
+        export_format = get_export_format(request)
+        if export_format is not None:
+            return streaming_export(queryset, fields, fieldLabels, export_columns, export_format, "الأعضاء")
+
         serializer = ClientReadSerializer(queryset, many=True, context={"request": request})
 
         wb = openpyxl.Workbook()
@@ -312,176 +379,20 @@ class ClientViewSet(ModelViewSet):
         )
 
 
-@api_view(["GET"])
-def get_home_stats(request):
-    # Rank Count
-    ranks = Client.objects.values("rank").annotate(total=Count("id"))
-    rank_dict = {r["rank"]: r["total"] for r in ranks}
-
-    all_rank_counts = [{"rank": choice.value, "العدد": rank_dict.get(choice.value, 0)} for choice in RankChoices]
-
-    # Activity Status
-    activity = Client.objects.values("is_active").annotate(total=Count("id"))
-    active_dict = {a["is_active"]: a["total"] for a in activity}
-
-    active_status = [
-        {"name": "بالخدمة", "value": active_dict.get(True, 0)},
-        {"name": "متقاعد", "value": active_dict.get(False, 0)},
-    ]
-
-    entities_count = WorkEntity.objects.annotate(count=Count("client")).values("name", "id", "count")
-
-    # Subscription Growth
-    today = datetime.today().astimezone(settings.CAIRO_TZ).date()
-    start_date = (today - relativedelta(months=6)).replace(day=1)
+def _fresh_stats(request):
+    """
+    admins may bypass the dashboard cache with ?fresh=1
+    """
+    user = request.user
+    fresh = request.query_params.get("fresh", "").lower() in ("1", "true")
+    return fresh and (user.is_superuser or user.role == User.Role.manager)
 
-    month_totals = (Subscription.objects.filter(date__gte=start_date)
-                    .annotate(month=TruncMonth("date"))
-                    .annotate(
-        month=Concat(ExtractYear("month"), Value("-"), ExtractMonth("month"), output_field=CharField(), ))
-                    .values(
-        "month").annotate(اشتراكات=Sum("amount")))
 
-    data = {
-        "rank_counts": all_rank_counts,
-        "active_status": active_status,
-        "entities_count": entities_count,
-        "month_totals": month_totals,
-    }
-
-    return Response(data, status=status.HTTP_200_OK)
+@api_view(["GET"])
+def get_home_stats(request):
+    return Response(stats.home_stats(fresh=_fresh_stats(request)), status=status.HTTP_200_OK)
 
 
 @api_view(["GET"])
 def get_home_financial_stats(request):
-    now = datetime.now().astimezone(settings.CAIRO_TZ)
-    current_month, current_year = now.month, now.year
-
-    # ---------- Current month stats ----------
-    incomes = (
-            FinancialRecord.objects.filter(
-                date__month=current_month,
-                date__year=current_year,
-                transaction_type__type=TransactionType.Type.INCOME,
-            ).aggregate(total=Sum("amount"))["total"]
-            or 0
-    )
-    expenses = (
-            FinancialRecord.objects.filter(
-                date__month=current_month,
-                date__year=current_year,
-                transaction_type__type=TransactionType.Type.EXPENSE,
-            ).aggregate(total=Sum("amount"))["total"]
-            or 0
-    )
-
-    # Subscriptions (current month)
-    current_month_subs = Subscription.objects.filter(
-        date__month=current_month, date__year=current_year, client__is_active=True
-    )
-    subscriptions_sum = current_month_subs.aggregate(total=Sum("amount"))["total"] or 0
-    subscriptions_count = current_month_subs.count()
-
-    cutoff = date(current_year, current_month, 1)
-    unpaid_subscriptions = max(Client.objects.filter(is_active=True,
-                                                     subscription_date__lt=cutoff).count() - subscriptions_count, 0)
-
-    # Installments (current month)
-    current_month_installments = Installment.objects.filter(
-        due_date__month=current_month, due_date__year=current_year
-    )
-    installments_sum = (
-            current_month_installments.filter(status=Installment.Status.PAID).aggregate(
-                total=Sum("amount")
-            )["total"]
-            or 0
-    )
-    installments_count = current_month_installments.filter(
-        status=Installment.Status.PAID
-    ).count()
-    unpaid_installments = current_month_installments.filter(
-        status=Installment.Status.UNPAID
-    ).count()
-
-    # Loans (current month)
-    loans_sum = Loan.objects.filter(
-        issued_date__month=current_month, issued_date__year=current_year
-    ).aggregate(total=Sum("amount"))["total"] or 0
-
-    # ---------- Last 6 months ----------
-    today = now.date()
-    start_date = (today - relativedelta(months=6)).replace(day=1)
-    end_date = (today.replace(day=1) + relativedelta(months=1))
-
-    # Financial records (for charts, optional)
-    monthly_totals = (
-        FinancialRecord.objects.filter(date__gte=start_date)
-        .annotate(month=TruncMonth("date"))
-        .values("month")
-        .annotate(
-            total_incomes=Sum(
-                "amount", filter=Q(transaction_type__type=TransactionType.Type.INCOME)
-            ),
-            total_expenses=Sum(
-                "amount", filter=Q(transaction_type__type=TransactionType.Type.EXPENSE)
-            ),
-        )
-        .order_by("month")
-    )
-
-    subscription_stats = (Client.objects.filter(is_active=True)
-    .annotate(
-        start_year=ExtractYear("subscription_date"),
-        start_month=ExtractMonth("subscription_date"),
-    ).annotate(
-        due_months=ExpressionWrapper(
-            (current_year - F("start_year")) * 12 + (current_month - F("start_month")),
-            output_field=IntegerField(),
-        ),
-        paid=Count("subscriptions"),
-    ).annotate(
-        unpaid=ExpressionWrapper(
-            F("due_months") - F("paid"),
-            output_field=IntegerField(),
-        )
-    )).aggregate(total_paid=Sum("paid"), total_unpaid=Sum(
-        Case(
-            When(unpaid__gt=0, then=F("unpaid")),
-            default=Value(0),
-            output_field=IntegerField(),
-        )
-    ))
-
-    # Installments last 6 months (total unpaid like subscriptions)
-    inst_till_now = Installment.objects.filter(due_date__lt=end_date).aggregate(
-        paid=Count("id", filter=Q(status=Installment.Status.PAID)),
-        unpaid=Count("id", filter=Q(status=Installment.Status.UNPAID)),
-    )
-
-    loans_data = Loan.objects.annotate(month=TruncMonth("issued_date")).values("month").annotate(value=Sum("amount"))
-
-    return Response(
-        {
-            "month_totals": {
-                "incomes": incomes,
-                "expenses": expenses,
-                "net": incomes - expenses,
-                "subscriptions": subscriptions_sum,
-                "installments": installments_sum,
-                "loans": loans_sum
-            },
-            "last_6_monthly_totals": monthly_totals,
-            "subscriptions_count": subscriptions_count,
-            "unpaid_subscriptions": unpaid_subscriptions,
-            "installments_count": installments_count,
-            "unpaid_installments": unpaid_installments,
-            "till_now_subs_inst": {
-                "total_paid_subscriptions": subscription_stats["total_paid"],
-                "total_paid_installments": inst_till_now["paid"] or 0,
-                "total_unpaid_subscriptions": subscription_stats["total_unpaid"],
-                "total_unpaid_installments": inst_till_now["unpaid"] or 0,
-            },
-            "loans_data": loans_data,
-        },
-        status=status.HTTP_200_OK,
-    )
+    return Response(stats.home_financial_stats(fresh=_fresh_stats(request)), status=status.HTTP_200_OK)
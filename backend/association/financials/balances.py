@@ -0,0 +1,101 @@
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Sum, F, Q
+from django.utils.dateparse import parse_date
+
+from .models import BankAccount, FinancialRecord, TransactionType
+from .registry import transaction_types
+
+# FinancialRecord fields the balance and the monthly rollups depend on
+TRACKED_FIELDS = ("amount", "date", "transaction_type_id", "bank_account_id", "payment_method")
+
+
+def record_state(values):
+    """
+    tracked field values from a record or a dict of field values
+    """
+    if not isinstance(values, dict):
+        values = {field: getattr(values, field) for field in TRACKED_FIELDS}
+    state = {field: values[field] for field in TRACKED_FIELDS}
+    state["amount"] = Decimal(str(state["amount"]))
+    # the field accepts ISO strings too, e.g. FinancialRecord.objects.create(date="2025-01-05")
+    if isinstance(state["date"], str):
+        state["date"] = parse_date(state["date"])
+    return state
+
+
+def original_state(record: FinancialRecord):
+    """
+    tracked field values as last loaded or saved, None when the instance did not load them all
+    """
+    loaded = record.original_values
+    if not all(field in loaded for field in TRACKED_FIELDS):
+        return None
+    return record_state(loaded)
+
+
+def balance_effect(state):
+    """
+    (bank account id, signed amount) a record adds to its account balance, None if it does not touch one
+    """
+    if not state["bank_account_id"] or state["payment_method"] == FinancialRecord.PaymentMethod.CASH:
+        return None
+    kind = transaction_types.get(id=state["transaction_type_id"]).type
+    return state["bank_account_id"], state["amount"] if kind == TransactionType.Type.INCOME else -state["amount"]
+
+
+def apply_balance_deltas(deltas):
+    """
+    add {bank account id: amount} with one atomic UPDATE per account, in
+    primary key order so concurrent writers lock accounts in the same order
+    """
+    for bank_account_id in sorted(deltas):
+        if deltas[bank_account_id]:
+            BankAccount.objects.filter(pk=bank_account_id).update(balance=F("balance") + deltas[bank_account_id])
+
+
+def apply_balance_changes(old_state=None, new_state=None):
+    """
+    move the balances from the record's old state to its new one
+    """
+    deltas = defaultdict(Decimal)
+    for state, sign in ((old_state, -1), (new_state, 1)):
+        effect = balance_effect(state) if state else None
+        if effect:
+            deltas[effect[0]] += sign * effect[1]
+    apply_balance_deltas(deltas)
+
+
+def expected_balances():
+    """
+    bank account id -> balance implied by its financial records, in one grouped query
+    """
+    incomes = Q(transaction_type_id__in=transaction_types.ids("type", [TransactionType.Type.INCOME]))
+    rows = (FinancialRecord.objects.filter(bank_account__isnull=False)
+            .exclude(payment_method=FinancialRecord.PaymentMethod.CASH)
+            .values("bank_account")
+            .annotate(incomes=Sum("amount", filter=incomes), expenses=Sum("amount", filter=~incomes))
+            .order_by())
+    return {row["bank_account"]: (row["incomes"] or 0) - (row["expenses"] or 0) for row in rows}
+
+
+def reconcile_balances(fix=False):
+    """
+    accounts whose stored balance differs from their records as (account, expected balance),
+    corrected when `fix`
+    """
+    with transaction.atomic():
+        accounts = BankAccount.objects.select_for_update().order_by("pk")
+        expected = expected_balances()
+
+        drifted = []
+        for account in accounts:
+            balance = expected.get(account.pk, Decimal(0))
+            if account.balance != balance:
+                drifted.append((account, balance))
+                if fix:
+                    BankAccount.objects.filter(pk=account.pk).update(balance=balance)
+
+    return drifted
@@ -0,0 +1,128 @@
+from collections import defaultdict
+from datetime import datetime
+from decimal import Decimal
+
+from django.conf import settings
+
+from django.db import IntegrityError, transaction
+from django.db.models import Sum, Count
+from django.db.models.functions import TruncMonth
+
+from association.utils import delete_rows
+from clients import stats
+from projects.models import ProjectTransaction
+from .balances import record_state, balance_effect, apply_balance_deltas
+from .dues import refresh_client_dues
+from .models import FinancialRecord, Subscription
+from .rollups import ROLLUP_FIELDS, rollup_key, apply_to_rollup
+
+
+def _apply_groups(groups, sign):
+    """
+    apply {rollup key: (total, count)} to the rollups and the bank balances,
+    one rollup update per key and one balance update per account
+    """
+    deltas = defaultdict(Decimal)
+    for key, (total, count) in groups.items():
+        apply_to_rollup(key, sign * total, sign * count)
+
+        month, transaction_type_id, bank_account_id, payment_method = key
+        effect = balance_effect({"amount": total, "transaction_type_id": transaction_type_id,
+                                 "bank_account_id": bank_account_id, "payment_method": payment_method})
+        if effect:
+            deltas[effect[0]] += sign * effect[1]
+
+    apply_balance_deltas(deltas)
+    stats.invalidate_for(FinancialRecord)
+
+
+def bulk_create_records(records, batch_size=500):
+    """
+    insert unsaved financial records without per-row signals, adjusting the
+    balances and rollups once per account and rollup key
+    """
+    groups = defaultdict(lambda: [Decimal(0), 0])
+    for record in records:
+        group = groups[rollup_key(record_state(record))]
+        group[0] += Decimal(str(record.amount))
+        group[1] += 1
+
+    with transaction.atomic():
+        created = FinancialRecord.objects.bulk_create(records, batch_size=batch_size)
+        _apply_groups(groups, 1)
+    return created
+
+
+def bulk_delete_records(queryset):
+    """
+    delete the financial records of `queryset` (and their project transactions)
+    without per-row signals, returns the number of deleted records
+    """
+    with transaction.atomic():
+        rows = (queryset.annotate(month=TruncMonth("date"))
+                .values("month", *ROLLUP_FIELDS)
+                .annotate(total=Sum("amount"), count=Count("id"))
+                .order_by())
+        groups = {(row["month"], *(row[field] for field in ROLLUP_FIELDS)): (row["total"], row["count"])
+                  for row in rows}
+
+        ProjectTransaction.objects.filter(financial_record__in=queryset.values("pk")).delete()
+        # the ORM delete would load every row to send post_delete, the signals' work is done in bulk above
+        deleted = delete_rows(queryset)
+        _apply_groups(groups, -1)
+
+    return deleted
+
+
+def bulk_pay_subscriptions(items, batch_size=500, attempts=3):
+    """
+    record the months of validated SubscriptionBulkSerializer items in one
+    transaction, skipping months already paid. returns per item the created
+    and the already paid months
+    """
+    if not any(item["months"] for item in items):
+        return []
+
+    for attempt in range(attempts):
+        try:
+            with transaction.atomic():
+                results = _pay_subscriptions(items, batch_size)
+            break
+        except IntegrityError:
+            # a concurrent request paid one of the months first, the retry reports it as already paid
+            if attempt == attempts - 1:
+                raise
+
+    stats.invalidate_for(Subscription)
+    return results
+
+
+def _paid_months(client_ids, months):
+    return set(Subscription.objects.filter(client_id__in=client_ids, date__gte=min(months), date__lte=max(months))
+               .values_list("client_id", "date"))
+
+
+def _pay_subscriptions(items, batch_size):
+    today = datetime.today().astimezone(settings.CAIRO_TZ).date()
+    client_ids = {item["client"].pk for item in items}
+    paid = _paid_months(client_ids, [month for item in items for month in item["months"]])
+
+    results = []
+    subscriptions = []
+    for item in items:
+        created, already_paid = [], []
+        for month in item["months"]:
+            key = (item["client"].pk, month)
+            if key in paid:
+                already_paid.append(month)
+                continue
+            paid.add(key)
+            created.append(month)
+            subscriptions.append(Subscription(client=item["client"], date=month, amount=item["amount"],
+                                              paid_at=item.get("paid_at") or today, notes=item.get("notes")))
+        results.append({"client": item["client"].pk, "created": created, "already_paid": already_paid})
+
+    # the unique (client, date) constraint fails the insert when a concurrent request paid the same month
+    Subscription.objects.bulk_create(subscriptions, batch_size=batch_size)
+    refresh_client_dues(client_ids)
+    return results
@@ -0,0 +1,154 @@
+from datetime import datetime
+
+from django.conf import settings
+from django.db.models import Count, Sum, Value, ExpressionWrapper, Case, When, OuterRef, Subquery, F, \
+    IntegerField, DecimalField
+from django.db.models.functions import ExtractYear, ExtractMonth, Coalesce, Greatest
+
+from clients.models import Client
+from .models import ClientDues, Subscription, Installment, Repayment
+
+
+def _client_subquery(queryset, client_field, aggregate, output_field):
+    """
+    correlated aggregate of `queryset` rows belonging to the outer client row
+    """
+    return Coalesce(
+        Subquery(
+            queryset.filter(**{client_field: OuterRef("pk")})
+            .order_by()
+            .values(client_field)
+            .annotate(total=aggregate)
+            .values("total"),
+            output_field=output_field,
+        ),
+        Value(0),
+        output_field=output_field,
+    )
+
+
+def due_months_expression(subscription_date="subscription_date"):
+    """
+    number of months between the member's subscription month and the current month
+    """
+    today = datetime.today().astimezone(settings.CAIRO_TZ).date()
+
+    due_months = ExpressionWrapper(
+        (today.year - ExtractYear(subscription_date)) * 12 + (today.month - ExtractMonth(subscription_date)),
+        output_field=IntegerField(),
+    )
+
+    return Case(
+        When(**{f"{subscription_date}__lt": today.replace(day=1)}, then=due_months),
+        default=Value(0),
+        output_field=IntegerField(),
+    )
+
+
+def annotate_dues(queryset, amounts=False):
+    """
+    annotate clients with due months, paid subscriptions, unpaid installments
+    and unpaid repayments (and their amounts if requested) in a single query
+    """
+    unpaid_installments = Installment.objects.filter(status=Installment.Status.UNPAID)
+    unpaid_repayments = Repayment.objects.filter(status=Repayment.Status.UNPAID)
+
+    annotations = {
+        "due_months": due_months_expression(),
+        "paid_subscriptions": _client_subquery(Subscription.objects.all(), "client", Count("id"), IntegerField()),
+        "unpaid_installments": _client_subquery(unpaid_installments, "client", Count("id"), IntegerField()),
+        "unpaid_repayments": _client_subquery(unpaid_repayments, "loan__client", Count("id"), IntegerField()),
+    }
+
+    if amounts:
+        amount_field = DecimalField(max_digits=12, decimal_places=2)
+        annotations["unpaid_installments_amount"] = _client_subquery(unpaid_installments, "client", Sum("amount"),
+                                                                     amount_field)
+        annotations["unpaid_repayments_amount"] = _client_subquery(unpaid_repayments, "loan__client",
+                                                                   Sum("amount"), amount_field)
+
+    return queryset.annotate(**annotations)
+
+
+def _snapshot(row):
+    unpaid_subscriptions = max(row["due_months"] - row["paid_subscriptions"], 0)
+    return ClientDues(
+        client_id=row["id"],
+        due_months=row["due_months"],
+        paid_subscriptions=row["paid_subscriptions"],
+        unpaid_subscriptions=unpaid_subscriptions,
+        unpaid_installments=row["unpaid_installments"],
+        unpaid_installments_amount=row["unpaid_installments_amount"],
+        unpaid_repayments=row["unpaid_repayments"],
+        unpaid_repayments_amount=row["unpaid_repayments_amount"],
+        total_unpaid=unpaid_subscriptions + row["unpaid_installments"] + row["unpaid_repayments"],
+        outstanding_amount=row["unpaid_installments_amount"] + row["unpaid_repayments_amount"],
+    )
+
+
+def _upsert(snapshots, batch_size=None):
+    ClientDues.objects.bulk_create(
+        snapshots,
+        batch_size=batch_size,
+        update_conflicts=True,
+        unique_fields=["client"],
+        update_fields=[field.name for field in ClientDues._meta.concrete_fields if not field.primary_key],
+    )
+
+
+def _dues_rows(queryset):
+    return annotate_dues(queryset, amounts=True).order_by().values(
+        "id", "due_months", "paid_subscriptions", "unpaid_installments", "unpaid_installments_amount",
+        "unpaid_repayments", "unpaid_repayments_amount",
+    )
+
+
+def refresh_client_dues(client_ids):
+    """
+    recompute the dues snapshot of the given clients: one select and one upsert
+    """
+    client_ids = {client_id for client_id in client_ids if client_id is not None}
+    if not client_ids:
+        return
+
+    snapshots = [_snapshot(row) for row in _dues_rows(Client.objects.filter(pk__in=client_ids))]
+    if snapshots:
+        _upsert(snapshots)
+
+
+def rebuild_client_dues(batch_size=2000):
+    """
+    recompute the dues snapshot of every client from scratch, returns the number of rows written
+    """
+    count = 0
+    batch = []
+    for row in _dues_rows(Client.objects.all()).iterator(chunk_size=batch_size):
+        batch.append(_snapshot(row))
+        if len(batch) >= batch_size:
+            _upsert(batch)
+            count += len(batch)
+            batch = []
+
+    if batch:
+        _upsert(batch)
+        count += len(batch)
+
+    return count
+
+
+def roll_due_months():
+    """
+    move every snapshot's due months to the current month, returns the number of updated rows
+    """
+    due_months = Client.objects.filter(pk=OuterRef("client_id")).annotate(
+        current_due_months=due_months_expression()).values("current_due_months")
+
+    updated = ClientDues.objects.update(due_months=Subquery(due_months, output_field=IntegerField()))
+
+    unpaid_subscriptions = Greatest(F("due_months") - F("paid_subscriptions"), Value(0))
+    ClientDues.objects.update(
+        unpaid_subscriptions=unpaid_subscriptions,
+        total_unpaid=unpaid_subscriptions + F("unpaid_installments") + F("unpaid_repayments"),
+    )
+
+    return updated
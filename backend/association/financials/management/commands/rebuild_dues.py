@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from financials.dues import rebuild_client_dues
+
+
+class Command(BaseCommand):
+    help = "Recompute the ClientDues snapshot of every member from scratch"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=2000)
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            count = rebuild_client_dues(batch_size=options["batch_size"])
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt dues for {count} members."))
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from financials.rollups import rebuild_monthly_rollups
+
+
+class Command(BaseCommand):
+    help = "Recompute the monthly financial rollups from the financial records"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=2000)
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            count = rebuild_monthly_rollups(batch_size=options["batch_size"])
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {count} monthly rollups."))
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from financials.balances import reconcile_balances
+
+
+class Command(BaseCommand):
+    help = "Compare every bank account balance with its financial records and optionally correct the drift"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--fix", action="store_true", help="overwrite drifted balances with the computed ones")
+
+    def handle(self, *args, **options):
+        drifted = reconcile_balances(fix=options["fix"])
+
+        for account, balance in drifted:
+            self.stdout.write(f"{account.name}: stored {account.balance}, computed {balance} "
+                              f"(drift {account.balance - balance})")
+
+        if not drifted:
+            self.stdout.write(self.style.SUCCESS("All bank balances match their records."))
+        elif options["fix"]:
+            self.stdout.write(self.style.SUCCESS(f"Corrected {len(drifted)} bank balances."))
+        else:
+            self.stdout.write(self.style.WARNING(f"{len(drifted)} bank balances drifted, run with --fix to correct."))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from financials.dues import roll_due_months
+
+
+class Command(BaseCommand):
+    help = "Roll the ClientDues due months forward to the current month (run nightly, e.g. from cron)"
+
+    def handle(self, *args, **options):
+        count = roll_due_months()
+        self.stdout.write(self.style.SUCCESS(f"Rolled dues for {count} members."))
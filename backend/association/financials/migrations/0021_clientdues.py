@@ -0,0 +1,94 @@
+# Generated by Django 5.2 on 2026-10-18 16:46
+
+from datetime import datetime
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Sum, Value, OuterRef, Subquery, IntegerField, DecimalField
+from django.db.models.functions import Coalesce
+
+
+def _client_subquery(queryset, client_field, aggregate, output_field):
+    return Coalesce(Subquery(queryset.filter(**{client_field: OuterRef("pk")}).order_by().values(client_field)
+                             .annotate(total=aggregate).values("total"), output_field=output_field),
+                    Value(0), output_field=output_field)
+
+
+def fill_client_dues(apps, schema_editor):
+    """
+    a snapshot for every existing member, frozen copy of financials.dues.rebuild_client_dues
+    """
+    Client = apps.get_model("clients", "Client")
+    Subscription = apps.get_model("financials", "Subscription")
+    Installment = apps.get_model("financials", "Installment")
+    Repayment = apps.get_model("financials", "Repayment")
+    ClientDues = apps.get_model("financials", "ClientDues")
+
+    amount = DecimalField(max_digits=12, decimal_places=2)
+    unpaid_installments = Installment.objects.filter(status="غير مدفوع")
+    unpaid_repayments = Repayment.objects.filter(status="غير مدفوع")
+    rows = Client.objects.annotate(
+        paid_subscriptions=_client_subquery(Subscription.objects.all(), "client", Count("id"), IntegerField()),
+        unpaid_installments=_client_subquery(unpaid_installments, "client", Count("id"), IntegerField()),
+        unpaid_installments_amount=_client_subquery(unpaid_installments, "client", Sum("amount"), amount),
+        unpaid_repayments=_client_subquery(unpaid_repayments, "loan__client", Count("id"), IntegerField()),
+        unpaid_repayments_amount=_client_subquery(unpaid_repayments, "loan__client", Sum("amount"), amount),
+    ).order_by().values("id", "subscription_date", "paid_subscriptions", "unpaid_installments",
+                        "unpaid_installments_amount", "unpaid_repayments", "unpaid_repayments_amount")
+
+    this_month = datetime.today().astimezone(settings.CAIRO_TZ).date().replace(day=1)
+    snapshots = []
+    for row in rows.iterator(chunk_size=2000):
+        start = row["subscription_date"]
+        due_months = ((this_month.year - start.year) * 12 + this_month.month - start.month
+                      if start < this_month else 0)
+        unpaid_subscriptions = max(due_months - row["paid_subscriptions"], 0)
+        snapshots.append(ClientDues(
+            client_id=row["id"],
+            due_months=due_months,
+            paid_subscriptions=row["paid_subscriptions"],
+            unpaid_subscriptions=unpaid_subscriptions,
+            unpaid_installments=row["unpaid_installments"],
+            unpaid_installments_amount=row["unpaid_installments_amount"],
+            unpaid_repayments=row["unpaid_repayments"],
+            unpaid_repayments_amount=row["unpaid_repayments_amount"],
+            total_unpaid=unpaid_subscriptions + row["unpaid_installments"] + row["unpaid_repayments"],
+            outstanding_amount=row["unpaid_installments_amount"] + row["unpaid_repayments_amount"],
+        ))
+        if len(snapshots) >= 2000:
+            ClientDues.objects.bulk_create(snapshots)
+            snapshots = []
+    ClientDues.objects.bulk_create(snapshots)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clients', '0014_rename_prepaid_amount_temp_client_prepaid'),
+        ('financials', '0020_bankaccount_balance'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ClientDues',
+            fields=[
+                ('client', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='dues_snapshot', serialize=False, to='clients.client', verbose_name='العضو')),
+                ('due_months', models.PositiveIntegerField(default=0, verbose_name='الشهور المستحقة')),
+                ('paid_subscriptions', models.PositiveIntegerField(default=0, verbose_name='الاشتراكات المدفوعة')),
+                ('unpaid_subscriptions', models.PositiveIntegerField(db_index=True, default=0, verbose_name='الاشتراكات غير المدفوعة')),
+                ('unpaid_installments', models.PositiveIntegerField(db_index=True, default=0, verbose_name='الأقساط غير المدفوعة')),
+                ('unpaid_installments_amount', models.DecimalField(decimal_places=2, default=0, max_digits=12, verbose_name='قيمة الأقساط غير المدفوعة')),
+                ('unpaid_repayments', models.PositiveIntegerField(db_index=True, default=0, verbose_name='السدادات غير المدفوعة')),
+                ('unpaid_repayments_amount', models.DecimalField(decimal_places=2, default=0, max_digits=12, verbose_name='قيمة السدادات غير المدفوعة')),
+                ('total_unpaid', models.PositiveIntegerField(db_index=True, default=0, verbose_name='إجمالي المستحقات')),
+                ('outstanding_amount', models.DecimalField(db_index=True, decimal_places=2, default=0, help_text='قيمة الأقساط والسدادات غير المدفوعة', max_digits=14, verbose_name='المبلغ المستحق')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='آخر تحديث')),
+            ],
+            options={
+                'verbose_name': 'مستحقات عضو',
+                'verbose_name_plural': 'مستحقات الأعضاء',
+            },
+        ),
+        migrations.RunPython(fill_client_dues, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,51 @@
+# Generated by Django 5.2 on 2026-10-18 16:57
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Sum, Count
+from django.db.models.functions import TruncMonth
+
+
+def rollup_existing_records(apps, schema_editor):
+    FinancialRecord = apps.get_model("financials", "FinancialRecord")
+    FinancialMonthlyRollup = apps.get_model("financials", "FinancialMonthlyRollup")
+
+    rows = (FinancialRecord.objects.annotate(month=TruncMonth("date"))
+            .values("month", "transaction_type", "bank_account", "payment_method")
+            .annotate(total=Sum("amount"), count=Count("id"))
+            .order_by())
+    FinancialMonthlyRollup.objects.bulk_create([
+        FinancialMonthlyRollup(month=row["month"], transaction_type_id=row["transaction_type"],
+                               bank_account_id=row["bank_account"], payment_method=row["payment_method"],
+                               total=row["total"], count=row["count"])
+        for row in rows
+    ], batch_size=2000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('financials', '0021_clientdues'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FinancialMonthlyRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField(help_text='أول يوم في الشهر', verbose_name='الشهر')),
+                ('payment_method', models.CharField(choices=[('نقدي', 'نقدي'), ('إيداع بنكي', 'إيداع بنكي'), ('مصروف بنكي', 'مصروف بنكي'), ('شيك', 'شيك'), ('تحويل بنكي', 'تحويل بنكي')], max_length=20, verbose_name='طريقة الدفع')),
+                ('total', models.DecimalField(decimal_places=2, default=0, max_digits=16, verbose_name='الإجمالي')),
+                ('count', models.IntegerField(default=0, verbose_name='عدد السجلات')),
+                ('bank_account', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='monthly_rollups', to='financials.bankaccount', verbose_name='الحساب البنكي')),
+                ('transaction_type', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='monthly_rollups', to='financials.transactiontype', verbose_name='نوع المعاملة')),
+            ],
+            options={
+                'verbose_name': 'ملخص شهري',
+                'verbose_name_plural': 'الملخصات الشهرية',
+                'ordering': ['month'],
+                'constraints': [models.UniqueConstraint(fields=('month', 'transaction_type', 'bank_account', 'payment_method'), name='financials_rollup_unique_key')],
+            },
+        ),
+        migrations.RunPython(rollup_existing_records, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.2 on 2026-10-18 18:02
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def check_duplicate_months(apps, schema_editor):
+    Subscription = apps.get_model("financials", "Subscription")
+
+    duplicates = (Subscription.objects.values("client", "date")
+                  .annotate(count=Count("id")).filter(count__gt=1).order_by())
+    duplicates = [f"client {row['client']} {row['date']}" for row in duplicates[:20]]
+    if duplicates:
+        raise RuntimeError("Subscriptions paid twice for the same month, remove the extra rows before migrating: "
+                           + ", ".join(duplicates))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('financials', '0022_financialmonthlyrollup'),
+    ]
+
+    operations = [
+        migrations.RunPython(check_duplicate_months, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='subscription',
+            constraint=models.UniqueConstraint(fields=('client', 'date'), name='financials_subscription_unique_month'),
+        ),
+    ]
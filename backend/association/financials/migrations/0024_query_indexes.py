@@ -0,0 +1,34 @@
+# Generated by Django 5.2 on 2026-10-18 17:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clients', '0016_client_active_index'),
+        ('financials', '0023_subscription_unique_month'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='financialrecord',
+            index=models.Index(fields=['date', 'created_at'], name='financials_record_date'),
+        ),
+        migrations.AddIndex(
+            model_name='financialrecord',
+            index=models.Index(fields=['transaction_type', 'date'], name='financials_record_type_date'),
+        ),
+        migrations.AddIndex(
+            model_name='installment',
+            index=models.Index(fields=['due_date', 'status'], name='financials_installment_due'),
+        ),
+        migrations.AddIndex(
+            model_name='repayment',
+            index=models.Index(fields=['loan', 'status'], name='financials_repayment_status'),
+        ),
+        migrations.AddIndex(
+            model_name='subscription',
+            index=models.Index(fields=['date'], name='financials_subscription_date'),
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.2 on 2026-10-18 17:51
+
+from django.db import migrations, models
+from django.db.models import Sum, Count, Min
+
+
+def merge_duplicate_cash_rollups(apps, schema_editor):
+    """
+    fold the cash rows created twice by concurrent first writes into one
+    """
+    FinancialMonthlyRollup = apps.get_model("financials", "FinancialMonthlyRollup")
+
+    duplicates = (FinancialMonthlyRollup.objects.filter(bank_account__isnull=True)
+                  .values("month", "transaction_type", "payment_method")
+                  .annotate(rows=Count("id"), first=Min("id"), total_sum=Sum("total"), count_sum=Sum("count"))
+                  .filter(rows__gt=1)
+                  .order_by())
+    for row in duplicates:
+        FinancialMonthlyRollup.objects.filter(pk=row["first"]).update(total=row["total_sum"], count=row["count_sum"])
+        (FinancialMonthlyRollup.objects.filter(bank_account__isnull=True, month=row["month"],
+                                               transaction_type=row["transaction_type"],
+                                               payment_method=row["payment_method"])
+         .exclude(pk=row["first"]).delete())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('financials', '0024_query_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_cash_rollups, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='financialmonthlyrollup',
+            constraint=models.UniqueConstraint(condition=models.Q(('bank_account__isnull', True)), fields=('month', 'transaction_type', 'payment_method'), name='financials_rollup_unique_cash_key'),
+        ),
+    ]
@@ -1,10 +1,12 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models import Count, Q
 from django.conf import settings
 from django.utils.translation import gettext_lazy as _
+from association.tracking import OriginalValuesMixin
 from clients.models import RankChoices
 
 
-class RankFee(models.Model):
+class RankFee(OriginalValuesMixin, models.Model):
     rank = models.CharField(
         max_length=50,
         choices=RankChoices.choices,
@@ -35,7 +37,7 @@ class RankFee(models.Model):
         return self.fee_
 
 
-class BankAccount(models.Model):
+class BankAccount(OriginalValuesMixin, models.Model):
     name = models.CharField(
         max_length=255,
         unique=True,
@@ -62,7 +64,7 @@ class BankAccount(models.Model):
         return self.name
 
 
-class TransactionType(models.Model):
+class TransactionType(OriginalValuesMixin, models.Model):
     class Type(models.TextChoices):
         INCOME = "إيراد", _("إيراد")
         EXPENSE = "مصروف", _("مصروف")
@@ -99,7 +101,7 @@ class TransactionType(models.Model):
         return f"{self.name} ({self.get_type_display()})"
 
 
-class FinancialRecord(models.Model):
+class FinancialRecord(OriginalValuesMixin, models.Model):
     class PaymentMethod(models.TextChoices):
         CASH = "نقدي", _("نقدي")
         BANK_DEPOSIT = "إيداع بنكي", _("إيداع بنكي")
@@ -177,12 +179,25 @@ class FinancialRecord(models.Model):
         verbose_name = _("سجل مالي")
         verbose_name_plural = _("السجلات المالية")
         ordering = ["-date", "-created_at"]
+        indexes = [
+            models.Index(fields=["date", "created_at"], name="financials_record_date"),
+            models.Index(fields=["transaction_type", "date"], name="financials_record_type_date"),
+        ]
 
     def __str__(self):
         return f"{self.amount} - {self.transaction_type}"
 
+    def save(self, *args, **kwargs):
+        # the balance and rollup updates of the signals commit or roll back with the record
+        with transaction.atomic():
+            super().save(*args, **kwargs)
 
-class Subscription(models.Model):
+    def delete(self, *args, **kwargs):
+        with transaction.atomic():
+            return super().delete(*args, **kwargs)
+
+
+class Subscription(OriginalValuesMixin, models.Model):
     client = models.ForeignKey(
         "clients.Client",
         on_delete=models.RESTRICT,
@@ -229,12 +244,17 @@ class Subscription(models.Model):
         verbose_name = _("اشتراك")
         verbose_name_plural = _("الاشتراكات")
         ordering = ["-date"]
+        constraints = [
+            models.UniqueConstraint(fields=["client", "date"], name="financials_subscription_unique_month"),
+        ]
+        # (client, date) is covered by the unique constraint
+        indexes = [models.Index(fields=["date"], name="financials_subscription_date")]
 
     def __str__(self):
         return f"{self.amount} - ({self.date})"
 
 
-class Installment(models.Model):
+class Installment(OriginalValuesMixin, models.Model):
     class Status(models.TextChoices):
         PAID = "مدفوع", _("مدفوع")
         UNPAID = "غير مدفوع", _("غير مدفوع")
@@ -298,6 +318,7 @@ class Installment(models.Model):
         verbose_name_plural = _("الأقساط")
         ordering = ["client", "installment_number"]
         unique_together = ("client", "installment_number")
+        indexes = [models.Index(fields=["due_date", "status"], name="financials_installment_due")]
 
     def __str__(self):
         return f"قسط {self.installment_number} - {self.amount} ({self.get_status_display()})"
@@ -315,7 +336,19 @@ class Installment(models.Model):
             )
 
 
-class Loan(models.Model):
+class LoanQuerySet(models.QuerySet):
+    def with_repayment_counts(self):
+        """
+        annotate repayments_total, repayments_paid and repayments_unpaid in the same query
+        """
+        return self.annotate(
+            repayments_total=Count("repayments"),
+            repayments_paid=Count("repayments", filter=Q(repayments__status=Repayment.Status.PAID)),
+            repayments_unpaid=Count("repayments", filter=Q(repayments__status=Repayment.Status.UNPAID)),
+        )
+
+
+class Loan(OriginalValuesMixin, models.Model):
     client = models.ForeignKey(
         "clients.Client",
         on_delete=models.RESTRICT,
@@ -349,6 +382,8 @@ class Loan(models.Model):
         verbose_name=_("ملاحظات"),
     )
 
+    objects = LoanQuerySet.as_manager()
+
     class Meta:
         verbose_name = _("قرض")
         verbose_name_plural = _("القروض")
@@ -359,10 +394,12 @@ class Loan(models.Model):
 
     @property
     def is_completed(self):
+        if hasattr(self, "repayments_unpaid"):
+            return not self.repayments_unpaid
         return not self.repayments.filter(status=Repayment.Status.UNPAID).exists()
 
 
-class Repayment(models.Model):
+class Repayment(OriginalValuesMixin, models.Model):
     class Status(models.TextChoices):
         PAID = "مدفوع", _("مدفوع")
         UNPAID = "غير مدفوع", _("غير مدفوع")
@@ -426,6 +463,7 @@ class Repayment(models.Model):
         verbose_name_plural = _("السدادات")
         ordering = ["loan", "repayment_number"]
         unique_together = ("loan", "repayment_number")
+        indexes = [models.Index(fields=["loan", "status"], name="financials_repayment_status")]
 
     def __str__(self):
         return f"سداد {self.repayment_number} - {self.amount} ({self.get_status_display()})"
@@ -441,3 +479,106 @@ class Repayment(models.Model):
             raise ValidationError(
                 {"paid_at": _("لا يمكن إدخال تاريخ الدفع إذا كان السداد غير مدفوع")}
             )
+
+
+class ClientDues(models.Model):
+    """
+    per-member dues snapshot, kept current by financials.signals and rolled
+    forward nightly by the `roll_dues` command
+    """
+    client = models.OneToOneField(
+        "clients.Client",
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name="dues_snapshot",
+        verbose_name=_("العضو"),
+    )
+
+    due_months = models.PositiveIntegerField(default=0, verbose_name=_("الشهور المستحقة"))
+    paid_subscriptions = models.PositiveIntegerField(default=0, verbose_name=_("الاشتراكات المدفوعة"))
+    unpaid_subscriptions = models.PositiveIntegerField(default=0, db_index=True,
+                                                       verbose_name=_("الاشتراكات غير المدفوعة"))
+
+    unpaid_installments = models.PositiveIntegerField(default=0, db_index=True,
+                                                      verbose_name=_("الأقساط غير المدفوعة"))
+    unpaid_installments_amount = models.DecimalField(
+        max_digits=12,
+        decimal_places=2,
+        default=0,
+        verbose_name=_("قيمة الأقساط غير المدفوعة"),
+    )
+
+    unpaid_repayments = models.PositiveIntegerField(default=0, db_index=True,
+                                                    verbose_name=_("السدادات غير المدفوعة"))
+    unpaid_repayments_amount = models.DecimalField(
+        max_digits=12,
+        decimal_places=2,
+        default=0,
+        verbose_name=_("قيمة السدادات غير المدفوعة"),
+    )
+
+    total_unpaid = models.PositiveIntegerField(default=0, db_index=True, verbose_name=_("إجمالي المستحقات"))
+    outstanding_amount = models.DecimalField(
+        max_digits=14,
+        decimal_places=2,
+        default=0,
+        db_index=True,
+        verbose_name=_("المبلغ المستحق"),
+        help_text=_("قيمة الأقساط والسدادات غير المدفوعة"),
+    )
+
+    updated_at = models.DateTimeField(auto_now=True, verbose_name=_("آخر تحديث"))
+
+    class Meta:
+        verbose_name = _("مستحقات عضو")
+        verbose_name_plural = _("مستحقات الأعضاء")
+
+    def __str__(self):
+        return f"{self.client_id} - {self.total_unpaid}"
+
+
+class FinancialMonthlyRollup(models.Model):
+    """
+    monthly sum and count of financial records per transaction type, bank
+    account and payment method, kept current by financials.signals and
+    recomputed by the `rebuild_rollups` command
+    """
+    month = models.DateField(verbose_name=_("الشهر"), help_text=_("أول يوم في الشهر"))
+    transaction_type = models.ForeignKey(
+        TransactionType,
+        on_delete=models.CASCADE,
+        related_name="monthly_rollups",
+        verbose_name=_("نوع المعاملة"),
+    )
+    bank_account = models.ForeignKey(
+        BankAccount,
+        null=True,
+        blank=True,
+        on_delete=models.CASCADE,
+        related_name="monthly_rollups",
+        verbose_name=_("الحساب البنكي"),
+    )
+    payment_method = models.CharField(
+        max_length=20,
+        choices=FinancialRecord.PaymentMethod.choices,
+        verbose_name=_("طريقة الدفع"),
+    )
+
+    total = models.DecimalField(max_digits=16, decimal_places=2, default=0, verbose_name=_("الإجمالي"))
+    count = models.IntegerField(default=0, verbose_name=_("عدد السجلات"))
+
+    class Meta:
+        verbose_name = _("ملخص شهري")
+        verbose_name_plural = _("الملخصات الشهرية")
+        ordering = ["month"]
+        constraints = [
+            models.UniqueConstraint(fields=["month", "transaction_type", "bank_account", "payment_method"],
+                                    name="financials_rollup_unique_key"),
+            # NULLs are distinct in the key above, cash rows have no bank account
+            models.UniqueConstraint(fields=["month", "transaction_type", "payment_method"],
+                                    condition=models.Q(bank_account__isnull=True),
+                                    name="financials_rollup_unique_cash_key"),
+        ]
+
+    def __str__(self):
+        return f"{self.month:%Y-%m} - {self.transaction_type_id} - {self.total}"
@@ -0,0 +1,18 @@
+from association.registry import ReferenceRegistry
+from .models import RankFee, TransactionType, BankAccount
+
+rank_fees = ReferenceRegistry(RankFee)
+transaction_types = ReferenceRegistry(TransactionType)
+# the balance moves with atomic updates that skip the registry invalidation, only cache the names
+bank_accounts = ReferenceRegistry(BankAccount, fields=("id", "name"))
+
+
+def get_system_transaction_type(name, type):
+    """
+    system related transaction type by name and type, created on first use
+    """
+    try:
+        return transaction_types.get(name=name, type=type, system_related=True)
+    except TransactionType.DoesNotExist:
+        transaction_type, __ = TransactionType.objects.get_or_create(name=name, type=type, system_related=True)
+        return transaction_type
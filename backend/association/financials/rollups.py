@@ -0,0 +1,150 @@
+from datetime import timedelta
+from functools import reduce
+from operator import or_
+
+from dateutil.relativedelta import relativedelta
+from django.db import IntegrityError, transaction
+from django.db.models import Sum, Count, F, Q, Value, DecimalField
+from django.db.models.functions import Coalesce, TruncMonth
+
+from .models import FinancialMonthlyRollup, FinancialRecord, TransactionType
+from .registry import transaction_types
+
+# rollup key fields, also valid FinancialRecord fields
+ROLLUP_FIELDS = ("transaction_type", "bank_account", "payment_method")
+
+
+def rollup_key(state):
+    """
+    rollup row key of a record state, see financials.balances.record_state
+    """
+    return (state["date"].replace(day=1), state["transaction_type_id"], state["bank_account_id"],
+            state["payment_method"])
+
+
+def apply_to_rollup(key, amount, count):
+    """
+    atomically add `amount` and `count` to the rollup row of `key`, creating it if missing
+    """
+    month, transaction_type_id, bank_account_id, payment_method = key
+    rows = FinancialMonthlyRollup.objects.filter(month=month, transaction_type_id=transaction_type_id,
+                                                 bank_account_id=bank_account_id, payment_method=payment_method)
+    increment = {"total": F("total") + amount, "count": F("count") + count}
+
+    if rows.update(**increment):
+        return
+    try:
+        with transaction.atomic():
+            FinancialMonthlyRollup.objects.create(month=month, transaction_type_id=transaction_type_id,
+                                                  bank_account_id=bank_account_id, payment_method=payment_method,
+                                                  total=amount, count=count)
+    except IntegrityError:
+        # created concurrently
+        rows.update(**increment)
+
+
+def rebuild_monthly_rollups(batch_size=2000):
+    """
+    recompute the rollup table from scratch in one aggregate pass, returns the number of rows written
+    """
+    FinancialMonthlyRollup.objects.all().delete()
+
+    rows = (FinancialRecord.objects.annotate(month=TruncMonth("date"))
+            .values("month", *ROLLUP_FIELDS)
+            .annotate(total=Sum("amount"), count=Count("id"))
+            .order_by())
+
+    count = 0
+    batch = []
+    for row in rows.iterator(chunk_size=batch_size):
+        batch.append(FinancialMonthlyRollup(
+            month=row["month"],
+            transaction_type_id=row["transaction_type"],
+            bank_account_id=row["bank_account"],
+            payment_method=row["payment_method"],
+            total=row["total"],
+            count=row["count"],
+        ))
+        if len(batch) >= batch_size:
+            FinancialMonthlyRollup.objects.bulk_create(batch)
+            count += len(batch)
+            batch = []
+
+    FinancialMonthlyRollup.objects.bulk_create(batch)
+    return count + len(batch)
+
+
+def _whole_months(from_date, to_date):
+    """
+    [start, end) of the whole months inside the inclusive range, an open range when `to_date` is None
+    """
+    start = from_date if from_date.day == 1 else from_date.replace(day=1) + relativedelta(months=1)
+    if to_date is None:
+        return start, None
+    end = to_date.replace(day=1)
+    if (to_date + timedelta(days=1)).day == 1:
+        end += relativedelta(months=1)
+    return start, max(start, end)
+
+
+def financial_totals(from_date, to_date=None, group_by=(), **filters):
+    """
+    sum ("total") and count of financial records dated between `from_date` and
+    `to_date` (inclusive, open-ended when None) grouped by `group_by`, any of
+    ROLLUP_FIELDS and "month". whole months are read from the rollup table and
+    only the partial months at the edges from the records. `filters` apply to
+    the rollup fields
+    """
+    start, end = _whole_months(from_date, to_date)
+    group_by = tuple(group_by)
+
+    rollups = FinancialMonthlyRollup.objects.filter(month__gte=start, **filters)
+    if end is not None:
+        rollups = rollups.filter(month__lt=end)
+
+    if end == start:
+        rollups = rollups.none()
+        edges = [Q(date__gte=from_date, date__lte=to_date)]
+    else:
+        edges = []
+        if from_date < start:
+            edges.append(Q(date__gte=from_date, date__lt=start))
+        if end is not None and end <= to_date:
+            edges.append(Q(date__gte=end, date__lte=to_date))
+
+    records = FinancialRecord.objects.filter(reduce(or_, edges), **filters) if edges else None
+    if records is not None and "month" in group_by:
+        records = records.annotate(month=TruncMonth("date"))
+
+    def grouped(queryset, total, count):
+        if not group_by:
+            return [queryset.aggregate(row_total=total, row_count=count)]
+        return queryset.values(*group_by).annotate(row_total=total, row_count=count).order_by()
+
+    totals = {}
+    sources = [grouped(rollups, Sum("total"), Sum("count"))]
+    if records is not None:
+        sources.append(grouped(records, Sum("amount"), Count("id")))
+    for source in sources:
+        for row in source:
+            if not row["row_count"]:
+                continue
+            key = tuple(row[field] for field in group_by)
+            entry = totals.setdefault(key, {**{field: row[field] for field in group_by}, "total": 0, "count": 0})
+            entry["total"] += row["row_total"]
+            entry["count"] += row["row_count"]
+
+    return list(totals.values())
+
+
+def records_totals(queryset):
+    """
+    income sum, expense sum, net and count of a FinancialRecord queryset in one conditional aggregate
+    """
+    incomes = Q(transaction_type_id__in=transaction_types.ids("type", [TransactionType.Type.INCOME]))
+    totals = queryset.order_by().aggregate(
+        incomes=Coalesce(Sum("amount", filter=incomes), Value(0), output_field=DecimalField()),
+        expenses=Coalesce(Sum("amount", filter=~incomes), Value(0), output_field=DecimalField()),
+        count=Count("id"),
+    )
+    return {**totals, "net": totals["incomes"] - totals["expenses"]}
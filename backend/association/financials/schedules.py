@@ -0,0 +1,82 @@
+from decimal import Decimal, ROUND_HALF_UP
+
+from dateutil.relativedelta import relativedelta
+from django.db import transaction
+from django.db.models import Sum, Max, Q
+
+from association.utils import delete_rows
+from clients import stats
+from .dues import refresh_client_dues
+from .models import Installment, Repayment
+
+# schedule model -> (sequence number field, plan owner field)
+SCHEDULES = {
+    Installment: ("installment_number", "client"),
+    Repayment: ("repayment_number", "loan"),
+}
+
+
+def split_amount(total, parts, places=2):
+    """
+    split `total` into `parts` amounts that differ by at most one smallest unit
+    and sum exactly to the total, the leftover units go to the first parts
+    """
+    unit = Decimal(1).scaleb(-places)
+    units = int((Decimal(total) / unit).to_integral_value(ROUND_HALF_UP))
+    base, remainder = divmod(units, parts)
+    return [(base + (1 if i < remainder else 0)) * unit for i in range(parts)]
+
+
+def build_schedule(model, total, count, start_date, first_number=1, **fields):
+    """
+    unsaved monthly schedule items of `model` splitting `total` over `count` months from `start_date`
+    """
+    number_field = SCHEDULES[model][0]
+    start = start_date.replace(day=1)
+    return [
+        model(**fields, **{number_field: first_number + i}, amount=amount, due_date=start + relativedelta(months=i))
+        for i, amount in enumerate(split_amount(total, count))
+    ]
+
+
+def _schedule_written(model, owner):
+    # bulk writes skip the per-row signals, refresh what they maintain once
+    refresh_client_dues([owner.pk if model is Installment else owner.client_id])
+    if model is Installment:
+        stats.invalidate_for(Installment)
+
+
+def create_schedule(model, owner, total, count, start_date):
+    """
+    create the schedule of a plan (a client's installments or a loan's repayments) with one INSERT
+    """
+    owner_field = SCHEDULES[model][1]
+    with transaction.atomic():
+        items = model.objects.bulk_create(build_schedule(model, total, count, start_date, **{owner_field: owner}))
+        _schedule_written(model, owner)
+    return items
+
+
+def reschedule(model, owner, count, start_date):
+    """
+    spread the unpaid remainder of a plan over `count` new months from
+    `start_date`, numbered after the remaining paid items. returns the new items
+    """
+    number_field, owner_field = SCHEDULES[model]
+    unpaid = Q(status=model.Status.UNPAID)
+
+    with transaction.atomic():
+        items = model.objects.filter(**{owner_field: owner})
+        plan = items.aggregate(remaining=Sum("amount", filter=unpaid), last_paid=Max(number_field, filter=~unpaid))
+        if not plan["remaining"]:
+            return []
+
+        # no per-row signals, their work is redone once by _schedule_written
+        delete_rows(items.filter(unpaid))
+        new_items = model.objects.bulk_create(build_schedule(
+            model, plan["remaining"], count, start_date, first_number=(plan["last_paid"] or 0) + 1,
+            **{owner_field: owner},
+        ))
+        _schedule_written(model, owner)
+
+    return new_items
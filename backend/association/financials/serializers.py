@@ -2,9 +2,13 @@ from dateutil.relativedelta import relativedelta
 from django.db.models import Count, Q
 from rest_framework import serializers
 from django.conf import settings
+from association.rest_framework_utils.fields import RegistryPrimaryKeyRelatedField
 from .models import BankAccount, TransactionType, FinancialRecord, Subscription, RankFee, Installment, Loan, Repayment
 from rest_framework.validators import UniqueTogetherValidator
 from django.utils.translation import gettext_lazy as _
+from clients.models import Client
+from .registry import transaction_types, bank_accounts, rank_fees
+from .schedules import create_schedule
 
 
 class BankAccountSerializer(serializers.ModelSerializer):
@@ -12,6 +16,13 @@ class BankAccountSerializer(serializers.ModelSerializer):
         model = BankAccount
         fields = '__all__'
 
+    def update(self, instance, validated_data):
+        # financial records move the balance with atomic updates, don't write back a stale copy
+        for attr, value in validated_data.items():
+            setattr(instance, attr, value)
+        instance.save(update_fields=list(validated_data))
+        return instance
+
 
 class TransactionTypeSerializer(serializers.ModelSerializer):
     class Meta:
@@ -44,7 +55,37 @@ class FinancialRecordReadSerializer(serializers.ModelSerializer):
             return {"name": obj.project_transaction.project.name, "id": obj.project_transaction.project.id}
 
 
+class FinancialRecordListSerializer(serializers.ModelSerializer):
+    """
+    flat rows for the records list, ids and names instead of the nested objects
+    of FinancialRecordReadSerializer. expects the relations to be select_related
+    """
+    transaction_type_name = serializers.CharField(source="transaction_type.name")
+    transaction_type_type = serializers.CharField(source="transaction_type.type")
+    bank_account_name = serializers.CharField(source="bank_account.name", default=None)
+    project = serializers.SerializerMethodField()
+    created_at = serializers.SerializerMethodField()
+    created_by = serializers.CharField(source="created_by.name", default=None)
+
+    class Meta:
+        model = FinancialRecord
+        fields = ["id", "amount", "date", "payment_method", "receipt_number", "notes", "transaction_type",
+                  "transaction_type_name", "transaction_type_type", "bank_account", "bank_account_name", "project",
+                  "created_at", "created_by"]
+
+    def get_created_at(self, obj: FinancialRecord):
+        return obj.created_at.astimezone(settings.CAIRO_TZ).strftime("%Y-%m-%d %I:%M%p")
+
+    def get_project(self, obj: FinancialRecord):
+        project_transaction = getattr(obj, "project_transaction", None)
+        if project_transaction:
+            return {"name": project_transaction.project.name, "id": project_transaction.project_id}
+
+
 class FinancialRecordWriteSerializer(serializers.ModelSerializer):
+    transaction_type = RegistryPrimaryKeyRelatedField(transaction_types)
+    bank_account = RegistryPrimaryKeyRelatedField(bank_accounts, allow_null=True, required=False)
+
     class Meta:
         model = FinancialRecord
         fields = '__all__'
@@ -55,6 +96,13 @@ class FinancialRecordWriteSerializer(serializers.ModelSerializer):
         return super(FinancialRecordWriteSerializer, self).create({**validated_data, "created_by": user})
 
 
+class RecordIdsSerializer(serializers.Serializer):
+    ids = serializers.ListField(child=serializers.IntegerField(min_value=1), allow_empty=False, error_messages={
+        "required": _("يجب تحديد العمليات المراد حذفها"),
+        "empty": _("يجب تحديد العمليات المراد حذفها"),
+    })
+
+
 class SubscriptionReadSerializer(serializers.ModelSerializer):
     date = serializers.DateField(format="%Y-%m")
     paid_at = serializers.DateField(format="%Y-%m-%d")
@@ -81,6 +129,68 @@ class SubscriptionWriteSerializer(serializers.ModelSerializer):
         return value.replace(day=1)
 
 
+MAX_BULK_MONTHS = 120
+
+
+class SubscriptionBulkListSerializer(serializers.ListSerializer):
+    def to_internal_value(self, data):
+        items = super().to_internal_value(data)
+
+        # one query for all the members, the monthly fee defaults come from the rank fee registry
+        clients = Client.objects.only("id", "rank").in_bulk({item["client"] for item in items})
+        fees = {rank_fee.rank: rank_fee.fee for rank_fee in rank_fees.all()}
+
+        errors = []
+        for item in items:
+            client = clients.get(item["client"])
+            if client is None:
+                errors.append({"client": [_("عضو غير موجود")]})
+            elif item.get("amount") is None and client.rank not in fees:
+                errors.append({"amount": [_("لا توجد رسوم مسجلة لرتبة العضو، يرجى إدخال المبلغ")]})
+            else:
+                errors.append({})
+        if any(errors):
+            raise serializers.ValidationError(errors)
+
+        return [{**item, "client": clients[item["client"]],
+                 "amount": fees[clients[item["client"]].rank] if item.get("amount") is None else item["amount"]}
+                for item in items]
+
+
+class SubscriptionBulkSerializer(serializers.Serializer):
+    """
+    one member's payment for a month (`date`) or a range of months (`from_date` to `to_date`)
+    """
+    client = serializers.IntegerField()
+    date = serializers.DateField(required=False, input_formats=["%Y-%m", "iso-8601"])
+    from_date = serializers.DateField(required=False, input_formats=["%Y-%m", "iso-8601"])
+    to_date = serializers.DateField(required=False, input_formats=["%Y-%m", "iso-8601"])
+    amount = serializers.DecimalField(max_digits=12, decimal_places=2, min_value=0, required=False, allow_null=True)
+    paid_at = serializers.DateField(required=False, allow_null=True)
+    notes = serializers.CharField(required=False, allow_blank=True, allow_null=True)
+
+    class Meta:
+        list_serializer_class = SubscriptionBulkListSerializer
+
+    def validate(self, data):
+        start = data.get("date") or data.get("from_date")
+        if start is None:
+            raise serializers.ValidationError({"date": _("يرجى تحديد الشهر أو بداية الفترة")})
+        end = data.get("to_date") if data.get("date") is None and data.get("to_date") else start
+
+        start, end = start.replace(day=1), end.replace(day=1)
+        if end < start:
+            raise serializers.ValidationError({"to_date": _("نهاية الفترة يجب أن تكون بعد بدايتها")})
+
+        months = (end.year - start.year) * 12 + end.month - start.month + 1
+        if months > MAX_BULK_MONTHS:
+            raise serializers.ValidationError({"to_date": _("لا يمكن تسجيل أكثر من %(count)d شهرا للعضو")
+                                               % {"count": MAX_BULK_MONTHS}})
+
+        data["months"] = [start + relativedelta(months=i) for i in range(months)]
+        return data
+
+
 class InstallmentSerializer(serializers.ModelSerializer):
     due_date = serializers.DateField(format="%Y-%m")
 
@@ -106,25 +216,15 @@ class LoanSerializer(serializers.ModelSerializer):
         repayments_count = validated_data.pop("repayments_count")
         payment_date = validated_data.pop("payment_date")
 
-        # create the loan instance
+        # create the loan instance and its repayments schedule
         loan = super().create({**validated_data})
-
-        # Calculate repayment amount
-        repayment_amount = loan.amount / repayments_count
-        base_date = payment_date.replace(day=1)
-
-        for i in range(repayments_count):
-            due_date = base_date + relativedelta(months=i)
-            Repayment.objects.create(
-                loan=loan,
-                repayment_number=i + 1,
-                amount=repayment_amount,
-                due_date=due_date,
-            )
+        create_schedule(Repayment, loan, loan.amount, repayments_count, payment_date)
 
         return loan
 
     def get_repayments(self, obj: Loan):
+        if hasattr(obj, "repayments_total"):
+            return {"total": obj.repayments_total, "unpaid": obj.repayments_unpaid, "paid": obj.repayments_paid}
         return obj.repayments.aggregate(total=Count("id"),
                                         unpaid=Count("id", filter=Q(status=Repayment.Status.UNPAID)),
                                         paid=Count("id", filter=Q(status=Repayment.Status.PAID)))
@@ -141,6 +241,13 @@ class LoanSerializer(serializers.ModelSerializer):
                 }
 
 
+class RescheduleSerializer(serializers.Serializer):
+    count = serializers.IntegerField(min_value=1, error_messages={
+        "min_value": _("عدد الشهور يجب أن يكون 1 على الأقل"),
+    })
+    start_date = serializers.DateField()
+
+
 class RepaymentSerializer(serializers.ModelSerializer):
     class Meta:
         model = Repayment
@@ -1,9 +1,12 @@
 from django.apps import apps
-from django.db.models.signals import post_migrate, post_save, post_delete, pre_save
+from django.db.models.signals import post_migrate, post_save, post_delete, pre_save, pre_delete
 from django.dispatch import receiver
-from clients.models import RankChoices
-from financials.models import FinancialRecord, TransactionType
-from decimal import Decimal
+from clients.models import RankChoices, Client
+from financials.dues import refresh_client_dues
+from financials.models import FinancialRecord, Subscription, Installment, Loan, Repayment, BankAccount
+from financials.registry import rank_fees  # noqa, connects the registry invalidation signals
+from financials.balances import TRACKED_FIELDS, record_state, original_state, apply_balance_changes
+from financials.rollups import rollup_key, apply_to_rollup
 
 
 def create_default_rank_fees(sender, **kwargs):
@@ -23,77 +26,81 @@ def create_default_rank_fees(sender, **kwargs):
 post_migrate.connect(create_default_rank_fees)
 
 
-def normalize_amount(amount: Decimal, transaction_type) -> Decimal:
-    if transaction_type == TransactionType.Type.INCOME:
-        return amount
-    else:
-        return -amount
-
-
 @receiver(pre_save, sender=FinancialRecord)
 def store_old_state(sender, instance, **kwargs):
-    if not instance.pk:
-        instance._old_bank = None
-        instance._old_amount = Decimal(0)
+    instance._old_state = None
+    if instance._state.adding:
         return
-    try:
-        old = sender.objects.get(pk=instance.pk)
-        instance._old_bank = old.bank_account
-        instance._old_amount = old.amount
-    except sender.DoesNotExist:
-        instance._old_bank = None
-        instance._old_amount = Decimal(0)
+
+    instance._old_state = original_state(instance)
+    if instance._old_state is None:
+        values = sender.objects.filter(pk=instance.pk).values(*TRACKED_FIELDS).first()
+        instance._old_state = record_state(values) if values else None
 
 
-# update bank balance on create
+# move bank balances with atomic updates
 @receiver(post_save, sender=FinancialRecord)
-def update_balance_on_create(sender, instance: FinancialRecord, created, **kwargs):
-    bank = instance.bank_account
-    amount = Decimal(instance.amount)
+def update_balance_on_save(sender, instance: FinancialRecord, **kwargs):
+    apply_balance_changes(instance._old_state, record_state(instance))
 
-    # handle create
-    if created:
-        if instance.payment_method == FinancialRecord.PaymentMethod.CASH:
-            return
 
-        if not bank:
-            return
+@receiver(post_delete, sender=FinancialRecord)
+def update_balance_on_delete(sender, instance: FinancialRecord, **kwargs):
+    apply_balance_changes(old_state=original_state(instance) or record_state(instance))
+
 
-        bank.balance += normalize_amount(amount, instance.transaction_type.type)
+# keep the monthly rollups current
+@receiver(post_save, sender=FinancialRecord)
+def update_rollup_on_save(sender, instance: FinancialRecord, **kwargs):
+    old, new = instance._old_state, record_state(instance)
+    key, old_key = rollup_key(new), old and rollup_key(old)
 
-    # handle update
-    else:
-        old_bank = getattr(instance, '_old_bank', None)
-        old_amount = getattr(instance, '_old_amount', None)
+    if old_key == key:
+        if new["amount"] != old["amount"]:
+            apply_to_rollup(key, new["amount"] - old["amount"], 0)
+        return
 
-        # same bank
-        if old_bank == instance.bank_account:
-            diff = amount - old_amount
-            bank.balance += normalize_amount(diff, instance.transaction_type.type)
+    if old_key is not None:
+        apply_to_rollup(old_key, -old["amount"], -1)
+    apply_to_rollup(key, new["amount"], 1)
 
-        # bank changed
-        else:
-            new_amount = normalize_amount(amount, instance.transaction_type.type)
 
-            if bank and instance.payment_method != FinancialRecord.PaymentMethod.CASH:
-                bank.balance += new_amount
+@receiver(post_delete, sender=FinancialRecord)
+def update_rollup_on_delete(sender, instance: FinancialRecord, **kwargs):
+    state = original_state(instance) or record_state(instance)
+    apply_to_rollup(rollup_key(state), -state["amount"], -1)
 
-            if old_bank:
-                old_bank.balance -= new_amount
-                old_bank.save(update_fields=["balance"])
 
-    if bank:
-        bank.save(update_fields=['balance'])
+@receiver(pre_delete, sender=BankAccount)
+def fold_bank_rollups(sender, instance: BankAccount, **kwargs):
+    # the account's records are kept without an account (SET_NULL), move their rollups the same way
+    for rollup in instance.monthly_rollups.all():
+        apply_to_rollup((rollup.month, rollup.transaction_type_id, None, rollup.payment_method),
+                        rollup.total, rollup.count)
 
 
-@receiver(post_delete, sender=FinancialRecord)
-def delete_balance_on_create(sender, instance: FinancialRecord, **kwargs):
-    bank = instance.bank_account
-    if not bank:
+# keep the ClientDues snapshot current
+@receiver(post_save, sender=Client)
+def refresh_dues_on_client_save(sender, instance: Client, **kwargs):
+    update_fields = kwargs.get("update_fields")
+    if update_fields is not None and not {"subscription_date", "is_active"} & set(update_fields):
         return
+    refresh_client_dues([instance.pk])
+
 
-    amount = Decimal(instance.amount)
+@receiver(post_save, sender=Subscription)
+@receiver(post_delete, sender=Subscription)
+@receiver(post_save, sender=Installment)
+@receiver(post_delete, sender=Installment)
+@receiver(post_save, sender=Loan)
+@receiver(post_delete, sender=Loan)
+def refresh_dues_on_client_records(sender, instance, **kwargs):
+    refresh_client_dues([instance.client_id])
 
-    bank.balance -= normalize_amount(amount, instance.transaction_type.type)
 
-    bank.save(update_fields=['balance'])
+@receiver(post_save, sender=Repayment)
+@receiver(post_delete, sender=Repayment)
+def refresh_dues_on_repayment(sender, instance: Repayment, **kwargs):
+    # the loan may already be gone when repayments are cascade-deleted, its own signal covers that case
+    client_id = Loan.objects.filter(pk=instance.loan_id).values_list("client_id", flat=True).first()
+    refresh_client_dues([client_id])
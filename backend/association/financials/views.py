@@ -1,26 +1,54 @@
+from collections import defaultdict
 from io import BytesIO
 
 import openpyxl
+from django.conf import settings
 from django.http import FileResponse
 from rest_framework.decorators import action, api_view, permission_classes
-from django.db.models import RestrictedError, Sum, Q, F, Value, DecimalField
-from django.db.models.functions import Coalesce
+from dateutil.relativedelta import relativedelta
+from django.db.models import RestrictedError, F, OuterRef, Subquery, Exists
 from django.utils.dateparse import parse_date
 from rest_framework.viewsets import ModelViewSet
 
+from association.exports import EXPORT_RENDERER_CLASSES, get_export_format, streaming_export
 from association.rest_framework_utils.custom_pagination import CustomPageNumberPagination
 from association.utils import clean_excel_name
 from clients.models import Client
+from clients.search import search_clients, search_rank
+from . import registry
+from .registry import rank_fees
 from .resources import fieldLabels
+from .bulk import bulk_create_records, bulk_delete_records, bulk_pay_subscriptions
+from .rollups import financial_totals, records_totals
+from .schedules import reschedule
 from .serializers import BankAccountSerializer, TransactionTypeSerializer, FinancialRecordReadSerializer, \
-    FinancialRecordWriteSerializer, RankFeeSerializer, SubscriptionWriteSerializer, SubscriptionReadSerializer, \
-    InstallmentSerializer, LoanSerializer, RepaymentSerializer
+    FinancialRecordListSerializer, FinancialRecordWriteSerializer, RankFeeSerializer, SubscriptionWriteSerializer, \
+    SubscriptionReadSerializer, InstallmentSerializer, LoanSerializer, RepaymentSerializer, RescheduleSerializer, \
+    SubscriptionBulkSerializer, RecordIdsSerializer
 from rest_framework.response import Response
 from rest_framework import status, permissions
 from django.utils.translation import gettext_lazy as _
 from datetime import datetime, date
 from .models import BankAccount, TransactionType, FinancialRecord, Subscription, RankFee, Installment, Loan, Repayment
-from uuid import uuid4
+
+
+def _format_transaction_type(name, project_name):
+    return f"{name} ({project_name})" if project_name else name
+
+
+# field -> (values_list lookups, formatter) for the streaming export
+export_columns = {
+    "amount": (("amount",), float),
+    "transaction_type": (("transaction_type__name", "project_transaction__project__name"), _format_transaction_type),
+    "date": (("date",), None),
+    "payment_method": (("payment_method",), None),
+    "bank_account": (("bank_account__name",), None),
+    "receipt_number": (("receipt_number",), None),
+    "notes": (("notes",), None),
+    "created_at": (("created_at",),
+                   lambda created_at: created_at.astimezone(settings.CAIRO_TZ).strftime("%Y-%m-%d %I:%M%p")),
+    "created_by": (("created_by__name",), None),
+}
 
 
 class BankAccountViewSet(ModelViewSet):
@@ -57,6 +85,10 @@ class RankFeeViewSet(ModelViewSet):
     serializer_class = RankFeeSerializer
 
 
+# relations read by the financial record serializers
+RECORD_RELATIONS = ("transaction_type", "bank_account", "created_by", "project_transaction__project")
+
+
 class FinancialRecordViewSet(ModelViewSet):
     queryset = FinancialRecord.objects.all()
 
@@ -84,7 +116,7 @@ class FinancialRecordViewSet(ModelViewSet):
             queryset = queryset.filter(date__gte=from_date, date__lte=to_date)
 
         if type is not None:
-            queryset = queryset.filter(transaction_type__type=type)
+            queryset = queryset.filter(transaction_type_id__in=registry.transaction_types.ids("type", [type]))
 
         if len(payment_methods) > 0:
             payment_methods = payment_methods.split(',')
@@ -92,26 +124,45 @@ class FinancialRecordViewSet(ModelViewSet):
 
         if len(transaction_types) > 0:
             transaction_types = transaction_types.split(',')
-            queryset = queryset.filter(transaction_type__name__in=transaction_types)
+            queryset = queryset.filter(transaction_type_id__in=registry.transaction_types.ids("name", transaction_types))
 
         if len(bank_accounts) > 0:
             bank_accounts = bank_accounts.split(',')
-            queryset = queryset.filter(bank_account__name__in=bank_accounts)
+            queryset = queryset.filter(bank_account_id__in=registry.bank_accounts.ids("name", bank_accounts))
 
         if sort_by is not None:
             queryset = queryset.order_by(f"{order}{sort_by}")
 
+        if self.action in ["list", "retrieve", "export"]:
+            queryset = queryset.select_related(*RECORD_RELATIONS)
+
         return queryset
 
+    def list(self, request, *args, **kwargs):
+        response = super().list(request, *args, **kwargs)
+
+        # `?with_totals=1` adds the totals of the whole filtered queryset next to the page
+        if request.query_params.get("with_totals") in ("1", "true"):
+            totals = records_totals(self.filter_queryset(self.get_queryset()))
+            if isinstance(response.data, dict):
+                response.data["totals"] = totals
+            else:
+                response.data = {"data": response.data, "totals": totals}
+
+        return response
+
     def get_serializer_class(self):
         if self.action in ["create", "update", "partial_update"]:
             return FinancialRecordWriteSerializer
+        # `?serializer=flat` lists ids and names instead of the nested objects
+        if self.action == "list" and self.request.query_params.get("serializer") == "flat":
+            return FinancialRecordListSerializer
         return FinancialRecordReadSerializer
 
     @action(detail=True, methods=['get'])
     def detailed(self, request, pk=None):
         try:
-            record = FinancialRecord.objects.get(pk=pk)
+            record = FinancialRecord.objects.select_related(*RECORD_RELATIONS).get(pk=pk)
             data = FinancialRecordReadSerializer(record, context={"request": self.request}).data
             return Response(data)
         except Exception:
@@ -126,7 +177,27 @@ class FinancialRecordViewSet(ModelViewSet):
         except Exception:
             return Response({'detail': _('عملية غير موجودة')}, status=status.HTTP_404_NOT_FOUND)
 
-    @action(detail=False, methods=["get"], url_path="export")
+    @action(detail=False, methods=["post", "delete"], url_path="bulk")
+    def bulk(self, request):
+        """
+        POST a list of records to create them, DELETE {"ids": [...]} to remove records,
+        balances and rollups are adjusted once per account
+        """
+        if request.method == "DELETE":
+            serializer = RecordIdsSerializer(data=request.data)
+            serializer.is_valid(raise_exception=True)
+
+            deleted = bulk_delete_records(FinancialRecord.objects.filter(pk__in=serializer.validated_data["ids"]))
+            return Response({"deleted": deleted}, status=status.HTTP_200_OK)
+
+        serializer = FinancialRecordWriteSerializer(data=request.data, many=True, context={"request": request})
+        serializer.is_valid(raise_exception=True)
+
+        records = bulk_create_records([FinancialRecord(**data, created_by=request.user)
+                                       for data in serializer.validated_data])
+        return Response(FinancialRecordWriteSerializer(records, many=True).data, status=status.HTTP_201_CREATED)
+
+    @action(detail=False, methods=["get"], url_path="export", renderer_classes=EXPORT_RENDERER_CLASSES)
     def export(self, request):
         queryset = self.get_queryset()
         fields = request.query_params.get("fields", None)
@@ -136,6 +207,10 @@ class FinancialRecordViewSet(ModelViewSet):
 
         fields = fields.split(",")
 
+        export_format = get_export_format(request)
+        if export_format is not None:
+            return streaming_export(queryset, fields, fieldLabels, export_columns, export_format, "السجلات_المالية")
+
         serializer = FinancialRecordReadSerializer(
             queryset, many=True, context={"request": request}
         )
@@ -167,7 +242,8 @@ class FinancialRecordViewSet(ModelViewSet):
                     if item.get("project", None):
                         value += f" ({item['project']['name']})"
                 elif field == "bank_account":
-                    value = value.get("name", "-")
+                    # cash records have no bank account
+                    value = value.get("name", "-") if isinstance(value, dict) else "-"
                 elif field == "amount":
                     value = float(value) if value not in ("-", None) else 0.0
                 else:
@@ -196,6 +272,21 @@ class SubscriptionViewSet(ModelViewSet):
             return SubscriptionWriteSerializer
         return SubscriptionReadSerializer
 
+    @action(detail=False, methods=["post"], url_path="bulk")
+    def bulk(self, request):
+        """
+        pay a list of {"client", "date"} or {"client", "from_date", "to_date"} items, the
+        amount defaults to the member's rank fee and months already paid are skipped
+        """
+        serializer = SubscriptionBulkSerializer(data=request.data, many=True)
+        serializer.is_valid(raise_exception=True)
+
+        results = bulk_pay_subscriptions(serializer.validated_data)
+        for result in results:
+            result["created"] = [month.strftime("%Y-%m") for month in result["created"]]
+            result["already_paid"] = [month.strftime("%Y-%m") for month in result["already_paid"]]
+        return Response(results, status=status.HTTP_201_CREATED)
+
 
 class InstallmentViewSet(ModelViewSet):
     queryset = Installment.objects.all()
@@ -212,6 +303,22 @@ class InstallmentViewSet(ModelViewSet):
 
         return queryset
 
+    @action(detail=False, methods=['post'])
+    def reschedule(self, request):
+        """
+        spread a client's unpaid installments over `count` months from `start_date`
+        """
+        try:
+            client = Client.objects.get(pk=request.data.get("client"))
+        except (Client.DoesNotExist, ValueError, TypeError):
+            return Response({'detail': _('عضو غير موجود')}, status=status.HTTP_404_NOT_FOUND)
+
+        serializer = RescheduleSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        installments = reschedule(Installment, client, **serializer.validated_data)
+        return Response(InstallmentSerializer(installments, many=True).data, status=status.HTTP_200_OK)
+
     @action(detail=True, methods=['patch'])
     def payment(self, request, pk=None):
         try:
@@ -222,7 +329,7 @@ class InstallmentViewSet(ModelViewSet):
             installment.amount = data["amount"]
             installment.paid_at = data["paid_at"]
             installment.notes = data["notes"]
-            installment.save()
+            installment.save_changed()
 
             return Response({"detail": _("تم تسجيل دفع القسط بنجاح")}, status=status.HTTP_200_OK)
         except Exception:
@@ -235,7 +342,7 @@ class InstallmentViewSet(ModelViewSet):
             installment.status = Installment.Status.UNPAID
             installment.paid_at = None
             installment.notes = None
-            installment.save()
+            installment.save_changed()
             return Response({"detail": _("تم إلفاء دفع القسط بنجاح")}, status=status.HTTP_200_OK)
 
         except Exception:
@@ -262,19 +369,31 @@ class LoanViewSet(ModelViewSet):
         clients_qs = Client.objects.all()
 
         if search not in (None, ""):
-            try:
-                if search_type == "membership_number" and not search.isdigit():
-                    raise ValueError("membership_number must be an integer")
-                clients_qs = clients_qs.filter(**{search_type: search})
-                queryset = queryset.filter(client__in=clients_qs)
-            except ValueError:
-                pass
+            queryset = queryset.filter(client__in=search_clients(clients_qs, search, search_type)).annotate(
+                search_rank=search_rank(search, search_type, OuterRef("client_id")))
 
         if sort_by is not None:
             queryset = queryset.order_by(f"{order}{sort_by}")
+        elif search not in (None, ""):
+            queryset = queryset.order_by("-search_rank", *Loan._meta.ordering)
+
+        if self.action in ["list", "retrieve"]:
+            queryset = queryset.select_related("client").with_repayment_counts()
 
         return queryset
 
+    @action(detail=True, methods=["post"])
+    def reschedule(self, request, pk=None):
+        """
+        spread the loan's unpaid repayments over `count` months from `start_date`
+        """
+        loan = self.get_object()
+        serializer = RescheduleSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        repayments = reschedule(Repayment, loan, **serializer.validated_data)
+        return Response(RepaymentSerializer(repayments, many=True).data, status=status.HTTP_200_OK)
+
     @action(detail=True, methods=["get"])
     def export_repayments(self, request, pk=None):
         try:
@@ -352,7 +471,7 @@ class RepaymentViewSet(ModelViewSet):
             repayment.amount = data["amount"]
             repayment.paid_at = data["paid_at"]
             repayment.notes = data["notes"]
-            repayment.save()
+            repayment.save_changed()
 
             return Response({"detail": _("تم تسجيل دفع السداد بنجاح")}, status=status.HTTP_200_OK)
 
@@ -366,10 +485,7 @@ class RepaymentViewSet(ModelViewSet):
             repayment.status = Repayment.Status.UNPAID
             repayment.paid_at = None
             repayment.notes = None
-            repayment.save()
-
-            if repayment.financial_record:
-                repayment.financial_record.delete()
+            repayment.save_changed()
 
             return Response({"detail": _("تم إلغاء دفع السداد بنجاح")}, status=status.HTTP_200_OK)
 
@@ -404,78 +520,32 @@ def get_financials_stats(request):
             status=status.HTTP_400_BAD_REQUEST,
         )
 
-    # incomes & expenses totals
-    month_incomes = (
-            FinancialRecord.objects.filter(
-                date__range=[from_date, to_date],
-                transaction_type__type=TransactionType.Type.INCOME,
-            ).aggregate(Sum("amount"))["amount__sum"]
-            or 0
-    )
-    month_expenses = (
-            FinancialRecord.objects.filter(
-                date__range=[from_date, to_date],
-                transaction_type__type=TransactionType.Type.EXPENSE,
-            ).aggregate(Sum("amount"))["amount__sum"]
-            or 0
+    # whole months come from the monthly rollups, grouped once and split in python
+    type_totals = {TransactionType.Type.INCOME: 0, TransactionType.Type.EXPENSE: 0}
+    account_totals = {kind: defaultdict(int) for kind in type_totals}
+    transaction_totals = {kind: defaultdict(int) for kind in type_totals}
+
+    for row in financial_totals(from_date, to_date, group_by=("transaction_type", "bank_account")):
+        transaction_type = registry.transaction_types.get(id=row["transaction_type"])
+        type_totals[transaction_type.type] += row["total"]
+        account_totals[transaction_type.type][row["bank_account"]] += row["total"]
+        transaction_totals[transaction_type.type][transaction_type] += row["total"]
+
+    month_incomes = type_totals[TransactionType.Type.INCOME]
+    month_expenses = type_totals[TransactionType.Type.EXPENSE]
+
+    # accounts incomes & expenses
+    accounts_incomes, accounts_expenses = (
+        [{"name": account.name, "value": account_totals[kind].get(account.id, 0)}
+         for account in registry.bank_accounts.all()]
+        for kind in (TransactionType.Type.INCOME, TransactionType.Type.EXPENSE)
     )
 
-    # accounts incomes
-    accounts_incomes = (
-        BankAccount.objects.annotate(
-            value=Coalesce(
-                Sum(
-                    "financialrecord__amount",
-                    filter=Q(
-                        financialrecord__date__range=[from_date, to_date],
-                        financialrecord__transaction_type__type=TransactionType.Type.INCOME,
-                    ),
-                ),
-                Value(0),
-                output_field=DecimalField(),
-            )
-        )
-        .values("name", "value")
-    )
-
-    # accounts expenses
-    accounts_expenses = (
-        BankAccount.objects.annotate(
-            value=Coalesce(
-                Sum(
-                    "financialrecord__amount",
-                    filter=Q(
-                        financialrecord__date__range=[from_date, to_date],
-                        financialrecord__transaction_type__type=TransactionType.Type.EXPENSE,
-                    ),
-                ),
-                Value(0),
-                output_field=DecimalField(),
-            )
-        )
-        .values("name", "value")
-    )
-
-    # income stats grouped by transaction type
-    incomes_stats = (
-        FinancialRecord.objects.filter(
-            date__range=[from_date, to_date],
-            transaction_type__type=TransactionType.Type.INCOME,
-        )
-        .values(name=F("transaction_type__name"), type=F("transaction_type__type"))
-        .annotate(value=Sum("amount"))
-        .order_by("-value")[:4]
-    )
-
-    # expense stats grouped by transaction type
-    expenses_stats = (
-        FinancialRecord.objects.filter(
-            date__range=[from_date, to_date],
-            transaction_type__type=TransactionType.Type.EXPENSE,
-        )
-        .values(name=F("transaction_type__name"), type=F("transaction_type__type"))
-        .annotate(value=Sum("amount"))
-        .order_by("-value")[:4]
+    # income & expense stats grouped by transaction type
+    incomes_stats, expenses_stats = (
+        [{"name": transaction_type.name, "type": transaction_type.type, "value": value}
+         for transaction_type, value in sorted(transaction_totals[kind].items(), key=lambda item: -item[1])[:4]]
+        for kind in (TransactionType.Type.INCOME, TransactionType.Type.EXPENSE)
     )
 
     return Response(
@@ -525,21 +595,18 @@ def get_month_subscriptions(request):
     paid_status = request.query_params.get("status", None)
     search_type = request.query_params.get('search_type', "name__icontains")
 
-    cutoff = date(int(year), int(month), 1)
-
     if not month or not year:
         return Response({"detail": _("يجب تحديد الشهر والسنة")}, status=status.HTTP_400_BAD_REQUEST)
 
-    clients_qs = Client.objects.filter(is_active=True, subscription_date__lt=cutoff).only("id", "name", "rank",
-                                                                                          "membership_number")
+    cutoff = date(int(year), int(month), 1)
+    next_month = cutoff + relativedelta(months=1)
+
+    clients_qs = Client.objects.filter(is_active=True, subscription_date__lt=cutoff)
 
+    ordering = ["id"]
     if search not in (None, ""):
-        try:
-            if search_type == "membership_number" and not search.isdigit():
-                raise ValueError("membership_number must be an integer")
-            clients_qs = clients_qs.filter(**{search_type: search})
-        except ValueError:
-            pass
+        clients_qs = search_clients(clients_qs, search, search_type, rank=True)
+        ordering = ["-search_rank", "id"]
 
     # Normalize paid_status
     if paid_status in ("", None):
@@ -547,19 +614,33 @@ def get_month_subscriptions(request):
     else:
         allowed_statuses = set(paid_status.split(","))
 
-    clients = list(clients_qs.values("id", "name", "rank", "membership_number"))
+    # paid/unpaid status is resolved in SQL so only the requested page is materialized
+    month_subscriptions = Subscription.objects.filter(client=OuterRef("pk"), date__gte=cutoff, date__lt=next_month)
 
-    subs = Subscription.objects.filter(
-        date__month=month, date__year=year
-    ).select_related("client")
-    subs_map = {s.client_id: s for s in subs}
+    include_paid, include_unpaid = "paid" in allowed_statuses, "unpaid" in allowed_statuses
+    if include_paid and not include_unpaid:
+        clients_qs = clients_qs.filter(Exists(month_subscriptions))
+    elif include_unpaid and not include_paid:
+        clients_qs = clients_qs.filter(~Exists(month_subscriptions))
+    elif not include_paid and not include_unpaid:
+        clients_qs = clients_qs.none()
 
-    fees = {r.rank: r.fee for r in RankFee.objects.all()}
+    clients_qs = clients_qs.annotate(
+        subscription_id=Subquery(month_subscriptions.order_by("id").values("id")[:1])
+    ).order_by(*ordering).values("id", "name", "rank", "membership_number", "subscription_id")
+
+    paginator = CustomPageNumberPagination()
+    page = paginator.paginate_queryset(clients_qs, request)
+    clients = page if page is not None else list(clients_qs)
+
+    subs_map = Subscription.objects.in_bulk([client["subscription_id"] for client in clients
+                                             if client["subscription_id"] is not None])
+    fees = {r.rank: r.fee for r in rank_fees.all()}
 
     results = []
     for client in clients:
-        sub = subs_map.get(client["id"])
-        if sub and "paid" in allowed_statuses:
+        sub = subs_map.get(client["subscription_id"])
+        if sub:
             results.append({
                 "id": sub.id,
                 "client": client["name"],
@@ -572,9 +653,9 @@ def get_month_subscriptions(request):
                 "date": sub.date,
                 "notes": sub.notes,
             })
-        elif not sub and "unpaid" in allowed_statuses:
+        else:
             results.append({
-                "id": str(uuid4()),  # temporary key
+                "id": f"unpaid-{client['id']}",  # temporary key
                 "client": client["name"],
                 "client_id": client["id"],
                 "membership_number": client["membership_number"],
@@ -582,14 +663,12 @@ def get_month_subscriptions(request):
                 "amount": fees.get(client["rank"], 0),
                 "status": "غير مدفوع",
                 "paid_at": None,
-                "date": date(int(year), int(month), 1).strftime("%Y-%m-%d"),
+                "date": cutoff.strftime("%Y-%m-%d"),
                 "notes": None,
             })
 
-    paginator = CustomPageNumberPagination()
-    page = paginator.paginate_queryset(results, request)
     if page is not None:
-        return paginator.get_paginated_response(page)
+        return paginator.get_paginated_response(results)
 
     return Response(results)
 
@@ -605,35 +684,49 @@ def get_month_installments(request):
     if not month or not year:
         return Response({"detail": _("يجب تحديد الشهر والسنة")}, status=status.HTTP_400_BAD_REQUEST)
 
-    clients_qs = Client.objects.filter(is_active=True)
+    start = date(int(year), int(month), 1)
+    installments = Installment.objects.filter(
+        due_date__gte=start, due_date__lt=start + relativedelta(months=1), client__is_active=True
+    )
 
+    ordering = ["client_id", "installment_number"]
     if search not in (None, ""):
-        try:
-            if search_type == "membership_number" and not search.isdigit():
-                raise ValueError("membership_number must be an integer")
-            clients_qs = clients_qs.filter(**{search_type: search})
-        except ValueError:
-            pass
-
-    installments = Installment.objects.filter(
-        due_date__month=month, due_date__year=year, client__in=clients_qs
-    ).select_related("client")
+        installments = installments.filter(client__in=search_clients(Client.objects.all(), search, search_type)) \
+            .annotate(search_rank=search_rank(search, search_type, OuterRef("client_id")))
+        ordering = ["-search_rank", *ordering]
 
     if len(paid_status) > 0:
         status_filter = paid_status.split(',')
         installments = installments.filter(status__in=status_filter)
 
-    results = [{
-        **InstallmentSerializer(instance=ins, context={"request": request}).data,
-        "client": ins.client.name,
-        "client_id": ins.client.id,
-        "membership_number": ins.client.membership_number,
-        "rank": ins.client.rank,
-    } for ins in installments]
+    # only the page's rows and columns are loaded, formatted like InstallmentSerializer
+    installments = installments.order_by(*ordering).values(
+        "id", "installment_number", "due_date", "amount", "status", "notes", "paid_at", "client_id",
+        client_name=F("client__name"),
+        client_membership_number=F("client__membership_number"),
+        client_rank=F("client__rank"),
+    )
 
     paginator = CustomPageNumberPagination()
-    page = paginator.paginate_queryset(results, request)
+    page = paginator.paginate_queryset(installments, request)
+    rows = page if page is not None else installments
+
+    fields = InstallmentSerializer().fields
+    results = [{
+        "id": row["id"],
+        "installment_number": row["installment_number"],
+        "due_date": fields["due_date"].to_representation(row["due_date"]),
+        "amount": fields["amount"].to_representation(row["amount"]),
+        "status": row["status"],
+        "notes": row["notes"],
+        "paid_at": row["paid_at"] and fields["paid_at"].to_representation(row["paid_at"]),
+        "client": row["client_name"],
+        "client_id": row["client_id"],
+        "membership_number": row["client_membership_number"],
+        "rank": row["client_rank"],
+    } for row in rows]
+
     if page is not None:
-        return paginator.get_paginated_response(page)
+        return paginator.get_paginated_response(results)
 
     return Response(results)
@@ -1,12 +1,61 @@
+from dateutil.relativedelta import relativedelta
 from django.db import models
-from django.db.models import Sum
+from django.db.models import Sum, Q, F, Value, DecimalField
+from django.db.models.functions import Coalesce, TruncMonth
 from django.utils.translation import gettext_lazy as _
 from django.conf import settings
 
+from association.tracking import OriginalValuesMixin
 from financials.models import TransactionType
-
-
-class Project(models.Model):
+from financials.registry import transaction_types
+
+
+def _totals_by_type(amount_lookup, transaction_type_lookup):
+    """
+    income and expense sums of the financial records reached through the lookups,
+    matching on the transaction type id to avoid joining the transaction types
+    """
+    def total(kind):
+        ids = transaction_types.ids("type", [kind])
+        return Coalesce(Sum(amount_lookup, filter=Q(**{f"{transaction_type_lookup}__in": ids})),
+                        Value(0), output_field=DecimalField())
+
+    return {"total_income": total(TransactionType.Type.INCOME), "total_expense": total(TransactionType.Type.EXPENSE)}
+
+
+class ProjectQuerySet(models.QuerySet):
+    def with_totals(self):
+        """
+        annotate total_income, total_expense and net_income of every project in the same query
+        """
+        return self.annotate(**_totals_by_type("transactions__financial_record__amount",
+                                               "transactions__financial_record__transaction_type")).annotate(
+            net_income=F("total_income") - F("total_expense"))
+
+    def totals(self):
+        """
+        total_income and total_expense of all the projects together in one aggregate
+        """
+        return ProjectTransaction.objects.filter(project__in=self).aggregate(
+            **_totals_by_type("financial_record__amount", "financial_record__transaction_type"))
+
+    def monthly_totals(self, start, end):
+        """
+        {(project id, month): (total_income, total_expense)} of the months from
+        `start` to `end` (inclusive) in one grouped query, months without
+        records are missing
+        """
+        rows = (ProjectTransaction.objects
+                .filter(project__in=self, financial_record__date__gte=start.replace(day=1),
+                        financial_record__date__lt=end.replace(day=1) + relativedelta(months=1))
+                .annotate(month=TruncMonth("financial_record__date"))
+                .values("project", "month")
+                .annotate(**_totals_by_type("financial_record__amount", "financial_record__transaction_type"))
+                .order_by())
+        return {(row["project"], row["month"]): (row["total_income"], row["total_expense"]) for row in rows}
+
+
+class Project(OriginalValuesMixin, models.Model):
     class Status(models.TextChoices):
         IN_PROGRESS = "قيد التنفيذ", _("قيد التنفيذ")
         COMPLETED = "منتهي", _("منتهي")
@@ -39,6 +88,8 @@ class Project(models.Model):
         verbose_name=_("أنشئ بواسطة")
     )
 
+    objects = ProjectQuerySet.as_manager()
+
     class Meta:
         verbose_name = _("مشروع")
         verbose_name_plural = _("المشاريع")
@@ -48,18 +99,22 @@ class Project(models.Model):
 
     @property
     def total_incomes(self):
+        if hasattr(self, "total_income"):
+            return self.total_income
         return ProjectTransaction.objects.filter(project=self,
                                                  financial_record__transaction_type__type=TransactionType.Type.INCOME).aggregate(
             total=Sum('financial_record__amount'))["total"] or 0
 
     @property
     def total_expenses(self):
+        if hasattr(self, "total_expense"):
+            return self.total_expense
         return ProjectTransaction.objects.filter(project=self,
                                                  financial_record__transaction_type__type=TransactionType.Type.EXPENSE).aggregate(
             total=Sum('financial_record__amount'))["total"] or 0
 
 
-class ProjectTransaction(models.Model):
+class ProjectTransaction(OriginalValuesMixin, models.Model):
     statement = models.CharField(
         max_length=255,
         verbose_name=_("البيان"),
@@ -2,6 +2,7 @@ from django.db import transaction
 from django.db.models import Sum
 
 from financials.models import BankAccount, FinancialRecord, TransactionType
+from financials.registry import get_system_transaction_type
 from .models import Project, ProjectTransaction
 from rest_framework import serializers
 
@@ -95,13 +96,9 @@ class ProjectTransactionWriteSerializer(serializers.ModelSerializer):
     def create(self, validated_data):
         transaction_type = validated_data.pop("transaction_type")
         if transaction_type == "income":
-            transaction_type, __ = TransactionType.objects.get_or_create(name="إيرادات مشاريع",
-                                                                         type=TransactionType.Type.INCOME,
-                                                                         system_related=True)
+            transaction_type = get_system_transaction_type("إيرادات مشاريع", TransactionType.Type.INCOME)
         elif transaction_type == "expense":
-            transaction_type, __ = TransactionType.objects.get_or_create(name="مصروفات مشاريع",
-                                                                         type=TransactionType.Type.EXPENSE,
-                                                                         system_related=True)
+            transaction_type = get_system_transaction_type("مصروفات مشاريع", TransactionType.Type.EXPENSE)
 
         financial_data = {
             "amount": validated_data.pop("amount"),
@@ -1,3 +1,104 @@
+from datetime import date
+from io import BytesIO
+
+import openpyxl
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from financials.models import FinancialRecord, TransactionType
+from financials.registry import transaction_types
+from users.models import User
+from .models import Project, ProjectTransaction
+
+
+def add_transaction(project, amount, transaction_type, record_date=date(2025, 1, 1)):
+    record = FinancialRecord.objects.create(amount=amount, transaction_type=transaction_type, date=record_date,
+                                            payment_method=FinancialRecord.PaymentMethod.CASH)
+    return ProjectTransaction.objects.create(statement="بيان", financial_record=record, project=project)
+
+
+class ProjectTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username="admin", password="admin", name="مدير")
+        cls.income = TransactionType.objects.create(name="إيرادات مشاريع", type=TransactionType.Type.INCOME,
+                                                    system_related=True)
+        cls.expense = TransactionType.objects.create(name="مصروفات مشاريع", type=TransactionType.Type.EXPENSE,
+                                                     system_related=True)
+        cls.first = Project.objects.create(name="مشروع 1", start_date=date(2025, 1, 1), created_by=cls.user)
+        cls.second = Project.objects.create(name="مشروع 2", start_date=date(2025, 1, 1))
+        add_transaction(cls.first, 300, cls.income)
+        add_transaction(cls.first, 100, cls.expense)
+        add_transaction(cls.first, 50, cls.income, date(2025, 2, 1))
+
+    def setUp(self):
+        self.api = APIClient()
+        self.api.force_authenticate(self.user)
+
+
+class ProjectExportTests(ProjectTestCase):
+    def test_csv_export_totals(self):
+        response = self.api.get("/api/projects/projects/export_totals/", {
+            "fields": "name,created_by,total_income,total_expense,net_income",
+            "format": "csv",
+        })
+
+        lines = b"".join(response.streaming_content).decode("utf-8").lstrip("\ufeff").splitlines()
+        self.assertEqual(lines[0], "اسم المشروع,أنشئ بواسطة,إجمالي الإيرادات,إجمالي المصروفات,الصافي")
+        self.assertEqual(sorted(lines[1:]), ["مشروع 1,مدير,350,100,250", "مشروع 2,,0,0,0"])
+
+
+class ProjectTotalsTests(ProjectTestCase):
+    def setUp(self):
+        super().setUp()
+        transaction_types.all()
+
+    def test_list_totals_are_annotated(self):
+        with self.assertNumQueries(2):
+            response = self.api.get("/api/projects/projects/", {"sort_by": "id", "order": ""})
+
+        self.assertEqual([(row["name"], row["total_incomes"], row["total_expenses"]) for row in response.data["data"]],
+                         [("مشروع 1", 350, 100), ("مشروع 2", 0, 0)])
+
+        with self.assertNumQueries(1):
+            response = self.api.get(f"/api/projects/projects/{self.first.id}/")
+        self.assertEqual((response.data["total_incomes"], response.data["total_expenses"]), (350, 100))
+
+    def test_properties_without_annotations(self):
+        self.assertEqual((self.first.total_incomes, self.first.total_expenses), (350, 100))
+
+    def test_stats(self):
+        with self.assertNumQueries(2):
+            response = self.api.get("/api/projects/get-projects-stats/")
+
+        self.assertEqual(response.data, {"total_projects": 2, "in_progress": 2, "completed": 0,
+                                         "total_incomes": 350, "total_expenses": 100, "net": 250})
+
+
+class ProjectMonthlyExportTests(ProjectTestCase):
+    def setUp(self):
+        super().setUp()
+        transaction_types.all()
+
+    def export(self, start, end):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.api.get("/api/projects/projects/export_monthly/", {
+                "fields": "total_income,total_expense,net_income", "start": start, "end": end,
+                "sort_by": "id", "order": "",
+            })
+        self.assertEqual(response.status_code, 200)
+        sheet = openpyxl.load_workbook(BytesIO(b"".join(response.streaming_content))).active
+        return [list(row) for row in sheet.iter_rows(values_only=True)], len(queries)
+
+    def test_monthly_pivot(self):
+        rows, short_queries = self.export("2024-12", "2025-02")
+
+        self.assertEqual(rows[0][:4], ["المشروع", "إجمالي الإيرادات - 12-2024", "إجمالي المصروفات - 12-2024",
+                                       "الصافي - 12-2024"])
+        self.assertEqual(rows[1], ["مشروع 1", 0, 0, 0, 300, 100, 200, 50, 0, 50])
+        self.assertEqual(rows[2], ["مشروع 2", 0, 0, 0, 0, 0, 0, 0, 0, 0])
 
-# Create your tests here.
+        __, long_queries = self.export("2023-01", "2025-12")
+        self.assertEqual((short_queries, long_queries), (2, 2))
@@ -8,6 +8,7 @@ from django.conf import settings
 from django.http import FileResponse
 from rest_framework import viewsets, status
 
+from association.exports import EXPORT_RENDERER_CLASSES, get_export_format, streaming_export
 from financials.models import TransactionType
 from .resources import fieldLabels
 from .serializers import ProjectSerializer, ProjectTransactionReadSerializer, ProjectTransactionWriteSerializer
@@ -15,7 +16,21 @@ from rest_framework.response import Response
 from rest_framework.decorators import action, api_view
 from .models import Project, ProjectTransaction
 from django.utils.translation import gettext_lazy as _
-from django.db.models import Sum, RestrictedError, When, Case, F, DecimalField, ExpressionWrapper
+from django.db.models import Sum, Count, Q, RestrictedError
+
+
+# field -> (values_list lookups, formatter) for the streaming export
+export_columns = {
+    "name": (("name",), None),
+    "start_date": (("start_date",), None),
+    "status": (("status",), None),
+    "created_at": (("created_at",),
+                   lambda created_at: created_at.astimezone(settings.CAIRO_TZ).strftime("%Y-%m-%d %I:%M%p")),
+    "created_by": (("created_by__name",), None),
+    "total_income": (("total_income",), None),
+    "total_expense": (("total_expense",), None),
+    "net_income": (("net_income",), None),
+}
 
 
 class ProjectViewSet(viewsets.ModelViewSet):
@@ -48,6 +63,9 @@ class ProjectViewSet(viewsets.ModelViewSet):
         if sort_by is not None:
             queryset = queryset.order_by(f"{order}{sort_by}")
 
+        if self.action in ["list", "retrieve", "export_totals"]:
+            queryset = queryset.with_totals()
+
         return queryset
 
     @action(detail=True, methods=['post'])
@@ -71,7 +89,7 @@ class ProjectViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
 
-    @action(detail=False, methods=['get'])
+    @action(detail=False, methods=['get'], renderer_classes=EXPORT_RENDERER_CLASSES)
     def export_totals(self, request):
         queryset = self.get_queryset()
         fields = request.query_params.get("fields", None)
@@ -81,43 +99,9 @@ class ProjectViewSet(viewsets.ModelViewSet):
 
         fields = fields.split(',')
 
-        # totals annotation
-        total_income = Sum(
-            Case(
-                When(
-                    transactions__financial_record__transaction_type__type="إيراد",
-                    then=F("transactions__financial_record__amount")
-                ),
-                output_field=DecimalField(),
-                default=Decimal("0"),
-            )
-        )
-        total_expense = Sum(
-            Case(
-                When(
-                    transactions__financial_record__transaction_type__type="مصروف",
-                    then=F("transactions__financial_record__amount")
-                ),
-                output_field=DecimalField(),
-                default=Decimal("0")
-            )
-        )
-
-        if "net_income" in fields:
-            queryset = queryset.annotate(total_income=total_income, total_expense=total_expense).annotate(
-                net_income=ExpressionWrapper(
-                    F("total_income") - F("total_expense"),
-                    output_field=DecimalField()
-                ))
-        else:
-            annotations = {}
-            if "total_income" in fields:
-                annotations["total_income"] = total_income
-            if "total_expense" in fields:
-                annotations["total_expense"] = total_expense
-            queryset = queryset.annotate(
-                **annotations
-            )
+        export_format = get_export_format(request)
+        if export_format is not None:
+            return streaming_export(queryset, fields, fieldLabels, export_columns, export_format, "المشاريع")
 
         wb = openpyxl.Workbook()
         ws = wb.active
@@ -181,35 +165,8 @@ class ProjectViewSet(viewsets.ModelViewSet):
             months.append(current)
             current += relativedelta(months=1)
 
-        # Define income and expense annotations for a given month
-        def month_annotations(selected_month):
-            next_month = selected_month + relativedelta(months=1)
-            return {
-                'total_income': Sum(
-                    Case(
-                        When(
-                            transactions__financial_record__transaction_type__type="إيراد",
-                            transactions__financial_record__date__gte=selected_month,
-                            transactions__financial_record__date__lt=next_month,
-                            then=F("transactions__financial_record__amount")
-                        ),
-                        default=Decimal("0"),
-                        output_field=DecimalField()
-                    )
-                ),
-                'total_expense': Sum(
-                    Case(
-                        When(
-                            transactions__financial_record__transaction_type__type="مصروف",
-                            transactions__financial_record__date__gte=selected_month,
-                            transactions__financial_record__date__lt=next_month,
-                            then=F("transactions__financial_record__amount")
-                        ),
-                        default=Decimal("0"),
-                        output_field=DecimalField()
-                    )
-                )
-            }
+        # every project and month in one grouped query, pivoted below
+        totals = queryset.monthly_totals(start.date(), end.date())
 
         wb = openpyxl.Workbook()
         ws = wb.active
@@ -233,10 +190,7 @@ class ProjectViewSet(viewsets.ModelViewSet):
 
             col_offset = 2
             for month in months:
-                ann = month_annotations(month)
-                totals = queryset.filter(pk=item.pk).aggregate(**ann)
-                income = totals["total_income"] or Decimal("0")
-                expense = totals["total_expense"] or Decimal("0")
+                income, expense = totals.get((item.pk, month.date()), (Decimal("0"), Decimal("0")))
                 net_income = income - expense
 
                 for f in fields:
@@ -268,7 +222,7 @@ class ProjectTransactionViewSet(viewsets.ModelViewSet):
     pagination_class = None
 
     def get_queryset(self):
-        qs = super().get_queryset()
+        qs = super().get_queryset().select_related("financial_record")
 
         project_id = self.request.query_params.get("project")
         if project_id:
@@ -325,17 +279,13 @@ class ProjectTransactionViewSet(viewsets.ModelViewSet):
 @api_view(['GET'])
 def get_projects_stats(request):
     projects = Project.objects.all()
-    total_projects = projects.count()
-    in_progress = projects.filter(status=Project.Status.IN_PROGRESS).count()
-    completed = projects.filter(status=Project.Status.COMPLETED).count()
-    total_incomes = sum(project.total_incomes for project in projects)
-    total_expenses = sum(project.total_expenses for project in projects)
-    net = total_incomes - total_expenses
-
-    return Response({"total_projects": total_projects,
-                     "in_progress": in_progress,
-                     "completed": completed,
-                     "total_incomes": total_incomes,
-                     "total_expenses": total_expenses,
-                     "net": net
+    counts = projects.aggregate(total_projects=Count("id"),
+                                in_progress=Count("id", filter=Q(status=Project.Status.IN_PROGRESS)),
+                                completed=Count("id", filter=Q(status=Project.Status.COMPLETED)))
+    totals = projects.totals()
+
+    return Response({**counts,
+                     "total_incomes": totals["total_income"],
+                     "total_expenses": totals["total_expense"],
+                     "net": totals["total_income"] - totals["total_expense"]
                      }, status=status.HTTP_200_OK)
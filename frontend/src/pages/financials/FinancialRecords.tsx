@@ -5,7 +5,7 @@ import dayjs, { Dayjs } from "dayjs";
 import { Link, Outlet, useMatch, useNavigate } from "react-router";
 import {
   expensePaymentMethods,
-  FinancialRecord,
+  FinancialRecordListItem,
   incomePaymentMethods,
   paymentMethodColors,
 } from "@/types/financial_record";
@@ -20,7 +20,6 @@ import { useGetTransactionTypesQuery } from "@/app/api/endpoints/transaction_typ
 import { SortOrder } from "antd/lib/table/interface";
 import { usePermission } from "@/providers/PermissionProvider";
 import { useGetBankAccountsQuery } from "@/app/api/endpoints/bank_accounts";
-import { BankAccount } from "@/types/bank_account";
 import ExportFinancials from "@/components/financials/ExportFinancials";
 
 type Props = {
@@ -71,9 +70,9 @@ const FinancialRecords: React.FC<Props> = ({ financialType }) => {
     getRecords,
     { data: financialRecords, isLoading, isFetching, isError },
   ] = useLazyGetFinancialRecordsQuery();
-  const records = financialRecords as PaginatedResponse<FinancialRecord>;
+  const records = financialRecords as PaginatedResponse<FinancialRecordListItem>;
 
-  const columns: ColumnsType<FinancialRecord> = [
+  const columns: ColumnsType<FinancialRecordListItem> = [
     {
       title: "#",
       key: "index",
@@ -92,7 +91,7 @@ const FinancialRecords: React.FC<Props> = ({ financialType }) => {
       key: "transaction_type",
       render: (text, record) => (
         <span>
-          {record.transaction_type.name}{" "}
+          {record.transaction_type_name}{" "}
           {record.project && `(${record.project.name})`}
         </span>
       ),
@@ -125,9 +124,9 @@ const FinancialRecords: React.FC<Props> = ({ financialType }) => {
     },
     {
       title: "البنك",
-      dataIndex: "bank_account",
+      dataIndex: "bank_account_name",
       key: "bank_account",
-      render: (text: BankAccount) => (text ? text.name : "-"),
+      render: (name?: string | null) => name || "-",
       filters: accounts?.map((bank) => ({
         text: bank.name,
         value: bank.name,
@@ -158,6 +157,7 @@ const FinancialRecords: React.FC<Props> = ({ financialType }) => {
     if (isFinancials) {
       getRecords({
         no_pagination: false,
+        serializer: "flat",
         type: TransactionKindArabic[financialType],
         page,
         page_size: pageSize,
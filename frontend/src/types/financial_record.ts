@@ -51,3 +51,21 @@ export type FinancialRecord = {
 
   project?: { name: string; id: string };
 };
+
+// row of the records list requested with `serializer: "flat"`
+export type FinancialRecordListItem = {
+  id: string;
+  amount: number;
+  date: string;
+  payment_method: PaymentMethod;
+  receipt_number?: string | null;
+  notes?: string | null;
+  transaction_type: number;
+  transaction_type_name: string;
+  transaction_type_type: string;
+  bank_account?: number | null;
+  bank_account_name?: string | null;
+  project?: { name: string; id: string } | null;
+  created_at: string;
+  created_by?: string | null;
+};